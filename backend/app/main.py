@@ -1,14 +1,44 @@
-from fastapi import FastAPI, HTTPException
+import asyncio
+from fastapi import FastAPI, HTTPException, Request, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+import json
 import os
+import time
 from dotenv import load_dotenv
-from app.models import CodeRequest, CodeResponse, ExecutionRequest, ExecutionResponse
-from app.services.openai_service import huggingface_service as openai_service
+from app.models import (
+    CodeRequest, CodeResponse, ExecutionRequest, ExecutionResponse,
+    BatchExecutionRequest, BatchExecutionResponse, BatchCaseResult,
+    JobResponse, JobStatusResponse,
+)
+from app.services import metrics
+from app.services.admission import Overloaded
+from app.services.artifact_cache import artifact_cache
+from app.services.openai_service import GenerationError, clean_code, huggingface_service as openai_service
 from app.services.code_executor import code_executor
+from app.services.execution_engine import execution_engine
+from app.services.grader import compare_output
+from app.services.interactive_sessions import interactive_sessions
+from app.services.job_queue import DONE, FAILED, job_queue
+from app.services.languages import language_registry
+from app.services.precompiler import speculative_compiler
+from app.services.shared_state import shared_path
+from app.services.single_flight import compile_flights, execute_flights, generate_flights, speculative_flights
+from app.services.syntax_check import syntax_checker
+from app.services.workspaces import workspace_pool
+from app.worker import JobWorker
 
 
 load_dotenv()
 
+BATCH_MAX_CASES = int(os.getenv("BATCH_MAX_CASES", "100"))
+# Jobs the API process runs itself; 0 leaves /api/jobs to `python -m app.worker`
+JOB_WORKERS_IN_API = int(os.getenv("JOB_WORKERS_IN_API", "0"))
+# With SHARED_STATE_DIR (python -m app.server), every process publishes its
+# metrics there this often and /metrics serves the sum over all of them
+METRICS_DIR = shared_path("metrics")
+METRICS_PUBLISH_SECONDS = float(os.getenv("METRICS_PUBLISH_SECONDS", "5"))
+
 
 app = FastAPI(
     title="REGEN API",
@@ -26,13 +56,57 @@ app.add_middleware(
 )
 
 
+@app.exception_handler(Overloaded)
+async def overloaded(request: Request, e: Overloaded):
+    """Over capacity: fail fast and tell the client when to come back"""
+    return JSONResponse(status_code=429, content={"detail": str(e)}, headers={"Retry-After": str(e.retry_after)})
+
+
+def client_id(http_request: Request):
+    """Who a request is queued fairly as: the peer address (uvicorn resolves
+    X-Forwarded-For from trusted proxies)"""
+    return http_request.client.host if http_request.client else "anonymous"
+
+
+@app.on_event("startup")
+async def startup():
+    await code_executor.warm_up()
+    if JOB_WORKERS_IN_API:
+        app.state.job_worker = JobWorker(concurrency=JOB_WORKERS_IN_API)
+        app.state.job_worker_task = asyncio.ensure_future(app.state.job_worker.run())
+    if METRICS_DIR:
+        app.state.metrics_task = asyncio.ensure_future(
+            metrics.registry.publish_forever(METRICS_DIR, METRICS_PUBLISH_SECONDS))
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    if METRICS_DIR:
+        # Retires this worker's metrics (see Registry.retire)
+        app.state.metrics_task.cancel()
+        await asyncio.gather(app.state.metrics_task, return_exceptions=True)
+    if JOB_WORKERS_IN_API:
+        app.state.job_worker.stop()
+        await app.state.job_worker_task
+    await openai_service.close()
+
+
 @app.get("/")
 async def root():
     return {
         "message": "REGEN API is running",
         "endpoints": {
             "generate": "/api/generate",
+            "generate_stream": "/api/generate/stream",
+            "generate_cache": "/api/generate/cache",
+            "stats": "/api/stats",
+            "metrics": "/metrics",
+            "languages": "/api/languages",
             "execute": "/api/execute",
+            "execute_batch": "/api/execute/batch",
+            "execute_stream": "/api/execute/stream",
+            "jobs": "/api/jobs",
+            "execute_interactive": "/ws/execute",
             "docs": "/docs"
         }
     }
@@ -40,58 +114,269 @@ async def root():
 
 @app.post("/api/generate", response_model=CodeResponse)
 async def generate_code(request: CodeRequest):
-    """Generate code using AI"""
+    """Generate code using AI; compiled-language code starts compiling in the background"""
     try:
-        generated_code = openai_service.generate_code(
+        generated_code, error = await openai_service.generate(
             prompt=request.prompt,
             existing_code=request.code,
             language=request.language
         )
-        return CodeResponse(content=generated_code, language=request.language)
+        if error is None:
+            speculative_compiler.schedule(request.language, generated_code)
+        # Errors are returned as the content, like before
+        return CodeResponse(content=error or generated_code, language=request.language)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/api/generate/stream")
+async def generate_code_stream(request: CodeRequest):
+    """Generate code, streaming tokens as Server-Sent Events.
+
+    Events: `token` with {"data": text} as the model produces it (edit
+    blocks when code is given), then one `done` with {"content": str | null,
+    "error": str | null}; content is the final code.
+    """
+    async def events():
+        chunks = []
+        try:
+            async for chunk in openai_service.stream_code(request.prompt, request.code, request.language):
+                chunks.append(chunk)
+                yield f"event: token\ndata: {json.dumps({'data': chunk})}\n\n"
+            done = {"content": clean_code("".join(chunks), request.code, request.language), "error": None}
+            speculative_compiler.schedule(request.language, done["content"])
+        except GenerationError as e:
+            done = {"content": None, "error": str(e)}
+        yield f"event: done\ndata: {json.dumps(done)}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/api/generate/cache")
+async def generate_cache_stats():
+    """Hit/miss counters of the generated code cache"""
+    return openai_service.cache.stats
+
+
+@app.get("/api/stats")
+async def stats():
+    """Cache, request coalescing and workspace pool counters"""
+    return {
+        "generate_cache": openai_service.cache.stats,
+        "single_flight": {
+            flights.name: flights.stats
+            for flights in (execute_flights, generate_flights, compile_flights, speculative_flights)
+        },
+        "speculative_compiles": speculative_compiler.stats,
+        "syntax_check": syntax_checker.stats,
+        "artifact_cache": artifact_cache.stats,
+        "workspaces": workspace_pool.stats,
+        "interactive_sessions": {**interactive_sessions.stats, "active": interactive_sessions.active},
+    }
+
+
+@metrics.registry.collector
+def collect_cache_metrics():
+    generate = openai_service.cache.stats
+    for cache, hits, misses in (
+        ("generate", generate["memory_hits"] + generate["disk_hits"], generate["misses"]),
+        ("artifact", artifact_cache.stats["hits"], artifact_cache.stats["misses"]),
+        ("execute_single_flight", execute_flights.stats["collapsed"], execute_flights.stats["started"]),
+        ("generate_single_flight", generate_flights.stats["collapsed"], generate_flights.stats["started"]),
+        ("compile_single_flight", compile_flights.stats["collapsed"], compile_flights.stats["started"]),
+    ):
+        metrics.cache_lookups.set(cache, "hit", value=hits)
+        metrics.cache_lookups.set(cache, "miss", value=misses)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Latency histograms, queue depth and cache counters for Prometheus"""
+    snapshots = metrics.registry.read_snapshots(METRICS_DIR) if METRICS_DIR else ()
+    return PlainTextResponse(metrics.registry.render(snapshots), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/api/languages")
+async def languages():
+    """Supported languages with the toolchain versions found at startup"""
+    return await language_registry.describe()
+
+
+async def resolve_language(name, profile=None, check_available=True):
+    """Canonical language id; rejects unknown languages, unknown compile
+    profiles and (with check_available) missing toolchains"""
+    spec = language_registry.resolve(name)
+    if spec is None:
+        print(f"ERROR: Language '{name}' not matched in any condition!")
+        raise HTTPException(status_code=400, detail=f"Execution not supported for {name}")
+    if profile:
+        try:
+            spec.compile_flags(profile)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    if check_available and not await language_registry.available(spec.name):
+        raise HTTPException(status_code=503, detail=spec.missing_message)
+    return spec.name
+
+
 @app.post("/api/execute", response_model=ExecutionResponse)
-async def execute_code(request: ExecutionRequest):
-    """Execute code with pre-provided inputs"""
+async def execute_code(request: ExecutionRequest, http_request: Request):
+    """Execute code with pre-provided inputs; 429 with Retry-After when over capacity"""
+    lang = await resolve_language(request.language, request.profile)
+
+    async def run():
+        async with execution_engine.slot(lang, client_id(http_request)):
+            return await code_executor.execute(lang, request.code, request.user_inputs or "", request.profile)
+
+    started = time.perf_counter()
+    outcome = 'failed'
     try:
-        lang = request.language.lower()
-        print(f"DEBUG: Received language: '{request.language}' -> normalized: '{lang}'")
-        
-        if lang == "python":
-            output, error = code_executor.execute_python(request.code, request.user_inputs or "")
-        elif lang in ["javascript", "js"]:
-            output, error = code_executor.execute_javascript(request.code, request.user_inputs or "")
-        elif lang == "java":
-            output, error = code_executor.execute_java(request.code, request.user_inputs or "")
-        elif lang in ["cpp", "c++"]:
-            output, error = code_executor.execute_cpp(request.code, request.user_inputs or "")
-        elif lang == "c":
-            output, error = code_executor.execute_c(request.code, request.user_inputs or "")
-        elif lang in ["csharp", "cs", "c#"]:
-            output, error = code_executor.execute_csharp(request.code, request.user_inputs or "")
-        elif lang == "go":
-            output, error = code_executor.execute_go(request.code, request.user_inputs or "")
-        elif lang == "rust":
-            output, error = code_executor.execute_rust(request.code, request.user_inputs or "")
-        elif lang == "typescript":
-            output, error = code_executor.execute_typescript(request.code, request.user_inputs or "")
-        elif lang == "php":
-            output, error = code_executor.execute_php(request.code, request.user_inputs or "")
-        elif lang == "ruby":
-            output, error = code_executor.execute_ruby(request.code, request.user_inputs or "")
-        elif lang == "swift":
-            output, error = code_executor.execute_swift(request.code, request.user_inputs or "")
-        elif lang == "kotlin":
-            output, error = code_executor.execute_kotlin(request.code, request.user_inputs or "")
-        else:
-            print(f"ERROR: Language '{lang}' not matched in any condition!")
-            raise HTTPException(status_code=400, detail=f"Execution not supported for {request.language}")
-        
-        return ExecutionResponse(output=output, error=error)
+        # Identical submissions (e.g. a whole class running a template) share one run
+        key = (lang, request.profile, request.code, request.user_inputs or "")
+        output, error, truncated, usage = await execute_flights.do(key, run)
+        outcome = 'error' if error else 'ok'
+        return ExecutionResponse(
+            output=output, error=error, truncated=truncated, **(usage.fields() if usage else {})
+        )
+    except Overloaded:
+        outcome = 'rejected'
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        metrics.request_seconds.observe("execute", lang, outcome, value=time.perf_counter() - started)
+
+
+@app.post("/api/execute/stream")
+async def execute_stream(request: ExecutionRequest, http_request: Request):
+    """Execute code, streaming stdout/stderr as Server-Sent Events.
+
+    Events: `stdout` / `stderr` with {"data": text} while the program runs,
+    then one `exit` with {"exit_code": int | null, "error": str | null} plus
+    the resource usage fields of ExecutionResponse where measured. 429 with
+    Retry-After when over capacity.
+    """
+    lang = await resolve_language(request.language, request.profile)
+    client = client_id(http_request)
+    # Rejects before the stream starts; the queue may still fill up meanwhile
+    execution_engine.scheduler.check(client)
+
+    async def events():
+        started = time.perf_counter()
+        # Until the exit event; a client that goes away leaves it 'cancelled'
+        outcome = 'cancelled'
+        try:
+            # Chunks are pulled only as fast as the client reads them
+            async with execution_engine.slot(lang, client):
+                async for name, data in code_executor.execute_stream(
+                    lang, request.code, request.user_inputs or "", request.profile
+                ):
+                    if name == "exit":
+                        outcome = 'error' if data.get('error') or data.get('exit_code') != 0 else 'ok'
+                    payload = data if name == "exit" else {"data": data}
+                    yield f"event: {name}\ndata: {json.dumps(payload)}\n\n"
+        except Overloaded as e:
+            outcome = 'rejected'
+            payload = {'exit_code': None, 'error': str(e), 'retry_after': e.retry_after}
+            yield f"event: exit\ndata: {json.dumps(payload)}\n\n"
+        finally:
+            metrics.request_seconds.observe("execute_stream", lang, outcome, value=time.perf_counter() - started)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.websocket("/ws/execute")
+async def execute_interactive(websocket: WebSocket):
+    """Interactive session: stdin is sent as the program asks for it (protocol in interactive_sessions)"""
+    await interactive_sessions.serve(websocket)
+
+
+@app.post("/api/execute/batch", response_model=BatchExecutionResponse)
+async def execute_batch(request: BatchExecutionRequest, http_request: Request):
+    """Compile once and run the program against many stdin test cases"""
+    lang = await resolve_language(request.language, request.profile)
+    if len(request.cases) > BATCH_MAX_CASES:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_CASES} cases per batch")
+
+    # Cases take execution slots one by one, next to other requests
+    started = time.perf_counter()
+    case_results, error = await code_executor.execute_batch(
+        lang, request.code, [case.input for case in request.cases], request.profile, client_id(http_request)
+    )
+    metrics.request_seconds.observe(
+        "execute_batch", lang, "error" if error else "ok", value=time.perf_counter() - started
+    )
+    if error:
+        return BatchExecutionResponse(results=[], error=error, total=len(request.cases))
+
+    results = []
+    for case, case_result in zip(request.cases, case_results):
+        # Truncated stdout is graded by the digest of the whole of it
+        digest = case_result.pop('stdout_digest', None)
+        result = BatchCaseResult(**case_result)
+        if case.expected_output is not None:
+            result.passed, result.diff = compare_output(case.expected_output, result.stdout, actual_digest=digest)
+            if result.timed_out or result.exit_code != 0:
+                result.passed = False
+        results.append(result)
+
+    return BatchExecutionResponse(
+        results=results,
+        passed=sum(1 for r in results if r.passed),
+        failed=sum(1 for r in results if r.passed is False),
+        total=len(results),
+    )
+
+
+@app.post("/api/jobs", response_model=JobResponse, status_code=202)
+async def submit_job(request: ExecutionRequest):
+    """Queue an execution for a worker; poll /api/jobs/{job_id} for the result"""
+    # Workers may run elsewhere, with toolchains this process does not have
+    lang = await resolve_language(request.language, request.profile, check_available=False)
+    job_id = await job_queue.submit("execute", {**request.model_dump(), "language": lang})
+    return JobResponse(job_id=job_id, status="queued")
+
+
+async def find_job(job_id):
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job")
+    return job
+
+
+@app.get("/api/jobs/{job_id}", response_model=JobStatusResponse)
+async def job_status(job_id: str):
+    """Status of a queued execution, with its result once done"""
+    job = await find_job(job_id)
+    return JobStatusResponse(
+        job_id=job_id,
+        status=job["status"],
+        attempts=job["attempts"],
+        created=job["created"],
+        started=job["started"],
+        finished=job["finished"],
+        error=job["error"] if job["status"] == FAILED else None,
+        result=job["result"],
+    )
+
+
+@app.get("/api/jobs/{job_id}/result", response_model=ExecutionResponse)
+async def job_result(job_id: str):
+    """The ExecutionResponse of a finished job; 409 while it is queued or running"""
+    job = await find_job(job_id)
+    if job["status"] == DONE:
+        return ExecutionResponse(**job["result"])
+    if job["status"] == FAILED:
+        raise HTTPException(status_code=500, detail=job["error"])
+    raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
 
 
 if __name__ == "__main__":
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 
 class CodeRequest(BaseModel):
     prompt: str
@@ -14,7 +14,61 @@ class ExecutionRequest(BaseModel):
     code: str
     language: str
     user_inputs: Optional[str] = ""
+    # Compile profile for C/C++: "fast" (default, -O0) or "optimized" (-O2)
+    profile: Optional[str] = None
 
 class ExecutionResponse(BaseModel):
     output: str
     error: Optional[str] = None
+    truncated: bool = False
+    # Measured for the run; cpu_time and peak_rss_kb are null for pooled runtimes (JVM, Node)
+    # and peak_rss_kb also for programs that exit within a few milliseconds
+    wall_time: Optional[float] = None
+    cpu_time: Optional[float] = None
+    peak_rss_kb: Optional[int] = None
+    # Limit that ended the program: wall_time, cpu_time, memory, file_size or output
+    limit_exceeded: Optional[str] = None
+
+class JobResponse(BaseModel):
+    job_id: str
+    # queued, running, done or failed
+    status: str
+
+class JobStatusResponse(JobResponse):
+    attempts: int = 0
+    created: float
+    started: Optional[float] = None
+    finished: Optional[float] = None
+    # Why the job failed (not the program's own error, which is in result)
+    error: Optional[str] = None
+    result: Optional[ExecutionResponse] = None
+
+class BatchCase(BaseModel):
+    input: str = ""
+    expected_output: Optional[str] = None
+
+class BatchExecutionRequest(BaseModel):
+    code: str
+    language: str
+    cases: List[BatchCase]
+    profile: Optional[str] = None
+
+class BatchCaseResult(BaseModel):
+    stdout: str
+    stderr: str
+    exit_code: Optional[int] = None
+    time: float
+    cpu_time: Optional[float] = None
+    peak_rss_kb: Optional[int] = None
+    limit_exceeded: Optional[str] = None
+    timed_out: bool = False
+    truncated: bool = False
+    passed: Optional[bool] = None
+    diff: Optional[str] = None
+
+class BatchExecutionResponse(BaseModel):
+    results: List[BatchCaseResult]
+    error: Optional[str] = None
+    passed: int = 0
+    failed: int = 0
+    total: int = 0
@@ -0,0 +1,171 @@
+"""
+Multi-process API server:
+
+    python -m app.server --host 0.0.0.0 --port 8000
+
+Binds the socket once and runs WEB_CONCURRENCY uvicorn workers on it (by
+default one per CPU this process may use). Execution slots and metrics are
+shared by all of them through SHARED_STATE_DIR; the generation and artifact
+caches are already shared on disk. A worker that dies is replaced. SIGHUP
+starts a fresh set of workers (new code and .env) and then gracefully stops
+the old set, so a reload drops no requests. SIGTERM or SIGINT stops the
+server once in-flight requests finish.
+"""
+import argparse
+import math
+import multiprocessing
+import os
+import shutil
+import signal
+import tempfile
+import threading
+import uvicorn
+from dotenv import dotenv_values, load_dotenv
+from app.services import metrics
+
+# Set by the real environment, which wins over .env (at startup and on reload)
+_ENVIRONMENT = set(os.environ)
+load_dotenv()
+# Set from .env
+_from_dotenv = set(os.environ) - _ENVIRONMENT
+
+# Seconds a stopping worker gets to finish its in-flight requests
+SERVER_GRACEFUL_TIMEOUT = int(os.getenv("SERVER_GRACEFUL_TIMEOUT", "30"))
+# Seconds new workers get to start up before a reload stops the old ones
+SERVER_RELOAD_GRACE_SECONDS = float(os.getenv("SERVER_RELOAD_GRACE_SECONDS", "5"))
+# Replace a worker after this many requests (0: never), to bound leaks
+SERVER_MAX_REQUESTS = int(os.getenv("SERVER_MAX_REQUESTS", "0"))
+
+
+def reload_dotenv():
+    """Apply the current .env to this process's environment, which new
+    workers inherit: changed values are updated and removed ones unset"""
+    values = {
+        key: value for key, value in dotenv_values().items() if value is not None and key not in _ENVIRONMENT
+    }
+    for key in _from_dotenv - set(values):
+        os.environ.pop(key, None)
+    os.environ.update(values)
+    _from_dotenv.clear()
+    _from_dotenv.update(values)
+
+
+def _serve(config, sockets):
+    """Entry point of a worker process"""
+    config.configure_logging()
+    uvicorn.Server(config).run(sockets=sockets)
+
+
+def available_cpus():
+    """CPUs this process may use: its affinity mask, capped by a cgroup v2 quota"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    try:
+        with open('/sys/fs/cgroup/cpu.max') as f:
+            quota, period = f.read().split()
+        if quota != 'max':
+            cpus = min(cpus, max(1, math.ceil(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return cpus
+
+
+class Supervisor:
+    def __init__(self, config, workers):
+        self.config = config
+        self.workers = workers
+        self.socket = config.bind_socket()
+        self.processes = []
+        self._stopping = threading.Event()
+        self._reload = threading.Event()
+        # Fresh interpreters: a reload must import the new code
+        self._context = multiprocessing.get_context("spawn")
+
+    def _spawn(self):
+        process = self._context.Process(target=_serve, args=(self.config, [self.socket]))
+        process.start()
+        return process
+
+    def _exited(self, process):
+        """Keep the metrics of a worker that is gone, before its pid can be reused"""
+        directory = os.path.join(os.environ["SHARED_STATE_DIR"], "metrics")
+        if os.path.isdir(directory):
+            try:
+                metrics.registry.retire(directory, process.pid)
+            except OSError as e:
+                print(f"WARNING: Could not retire metrics of worker {process.pid}: {e}")
+
+    def _stop(self, processes):
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        for process in processes:
+            process.join(SERVER_GRACEFUL_TIMEOUT + 5)
+            if process.is_alive():
+                print(f"WARNING: Worker {process.pid} did not stop; killing it")
+                process.kill()
+                process.join()
+            self._exited(process)
+
+    def reload(self):
+        """Start a new set of workers, then gracefully stop the old set"""
+        reload_dotenv()
+        old = self.processes
+        self.processes = [self._spawn() for _ in range(self.workers)]
+        print(f"DEBUG: Reloading: started workers {[p.pid for p in self.processes]}")
+        # Both sets accept on the socket until the old one is told to stop
+        self._stopping.wait(SERVER_RELOAD_GRACE_SECONDS)
+        self._stop(old)
+
+    def run(self):
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(sig, lambda *_: self._stopping.set())
+        signal.signal(signal.SIGHUP, lambda *_: self._reload.set())
+        self.processes = [self._spawn() for _ in range(self.workers)]
+        print(f"DEBUG: Serving on {self.config.host}:{self.config.port} with {self.workers} workers")
+        try:
+            while not self._stopping.wait(0.5):
+                if self._reload.is_set():
+                    self._reload.clear()
+                    self.reload()
+                    continue
+                for i, process in enumerate(self.processes):
+                    if not process.is_alive():
+                        print(f"WARNING: Worker {process.pid} exited with {process.exitcode}; replacing it")
+                        process.join()
+                        self._exited(process)
+                        self.processes[i] = self._spawn()
+        finally:
+            self._stop(self.processes)
+            self.socket.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the API on several worker processes")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", "0")) or available_cpus())
+    args = parser.parse_args()
+
+    # Workers are spawned, so they pick this up from the environment
+    owned_state_dir = None
+    if not os.getenv("SHARED_STATE_DIR"):
+        owned_state_dir = tempfile.mkdtemp(prefix='regen-state-')
+        os.environ["SHARED_STATE_DIR"] = owned_state_dir
+
+    config = uvicorn.Config(
+        "app.main:app", host=args.host, port=args.port, workers=args.workers,
+        timeout_graceful_shutdown=SERVER_GRACEFUL_TIMEOUT,
+        limit_max_requests=SERVER_MAX_REQUESTS or None,
+    )
+    try:
+        Supervisor(config, args.workers).run()
+    finally:
+        if owned_state_dir:
+            shutil.rmtree(owned_state_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+Admission control for executions: weighted fair queuing across clients,
+bounded queues and early rejection when the wait would be too long
+"""
+import asyncio
+import itertools
+import math
+import os
+from app.services import metrics
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+# Share of the slots each priority gets when both are waiting
+PRIORITY_WEIGHTS = {INTERACTIVE: 4, BATCH: 1}
+
+
+class Overloaded(Exception):
+    """No slot can be had in time; retry_after is a hint in whole seconds"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    __slots__ = ("language", "client", "tag", "seq", "future")
+
+    def __init__(self, language, client, tag, seq, future):
+        self.language = language
+        self.client = client
+        self.tag = tag
+        self.seq = seq
+        self.future = future
+
+
+class FairScheduler:
+    """Hands out capacity slots, at most per_language to one language.
+
+    Waiters are served in start-time fair queuing order: a client's next
+    request starts, in virtual time, where its previous one finished, and
+    each takes 1/weight of it. A client that floods the queue only pushes
+    its own requests back, and interactive work (weight 4) gets four times
+    the slots of batch work when both wait. A slot freed for a language that
+    is full goes to the next waiter that can use it.
+
+    With admit, an acquire that cannot run at once is rejected (Overloaded)
+    when the queue holds max_queue waiters, when its client already has
+    max_per_client waiting, or when the expected wait, from the recent slot
+    hold time, exceeds queue_timeout; it also gives up after queue_timeout.
+    Without admit (work already accepted: job queue, batch cases) it waits.
+    """
+
+    def __init__(self, capacity, per_language, max_queue=None, max_per_client=None, queue_timeout=None):
+        self.capacity = capacity
+        self.per_language = per_language
+        self.max_queue = max_queue or int(os.getenv("EXECUTION_QUEUE_DEPTH", str(4 * capacity)))
+        self.max_per_client = max_per_client or int(os.getenv("EXECUTION_QUEUE_PER_CLIENT", "16"))
+        self.queue_timeout = queue_timeout or float(os.getenv("EXECUTION_QUEUE_TIMEOUT", "10"))
+        self.running = 0
+        self._running = {}
+        self._waiters = []
+        # client -> virtual finish time of its last request
+        self._finish = {}
+        self._vtime = 0.0
+        self._seq = itertools.count()
+        # Moving average of how long a slot is held
+        self.service_seconds = 0.5
+        self.stats = {"admitted": 0, "queue_full": 0, "client_limit": 0, "deadline": 0, "timeout": 0}
+
+    @property
+    def waiting(self):
+        return len(self._waiters)
+
+    async def acquire(self, language, client, priority=INTERACTIVE, admit=True):
+        """Wait for a slot; raises Overloaded (see the class docstring)"""
+        previous = self._finish.get(client, 0.0)
+        start = max(self._vtime, previous)
+        self._finish[client] = start + 1 / PRIORITY_WEIGHTS[priority]
+        waiter = _Waiter(language, client, start, next(self._seq), asyncio.get_running_loop().create_future())
+        self._waiters.append(waiter)
+        self._dispatch()
+        if waiter.future.done():
+            self.stats["admitted"] += 1
+            return
+        if admit:
+            try:
+                self._admit(waiter)
+            except Overloaded:
+                self._waiters.remove(waiter)
+                self._finish[client] = previous
+                raise
+        self.stats["admitted"] += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), self.queue_timeout if admit else None)
+        except asyncio.TimeoutError:
+            if waiter.future.done():
+                return
+            self._waiters.remove(waiter)
+            self._reject("timeout", f"No execution slot within {self.queue_timeout:g} seconds; try again later")
+        except asyncio.CancelledError:
+            if waiter.future.done():
+                self.release(language)
+            else:
+                self._waiters.remove(waiter)
+            raise
+
+    def check(self, client, priority=INTERACTIVE):
+        """Raise Overloaded if acquire(admit=True) would reject client now"""
+        start = max(self._vtime, self._finish.get(client, 0.0))
+        if self.running < self.capacity and not self._waiters:
+            return
+        self._admit(_Waiter(None, client, start, math.inf, None), queued=False)
+
+    def release(self, language, held_seconds=None):
+        self.running -= 1
+        self._running[language] -= 1
+        if held_seconds is not None:
+            self.service_seconds += 0.2 * (held_seconds - self.service_seconds)
+        self._dispatch()
+
+    def _dispatch(self):
+        while self.running < self.capacity and self._waiters:
+            eligible = [w for w in self._waiters if self._running.get(w.language, 0) < self.per_language]
+            if not eligible:
+                return
+            waiter = min(eligible, key=lambda w: (w.tag, w.seq))
+            self._waiters.remove(waiter)
+            self.running += 1
+            self._running[waiter.language] = self._running.get(waiter.language, 0) + 1
+            self._vtime = max(self._vtime, waiter.tag)
+            waiter.future.set_result(None)
+        if len(self._finish) > 4096:
+            # Clients that have caught up with virtual time start afresh anyway
+            self._finish = {client: tag for client, tag in self._finish.items() if tag > self._vtime}
+
+    def _admit(self, waiter, queued=True):
+        others = len(self._waiters) - (1 if queued else 0)
+        if others >= self.max_queue:
+            self._reject("queue_full", "Execution queue is full; try again later", others)
+        mine = sum(1 for w in self._waiters if w.client == waiter.client) - (1 if queued else 0)
+        if mine >= self.max_per_client:
+            self._reject("client_limit", f"Too many executions waiting for {waiter.client}; try again later", others)
+        ahead = sum(1 for w in self._waiters if (w.tag, w.seq) < (waiter.tag, waiter.seq))
+        if self._expected_wait(ahead) > self.queue_timeout:
+            self._reject("deadline", "Execution queue is too long to start in time; try again later", ahead)
+
+    def _expected_wait(self, ahead):
+        return (ahead // self.capacity + 1) * self.service_seconds
+
+    def _reject(self, reason, message, ahead=None):
+        self.stats[reason] += 1
+        metrics.admission_rejected.inc(reason)
+        wait = self._expected_wait(self.waiting if ahead is None else ahead)
+        raise Overloaded(message, max(1, math.ceil(wait)))
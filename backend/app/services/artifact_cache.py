@@ -0,0 +1,138 @@
+"""
+Disk-backed, content-addressed cache for compiled program artifacts
+"""
+import asyncio
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+from collections import OrderedDict
+
+
+class ArtifactCache:
+    def __init__(self, root=None, max_bytes=None, max_age=None):
+        self.root = root or os.getenv(
+            "ARTIFACT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "regen-artifacts")
+        )
+        self.max_bytes = max_bytes or int(os.getenv("ARTIFACT_CACHE_MAX_MB", "512")) * 1024 * 1024
+        self.max_age = max_age or int(os.getenv("ARTIFACT_CACHE_MAX_AGE_HOURS", "24")) * 3600
+        # Puts between eviction passes; each pass walks the whole cache
+        self.evict_every = int(os.getenv("ARTIFACT_CACHE_EVICT_EVERY", "20"))
+        self._puts = 0
+        self._evicting = None
+        # Recent compile errors by key, so resubmitted broken code fails without a compile
+        self.max_errors = int(os.getenv("COMPILE_ERROR_CACHE_SIZE", "256"))
+        self._errors = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "error_hits": 0}
+        os.makedirs(self.root, exist_ok=True)
+
+    def key(self, language, toolchain_version, flags, source):
+        """Hash everything that can change the compiled output"""
+        digest = hashlib.sha256()
+        for part in (language, toolchain_version, "\0".join(flags), source):
+            digest.update(part.encode('utf-8'))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def get(self, key):
+        """Return the artifact directory for key, or None on a miss"""
+        path = os.path.join(self.root, key)
+        try:
+            if time.time() - os.stat(path).st_mtime > self.max_age:
+                shutil.rmtree(path, ignore_errors=True)
+                self.stats["misses"] += 1
+                return None
+            # mtime doubles as the LRU timestamp
+            os.utime(path)
+        except FileNotFoundError:
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        return path
+
+    def get_error(self, key):
+        """The compile error recorded for key, or None"""
+        error = self._errors.get(key)
+        if error is not None:
+            self._errors.move_to_end(key)
+            self.stats["error_hits"] += 1
+        return error
+
+    def put_error(self, key, error):
+        self._errors[key] = error
+        self._errors.move_to_end(key)
+        while len(self._errors) > self.max_errors:
+            self._errors.popitem(last=False)
+
+    def staging_dir(self):
+        """Create a build directory on the cache filesystem so put() can rename it"""
+        return tempfile.mkdtemp(prefix=".build-", dir=self.root)
+
+    def put(self, key, build_dir):
+        """Move a finished build directory into the cache and return its path"""
+        path = os.path.join(self.root, key)
+        try:
+            os.rename(build_dir, path)
+        except OSError:
+            # Another request compiled the same source first; keep its artifact
+            shutil.rmtree(build_dir, ignore_errors=True)
+            if not os.path.isdir(path):
+                raise
+        self._puts += 1
+        if self._puts % self.evict_every == 0:
+            self._schedule_evict()
+        return path
+
+    def _schedule_evict(self):
+        """Run evict() in a worker thread, at most one pass at a time"""
+        if self._evicting is not None and not self._evicting.done():
+            return
+        try:
+            self._evicting = asyncio.get_running_loop().run_in_executor(None, self.evict)
+        except RuntimeError:
+            # No event loop (scripts, tests): evict inline
+            self.evict()
+
+    def evict(self):
+        """Drop expired entries, then least recently used ones until under max_bytes"""
+        now = time.time()
+        entries = []
+        total = 0
+        for entry in os.scandir(self.root):
+            try:
+                mtime = entry.stat().st_mtime
+            except FileNotFoundError:
+                continue
+            if entry.name.startswith("."):
+                # Leftover staging directories from interrupted builds
+                if now - mtime > 3600:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                continue
+            if now - mtime > self.max_age:
+                shutil.rmtree(entry.path, ignore_errors=True)
+                continue
+            size = _dir_size(entry.path)
+            entries.append((mtime, size, entry.path))
+            total += size
+
+        entries.sort()
+        for mtime, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+
+def _dir_size(path):
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                total += os.lstat(os.path.join(dirpath, name)).st_size
+            except FileNotFoundError:
+                pass
+    return total
+
+
+artifact_cache = ArtifactCache()
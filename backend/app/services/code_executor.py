@@ -1,457 +1,584 @@
+import asyncio
 import subprocess
-import tempfile
 import os
 import re
+import shutil
+import time
+from app.services import metrics
+from app.services.admission import BATCH, Overloaded
+from app.services.artifact_cache import artifact_cache
+from app.services.execution_engine import OUTPUT_HARD_LIMIT_BYTES, execution_engine, low_priority
+from app.services.go_toolchain import go_toolchain
+from app.services.jvm_pool import jvm_pool, kotlinc_daemon
+from app.services.languages import EXE_NAME, language_registry
+from app.services.node_pool import node_pool
+from app.services.precompiled_headers import precompiled_headers
+from app.services.python_zygote import python_zygote
+from app.services.resource_limits import COMPILE_LIMITS, RUN_LIMITS, ResourceUsage
+from app.services.single_flight import compile_flights, speculative_flights
+from app.services.syntax_check import syntax_checker
+from app.services.workspaces import workspace_pool
+
+def describe_error(language, e):
+    """User-facing message for an exception raised while executing code"""
+    if isinstance(e, subprocess.TimeoutExpired):
+        return f"Execution timeout ({e.timeout} seconds exceeded)"
+    if isinstance(e, FileNotFoundError):
+        spec = language_registry.resolve(language)
+        return spec.missing_message if spec else str(e)
+    return str(e)
+
+
+def output_limit_error(stderr):
+    message = f"Output limit exceeded ({OUTPUT_HARD_LIMIT_BYTES} bytes); process killed"
+    return f"{stderr}\n{message}" if stderr else message
+
+
+# Makes C stdio unbuffered in interactive sessions
+STDBUF = shutil.which('stdbuf')
+
+LIMIT_MESSAGES = {
+    'cpu_time': f"CPU time limit exceeded ({RUN_LIMITS.cpu_seconds} seconds); process killed",
+    'memory': f"Memory limit exceeded ({RUN_LIMITS.memory_mb} MB)",
+    'file_size': f"File size limit exceeded ({RUN_LIMITS.file_size_mb} MB); process killed",
+    'workspace': f"Workspace size limit exceeded ({RUN_LIMITS.workspace_mb} MB of files); process killed",
+}
+
+
+def run_error(result):
+    """stderr of a failed run, explaining which limit (if any) ended it"""
+    if result.output_limit_exceeded:
+        return output_limit_error(result.stderr)
+    message = LIMIT_MESSAGES.get(result.usage.limit) if result.usage else None
+    if message:
+        return f"{result.stderr}\n{message}" if result.stderr else message
+    return result.stderr
+
+
+def measured(result, started):
+    """result.usage, or just the wall time for runtimes that cannot measure more"""
+    usage = result.usage or ResourceUsage(time.perf_counter() - started)
+    if result.output_limit_exceeded:
+        usage.limit = 'output'
+    return usage
+
+
+def observe_run(language, returncode, usage):
+    """Record one run in the run time histogram and the limit counter"""
+    outcome = usage.limit or ('ok' if returncode == 0 else 'error')
+    metrics.run_seconds.observe(language, outcome, value=usage.wall_time)
+    if usage.limit:
+        metrics.limit_exceeded.inc(language, usage.limit)
+
+
+class Program:
+    """Source code made ready to run: compiled if needed, runnable many times.
+
+    By default cmd is run as a subprocess in workdir, a pooled workspace
+    (one is taken when none is given) that cleanup() hands back; run/stream
+    callables override that for warm runtimes (JVM pool, Python zygote).
+    """
+
+    def __init__(self, language, cmd, timeout=10, workdir=None, run=None, stream=None, limits=RUN_LIMITS):
+        self.language = language
+        self.cmd = cmd
+        self.timeout = timeout
+        self.workdir = workdir or workspace_pool.acquire()
+        self.limits = limits
+        self._run = run
+        self._stream = stream
+
+    async def run(self, user_inputs):
+        """Run once with the given stdin; returns a ProcessResult"""
+        if self._run:
+            return await self._run(user_inputs or "")
+        return await execution_engine.run(
+            self.cmd, input=user_inputs or "", timeout=self.timeout, cwd=self.workdir, limits=self.limits
+        )
+
+    def stream(self, user_inputs):
+        """Run once, yielding output chunks as produced (see ExecutionEngine.stream)"""
+        if self._stream:
+            return self._stream(user_inputs or "")
+        return execution_engine.stream(
+            self.cmd, input=user_inputs or "", timeout=self.timeout, cwd=self.workdir, limits=self.limits
+        )
+
+    def interact(self, stdin, timeout):
+        """Run once in a fresh process, writing stdin (an async iterable of
+        text) to it as it arrives; yields like stream().
+
+        Warm runtimes take their whole input up front, so they are bypassed.
+        stdout is unbuffered, so a prompt shows up before the program blocks
+        on input.
+        """
+        cmd = self.cmd
+        if STDBUF:
+            cmd = [STDBUF, '-o0', *cmd]
+        return execution_engine.stream(
+            cmd, timeout=timeout, cwd=self.workdir, env={**os.environ, 'PYTHONUNBUFFERED': '1'},
+            limits=self.limits, stdin=stdin,
+        )
+
+    def cleanup(self):
+        if self.workdir:
+            workspace_pool.release(self.workdir)
+            self.workdir = None
+
 
 class CodeExecutor:
-    
-    def execute_python(self, code, user_inputs):
-        """Execute Python code"""
-        try:
-            with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False, encoding='utf-8') as f:
-                f.write(code)
-                temp_file = f.name
-            
-            result = subprocess.run(
-                ['python', temp_file],
-                input=user_inputs,
-                capture_output=True,
-                text=True,
-                timeout=10
-            )
-            os.unlink(temp_file)
-            
-            if result.returncode != 0:
-                return result.stdout, result.stderr
-            return result.stdout, None
-            
-        except subprocess.TimeoutExpired:
-            return "", "Execution timeout (10 seconds exceeded)"
-        except Exception as e:
-            return "", str(e)
-    
-    def execute_javascript(self, code, user_inputs):
-        """Execute JavaScript code using Node.js"""
+
+    async def warm_up(self):
+        """Probe toolchains once, so requests for missing ones fail fast, and warm their caches"""
+        await language_registry.probe()
+        if await language_registry.available('go'):
+            go_toolchain.warm()
+        if await language_registry.available('cpp'):
+            cpp = language_registry.get('cpp')
+            precompiled_headers.include_dir(cpp, await language_registry.version('cpp'), cpp.compile_flags())
+
+    async def execute(self, language, code, user_inputs, profile=None):
+        """Prepare and run code once; returns (output, error, truncated, usage).
+
+        usage is the ResourceUsage of the run, or None when it never started.
+        """
         try:
-            with tempfile.NamedTemporaryFile(mode='w', suffix='.js', delete=False, encoding='utf-8') as f:
-                f.write(code)
-                temp_file = f.name
-            
-            result = subprocess.run(
-                ['node', temp_file],
-                input=user_inputs,
-                capture_output=True,
-                text=True,
-                timeout=10
-            )
-            os.unlink(temp_file)
-            
+            program, error = await self.prepare(language, code, profile)
+            if error:
+                return "", error, False, None
+            started = time.perf_counter()
+            try:
+                result = await program.run(user_inputs)
+            finally:
+                program.cleanup()
+
+            usage = measured(result, started)
+            observe_run(language, result.returncode, usage)
             if result.returncode != 0:
-                return result.stdout, result.stderr
-            return result.stdout, None
-            
-        except subprocess.TimeoutExpired:
-            return "", "Execution timeout (10 seconds exceeded)"
-        except Exception as e:
-            return "", str(e)
-    
-    def execute_java(self, code, user_inputs):
-        """Execute Java code"""
-        try:
-            # Extract class name from code
-            match = re.search(r'public\s+class\s+(\w+)', code)
-            if not match:
-                match = re.search(r'class\s+(\w+)', code)
-            class_name = match.group(1) if match else 'Main'
-            
-            with tempfile.TemporaryDirectory() as tmpdir:
-                java_file = os.path.join(tmpdir, f'{class_name}.java')
-                with open(java_file, 'w', encoding='utf-8') as f:
-                    f.write(code)
-                
-                # Compile
-                compile_result = subprocess.run(
-                    ['javac', java_file],
-                    capture_output=True,
-                    text=True,
-                    timeout=15
-                )
-                
-                if compile_result.returncode != 0:
-                    return "", f"Compilation Error:\n{compile_result.stderr}"
-                
-                # Run
-                run_result = subprocess.run(
-                    ['java', '-cp', tmpdir, class_name],
-                    input=user_inputs,
-                    capture_output=True,
-                    text=True,
-                    timeout=10
-                )
-                
-                if run_result.returncode != 0:
-                    return run_result.stdout, run_result.stderr
-                return run_result.stdout, None
-                
-        except subprocess.TimeoutExpired:
-            return "", "Execution timeout exceeded"
-        except FileNotFoundError:
-            return "", "Java compiler (javac) not found. Please install JDK."
+                return result.stdout, run_error(result), result.truncated, usage
+            return result.stdout, None, result.truncated, usage
+
+        except subprocess.TimeoutExpired as e:
+            usage = ResourceUsage(e.timeout, limit='wall_time')
+            observe_run(language, None, usage)
+            return "", describe_error(language, e), False, usage
         except Exception as e:
-            return "", str(e)
-    
-    def execute_cpp(self, code, user_inputs):
-        """Execute C++ code"""
+            return "", describe_error(language, e), False, None
+
+    async def execute_batch(self, language, code, inputs, profile=None, client="anonymous"):
+        """Compile once, then run every stdin in inputs in parallel.
+
+        Compilation and every case each hold their own execution slot, at
+        batch priority, so a batch shares the engine's limits with all other
+        executions. Admission is decided at compilation (raising Overloaded);
+        the cases of an admitted batch wait their turn.
+        Returns (case_results, error); error is set when preparation
+        failed, e.g. on a compilation error.
+        """
         try:
-            with tempfile.TemporaryDirectory() as tmpdir:
-                cpp_file = os.path.join(tmpdir, 'main.cpp')
-                exe_file = os.path.join(tmpdir, 'main.exe' if os.name == 'nt' else 'main')
-                
-                with open(cpp_file, 'w', encoding='utf-8') as f:
-                    f.write(code)
-                
-                # Compile
-                compile_result = subprocess.run(
-                    ['g++', cpp_file, '-o', exe_file, '-std=c++17'],
-                    capture_output=True,
-                    text=True,
-                    timeout=15
-                )
-                
-                if compile_result.returncode != 0:
-                    return "", f"Compilation Error:\n{compile_result.stderr}"
-                
-                # Run
-                run_result = subprocess.run(
-                    [exe_file],
-                    input=user_inputs,
-                    capture_output=True,
-                    text=True,
-                    timeout=10
-                )
-                
-                if run_result.returncode != 0:
-                    return run_result.stdout, run_result.stderr
-                return run_result.stdout, None
-                
-        except subprocess.TimeoutExpired:
-            return "", "Execution timeout exceeded"
-        except FileNotFoundError:
-            return "", "C++ compiler (g++) not found. Please install GCC."
+            async with execution_engine.slot(language, client, BATCH):
+                program, error = await self.prepare(language, code, profile)
+        except Overloaded:
+            raise
+        except subprocess.TimeoutExpired as e:
+            return [], f"Compilation timeout ({e.timeout} seconds exceeded)"
         except Exception as e:
-            return "", str(e)
-    
-    def execute_c(self, code, user_inputs):
-        """Execute C code"""
-        try:
-            with tempfile.TemporaryDirectory() as tmpdir:
-                c_file = os.path.join(tmpdir, 'main.c')
-                exe_file = os.path.join(tmpdir, 'main.exe' if os.name == 'nt' else 'main')
-                
-                with open(c_file, 'w', encoding='utf-8') as f:
-                    f.write(code)
-                
-                # Compile
-                compile_result = subprocess.run(
-                    ['gcc', c_file, '-o', exe_file],
-                    capture_output=True,
-                    text=True,
-                    timeout=15
-                )
-                
-                if compile_result.returncode != 0:
-                    return "", f"Compilation Error:\n{compile_result.stderr}"
-                
-                # Run
-                run_result = subprocess.run(
-                    [exe_file],
-                    input=user_inputs,
-                    capture_output=True,
-                    text=True,
-                    timeout=10
-                )
-                
-                if run_result.returncode != 0:
-                    return run_result.stdout, run_result.stderr
-                return run_result.stdout, None
-                
-        except subprocess.TimeoutExpired:
-            return "", "Execution timeout exceeded"
-        except FileNotFoundError:
-            return "", "C compiler (gcc) not found. Please install GCC."
-        except Exception as e:
-            return "", str(e)
-    
-    def execute_csharp(self, code, user_inputs):
-        """Execute C# code"""
+            return [], describe_error(language, e)
+        if error:
+            return [], error
+
+        async def run_case(user_inputs):
+            async with execution_engine.slot(language, client, BATCH, admit=False):
+                started = time.perf_counter()
+                try:
+                    result = await program.run(user_inputs)
+                    usage = measured(result, started)
+                    observe_run(language, result.returncode, usage)
+                    return {
+                        'stdout': result.stdout,
+                        'stderr': run_error(result) if result.returncode != 0 else result.stderr,
+                        'exit_code': result.returncode,
+                        'timed_out': False,
+                        'truncated': result.truncated,
+                        'stdout_digest': result.stdout_digest,
+                        'time': time.perf_counter() - started,
+                        'cpu_time': usage.cpu_time,
+                        'peak_rss_kb': usage.peak_rss_kb,
+                        'limit_exceeded': usage.limit,
+                    }
+                except subprocess.TimeoutExpired as e:
+                    observe_run(language, None, ResourceUsage(e.timeout, limit='wall_time'))
+                    return {
+                        'stdout': "",
+                        'stderr': f"Execution timeout ({e.timeout} seconds exceeded)",
+                        'exit_code': None,
+                        'timed_out': True,
+                        'time': time.perf_counter() - started,
+                        'limit_exceeded': 'wall_time',
+                    }
+                except Exception as e:
+                    return {
+                        'stdout': "",
+                        'stderr': describe_error(language, e),
+                        'exit_code': None,
+                        'timed_out': False,
+                        'time': time.perf_counter() - started,
+                    }
+
         try:
-            with tempfile.TemporaryDirectory() as tmpdir:
-                cs_file = os.path.join(tmpdir, 'Program.cs')
-                dll_file = os.path.join(tmpdir, 'Program.dll')
-                
-                with open(cs_file, 'w', encoding='utf-8') as f:
-                    f.write(code)
-                
-                # Compile with dotnet
-                compile_result = subprocess.run(
-                    ['dotnet', 'build', cs_file, '-o', tmpdir],
-                    capture_output=True,
-                    text=True,
-                    timeout=15
-                )
-                
-                # Alternative: Try csc compiler
-                if compile_result.returncode != 0:
-                    compile_result = subprocess.run(
-                        ['csc', '/out:' + dll_file, cs_file],
-                        capture_output=True,
-                        text=True,
-                        timeout=15
-                    )
-                
-                if compile_result.returncode != 0:
-                    return "", f"Compilation Error:\n{compile_result.stderr}"
-                
-                # Run
-                run_result = subprocess.run(
-                    ['dotnet', dll_file],
-                    input=user_inputs,
-                    capture_output=True,
-                    text=True,
-                    timeout=10
-                )
-                
-                if run_result.returncode != 0:
-                    return run_result.stdout, run_result.stderr
-                return run_result.stdout, None
-                
-        except subprocess.TimeoutExpired:
-            return "", "Execution timeout exceeded"
-        except FileNotFoundError:
-            return "", "C# compiler not found. Please install .NET SDK or Mono."
-        except Exception as e:
-            return "", str(e)
-    
-    def execute_go(self, code, user_inputs):
-        """Execute Go code"""
+            return await asyncio.gather(*(run_case(user_inputs) for user_inputs in inputs)), None
+        finally:
+            program.cleanup()
+
+    async def execute_stream(self, language, code, user_inputs, profile=None):
+        """Yield ('stdout' | 'stderr', text) chunks as they are produced,
+        then ('exit', {'exit_code': ..., 'error': ..., **ResourceUsage.fields()})"""
         try:
-            with tempfile.TemporaryDirectory() as tmpdir:
-                go_file = os.path.join(tmpdir, 'main.go')
-                
-                with open(go_file, 'w', encoding='utf-8') as f:
-                    f.write(code)
-                
-                # Run directly (go run compiles and runs)
-                run_result = subprocess.run(
-                    ['go', 'run', go_file],
-                    input=user_inputs,
-                    capture_output=True,
-                    text=True,
-                    timeout=15
-                )
-                
-                if run_result.returncode != 0:
-                    return run_result.stdout, run_result.stderr
-                return run_result.stdout, None
-                
-        except subprocess.TimeoutExpired:
-            return "", "Execution timeout exceeded"
-        except FileNotFoundError:
-            return "", "Go compiler not found. Please install Go."
+            program, error = await self.prepare(language, code, profile)
         except Exception as e:
-            return "", str(e)
-    
-    def execute_rust(self, code, user_inputs):
-        """Execute Rust code"""
+            program, error = None, describe_error(language, e)
+        if error:
+            yield 'exit', {'exit_code': None, 'error': error}
+            return
+        async for event in self._events(program, program.stream(user_inputs)):
+            yield event
+
+    async def execute_interactive(self, program, stdin, timeout):
+        """Like execute_stream for a prepared program, with stdin (an async
+        iterable of text) fed to it as it arrives; see Program.interact"""
+        async for event in self._events(program, program.interact(stdin, timeout)):
+            yield event
+
+    async def _events(self, program, events):
+        """Client events of one run; cleans up program when done"""
+        language = program.language
+        started = time.perf_counter()
+        streamed = 0
+        usage = None
         try:
-            with tempfile.TemporaryDirectory() as tmpdir:
-                rs_file = os.path.join(tmpdir, 'main.rs')
-                exe_file = os.path.join(tmpdir, 'main.exe' if os.name == 'nt' else 'main')
-                
-                with open(rs_file, 'w', encoding='utf-8') as f:
-                    f.write(code)
-                
-                # Compile
-                compile_result = subprocess.run(
-                    ['rustc', rs_file, '-o', exe_file],
-                    capture_output=True,
-                    text=True,
-                    timeout=20
-                )
-                
-                if compile_result.returncode != 0:
-                    return "", f"Compilation Error:\n{compile_result.stderr}"
-                
-                # Run
-                run_result = subprocess.run(
-                    [exe_file],
-                    input=user_inputs,
-                    capture_output=True,
-                    text=True,
-                    timeout=10
-                )
-                
-                if run_result.returncode != 0:
-                    return run_result.stdout, run_result.stderr
-                return run_result.stdout, None
-                
-        except subprocess.TimeoutExpired:
-            return "", "Execution timeout exceeded"
-        except FileNotFoundError:
-            return "", "Rust compiler not found. Please install Rust."
+            async for name, data in events:
+                if name == 'usage':
+                    usage = data
+                    continue
+                if name == 'exit':
+                    usage = usage or ResourceUsage(time.perf_counter() - started)
+                    observe_run(language, data, usage)
+                    yield 'exit', {'exit_code': data, 'error': LIMIT_MESSAGES.get(usage.limit), **usage.fields()}
+                    continue
+                streamed += len(data.encode('utf-8'))
+                if streamed > OUTPUT_HARD_LIMIT_BYTES:
+                    observe_run(language, None, ResourceUsage(time.perf_counter() - started, limit='output'))
+                    yield 'exit', {'exit_code': None, 'error': output_limit_error(""), 'limit_exceeded': 'output'}
+                    break
+                yield name, data
+        except subprocess.TimeoutExpired as e:
+            observe_run(language, None, ResourceUsage(e.timeout, limit='wall_time'))
+            yield 'exit', {'exit_code': None, 'error': describe_error(language, e), 'limit_exceeded': 'wall_time'}
         except Exception as e:
-            return "", str(e)
-    
-    def execute_typescript(self, code, user_inputs):
-        """Execute TypeScript code"""
+            yield 'exit', {'exit_code': None, 'error': describe_error(language, e)}
+        finally:
+            # Kills the process if we stopped early
+            await events.aclose()
+            program.cleanup()
+
+    async def precompile(self, language, code):
+        """Compile code into the artifact cache without running it; returns the
+        compile error, if any"""
+        program, error = await self.prepare(language, code)
+        if program:
+            program.cleanup()
+        return error
+
+    def supports(self, language):
+        return language_registry.resolve(language) is not None
+
+    async def prepare(self, language, code, profile=None):
+        """Return (Program, None), or (None, error) when compilation fails.
+
+        Code that fails the syntax pre-check is rejected without spawning
+        anything. Languages run straight from their LanguageSpec unless a
+        _prepare_<language> method takes over (warm runtimes, odd toolchains).
+        profile selects a compile profile of the spec, if it has any.
+        """
+        spec = language_registry.resolve(language)
+        if spec is None:
+            raise ValueError(f"Execution not supported for {language}")
+        if not await language_registry.available(spec.name):
+            return None, spec.missing_message
+        error = await syntax_checker.check(spec, code)
+        if error:
+            return None, error
+        prepare = getattr(self, f'_prepare_{spec.name}', None)
+        if prepare is not None:
+            return await prepare(spec, code)
+        if spec.compiled:
+            return await self._prepare_compiled(spec, code, profile)
+        return self._interpreted(spec, code), None
+
+    async def _compile_cached(self, spec, code, compile_fn, flags=None):
+        """Return (artifact_dir, error), compiling with compile_fn(build_dir) on a
+        cache miss, or joining the identical compile in flight.
+
+        A speculative (low priority) compile never holds up a real request:
+        the request cancels it and compiles at normal priority instead.
+        """
+        version = await language_registry.version(spec.name)
+        key = artifact_cache.key(spec.name, version, spec.flags if flags is None else flags, code)
+        artifact_dir = artifact_cache.get(key)
+        if artifact_dir:
+            return artifact_dir, None
+        error = artifact_cache.get_error(key)
+        if error:
+            return None, error
+        def run_compile():
+            return self._compile(spec, key, compile_fn)
+
+        if low_priority.get() and not compile_flights.running(key):
+            return await speculative_flights.do(key, run_compile)
+        speculative_flights.cancel(key)
+        return await compile_flights.do(key, run_compile)
+
+    async def _compile(self, spec, key, compile_fn):
+        build_dir = artifact_cache.staging_dir()
+        started = time.perf_counter()
+        outcome = 'failed'
         try:
-            with tempfile.TemporaryDirectory() as tmpdir:
-                ts_file = os.path.join(tmpdir, 'main.ts')
-                
-                with open(ts_file, 'w', encoding='utf-8') as f:
-                    f.write(code)
-                
-                # Run with ts-node
-                run_result = subprocess.run(
-                    ['ts-node', ts_file],
-                    input=user_inputs,
-                    capture_output=True,
-                    text=True,
-                    timeout=15
-                )
-                
-                if run_result.returncode != 0:
-                    return run_result.stdout, run_result.stderr
-                return run_result.stdout, None
-                
+            compile_result = await compile_fn(build_dir)
+            if compile_result.returncode != 0:
+                outcome = 'error'
+                error = f"Compilation Error:\n{compile_result.stderr}"
+                # Not when the compiler was killed (a limit): that may pass next time
+                if compile_result.returncode > 0 and not (compile_result.usage and compile_result.usage.limit):
+                    artifact_cache.put_error(key, error)
+                return None, error
+            outcome = 'ok'
+            return artifact_cache.put(key, build_dir), None
         except subprocess.TimeoutExpired:
-            return "", "Execution timeout exceeded"
-        except FileNotFoundError:
-            return "", "TypeScript not found. Please install ts-node."
-        except Exception as e:
-            return "", str(e)
-    
-    def execute_php(self, code, user_inputs):
-        """Execute PHP code"""
+            outcome = 'timeout'
+            raise
+        finally:
+            metrics.compile_seconds.observe(spec.name, outcome, value=time.perf_counter() - started)
+            shutil.rmtree(build_dir, ignore_errors=True)
+
+    def _write_source(self, code, filename):
+        """Write code into a pooled workspace; returns (workdir, path)"""
+        workdir = workspace_pool.acquire()
+        path = os.path.join(workdir, filename)
         try:
-            with tempfile.NamedTemporaryFile(mode='w', suffix='.php', delete=False, encoding='utf-8') as f:
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(code)
+        except BaseException:
+            workspace_pool.release(workdir)
+            raise
+        return workdir, path
+
+    def _interpreted(self, spec, code):
+        """Program that runs spec.run_cmd on the source file directly"""
+        workdir, path = self._write_source(code, spec.source_file)
+        return Program(spec.name, spec.command(spec.run_cmd, source=path), spec.run_timeout, workdir)
+
+    async def _prepare_compiled(self, spec, code, profile=None):
+        """Compile with spec.compile_cmd (cached), then run spec.run_cmd"""
+        flags = spec.compile_flags(profile)
+
+        async def compile_source(build_dir):
+            source = os.path.join(build_dir, spec.source_file)
+            with open(source, 'w', encoding='utf-8') as f:
                 f.write(code)
-                temp_file = f.name
-            
-            result = subprocess.run(
-                ['php', temp_file],
-                input=user_inputs,
-                capture_output=True,
-                text=True,
-                timeout=10
+            cmd = spec.command(spec.compile_cmd, source=source, build_dir=build_dir) + flags
+            pch_dir = precompiled_headers.include_dir(spec, await language_registry.version(spec.name), flags)
+            if pch_dir:
+                cmd += ['-I', pch_dir]
+            return await execution_engine.run(cmd, timeout=spec.compile_timeout, limits=COMPILE_LIMITS)
+
+        artifact_dir, error = await self._compile_cached(spec, code, compile_source, flags)
+        if error:
+            return None, error
+        return Program(spec.name, spec.command(spec.run_cmd, build_dir=artifact_dir), spec.run_timeout), None
+
+    async def _prepare_python(self, spec, code):
+        """Prepare Python code"""
+        workdir, path = self._write_source(code, spec.source_file)
+        cmd = spec.command(spec.run_cmd, source=path)
+        timeout = spec.run_timeout
+        if not python_zygote.enabled:
+            return Program('python', cmd, timeout, workdir), None
+
+        async def run(user_inputs):
+            try:
+                return await python_zygote.run(path, user_inputs, timeout=timeout, limits=RUN_LIMITS, cwd=workdir)
+            except (OSError, RuntimeError, ValueError) as e:
+                # Zygote unavailable: fall back to a fresh interpreter
+                print(f"WARNING: Python zygote failed, using a new process: {e}")
+            return await execution_engine.run(cmd, input=user_inputs, timeout=timeout, cwd=workdir, limits=RUN_LIMITS)
+
+        async def stream(user_inputs):
+            started = False
+            try:
+                async for event in python_zygote.stream(
+                    path, user_inputs, timeout=timeout, limits=RUN_LIMITS, cwd=workdir
+                ):
+                    started = True
+                    yield event
+                return
+            except (OSError, RuntimeError, ValueError) as e:
+                if started:
+                    raise
+                print(f"WARNING: Python zygote failed, using a new process: {e}")
+            async for event in execution_engine.stream(
+                cmd, input=user_inputs, timeout=timeout, cwd=workdir, limits=RUN_LIMITS
+            ):
+                yield event
+
+        return Program('python', cmd, timeout, workdir=workdir, run=run, stream=stream), None
+
+    async def _prepare_javascript(self, spec, code):
+        """Run JavaScript in the Node worker pool"""
+        workdir, script = self._write_source(code, spec.source_file)
+
+        async def run(user_inputs):
+            return await node_pool.run(script, user_inputs, timeout=spec.run_timeout)
+
+        # Pool workers buffer output, so streaming uses a fresh process
+        return Program(
+            'javascript', spec.command(spec.run_cmd, source=script), spec.run_timeout, workdir,
+            run=run if node_pool.enabled else None,
+        ), None
+
+    async def _prepare_typescript(self, spec, code):
+        """Transpile TypeScript (cached, without type checking) and run it like JavaScript"""
+        transpile = node_pool.enabled and node_pool.typescript is not None
+
+        async def compile_typescript(build_dir):
+            ts_file = os.path.join(build_dir, spec.source_file)
+            with open(ts_file, 'w', encoding='utf-8') as f:
+                f.write(code)
+            if transpile:
+                return await node_pool.transpile(
+                    os.path.join(build_dir, 'main.js'), ts_file, timeout=spec.compile_timeout
+                )
+            return await execution_engine.run(
+                spec.command(spec.compile_cmd, source=ts_file, build_dir=build_dir) + spec.flags,
+                timeout=spec.compile_timeout, limits=COMPILE_LIMITS
             )
-            os.unlink(temp_file)
-            
-            if result.returncode != 0:
-                return result.stdout, result.stderr
-            return result.stdout, None
-            
-        except subprocess.TimeoutExpired:
-            return "", "Execution timeout exceeded"
-        except FileNotFoundError:
-            return "", "PHP not found. Please install PHP."
-        except Exception as e:
-            return "", str(e)
-    
-    def execute_ruby(self, code, user_inputs):
-        """Execute Ruby code"""
-        try:
-            with tempfile.NamedTemporaryFile(mode='w', suffix='.rb', delete=False, encoding='utf-8') as f:
+
+        # Transpiled and type-checked output are cached separately
+        flags = [*spec.flags, 'transpile-only'] if transpile else spec.flags
+        artifact_dir, error = await self._compile_cached(spec, code, compile_typescript, flags)
+        if error:
+            return None, error
+        script = os.path.join(artifact_dir, 'main.js')
+
+        async def run(user_inputs):
+            return await node_pool.run(script, user_inputs, timeout=spec.run_timeout)
+
+        return Program(
+            'typescript', spec.command(spec.run_cmd, build_dir=artifact_dir), spec.run_timeout,
+            run=run if node_pool.enabled else None,
+        ), None
+
+    async def _prepare_java(self, spec, code):
+        """Compile Java code"""
+        # Extract class name from code
+        match = re.search(r'public\s+class\s+(\w+)', code)
+        if not match:
+            match = re.search(r'class\s+(\w+)', code)
+        class_name = match.group(1) if match else 'Main'
+
+        async def compile_java(build_dir):
+            java_file = os.path.join(build_dir, f'{class_name}.java')
+            with open(java_file, 'w', encoding='utf-8') as f:
                 f.write(code)
-                temp_file = f.name
-            
-            result = subprocess.run(
-                ['ruby', temp_file],
-                input=user_inputs,
-                capture_output=True,
-                text=True,
-                timeout=10
+            if jvm_pool.enabled:
+                return await jvm_pool.compile_java(build_dir, java_file, timeout=spec.compile_timeout)
+            return await execution_engine.run(
+                spec.command(spec.compile_cmd, source=java_file, build_dir=build_dir),
+                timeout=spec.compile_timeout, limits=COMPILE_LIMITS
             )
-            os.unlink(temp_file)
-            
-            if result.returncode != 0:
-                return result.stdout, result.stderr
-            return result.stdout, None
-            
-        except subprocess.TimeoutExpired:
-            return "", "Execution timeout exceeded"
-        except FileNotFoundError:
-            return "", "Ruby not found. Please install Ruby."
-        except Exception as e:
-            return "", str(e)
-    
-    def execute_swift(self, code, user_inputs):
-        """Execute Swift code"""
-        try:
-            with tempfile.NamedTemporaryFile(mode='w', suffix='.swift', delete=False, encoding='utf-8') as f:
+
+        artifact_dir, error = await self._compile_cached(spec, code, compile_java)
+        if error:
+            return None, error
+
+        async def run(user_inputs):
+            return await jvm_pool.run([artifact_dir], class_name, user_inputs, timeout=spec.run_timeout)
+
+        # Pool workers buffer output, so streaming uses a fresh JVM
+        return Program(
+            'java', spec.command(spec.run_cmd, build_dir=artifact_dir) + [class_name], spec.run_timeout,
+            run=run if jvm_pool.enabled else None,
+        ), None
+
+    async def _prepare_csharp(self, spec, code):
+        """Compile C# code"""
+        async def compile_csharp(build_dir):
+            cs_file = os.path.join(build_dir, spec.source_file)
+            dll_file = os.path.join(build_dir, 'Program.dll')
+            with open(cs_file, 'w', encoding='utf-8') as f:
                 f.write(code)
-                temp_file = f.name
-            
-            result = subprocess.run(
-                ['swift', temp_file],
-                input=user_inputs,
-                capture_output=True,
-                text=True,
-                timeout=15
+
+            # Compile with dotnet
+            compile_result = await execution_engine.run(
+                spec.command(spec.compile_cmd, source=cs_file, build_dir=build_dir),
+                timeout=spec.compile_timeout, limits=COMPILE_LIMITS
             )
-            os.unlink(temp_file)
-            
-            if result.returncode != 0:
-                return result.stdout, result.stderr
-            return result.stdout, None
-            
-        except subprocess.TimeoutExpired:
-            return "", "Execution timeout exceeded"
-        except FileNotFoundError:
-            return "", "Swift not found. Please install Swift."
-        except Exception as e:
-            return "", str(e)
-    
-    def execute_kotlin(self, code, user_inputs):
-        """Execute Kotlin code"""
-        try:
-            with tempfile.TemporaryDirectory() as tmpdir:
-                kt_file = os.path.join(tmpdir, 'Main.kt')
-                jar_file = os.path.join(tmpdir, 'main.jar')
-                
-                with open(kt_file, 'w', encoding='utf-8') as f:
-                    f.write(code)
-                
-                # Compile
-                compile_result = subprocess.run(
-                    ['kotlinc', kt_file, '-include-runtime', '-d', jar_file],
-                    capture_output=True,
-                    text=True,
-                    timeout=20
-                )
-                
-                if compile_result.returncode != 0:
-                    return "", f"Compilation Error:\n{compile_result.stderr}"
-                
-                # Run
-                run_result = subprocess.run(
-                    ['java', '-jar', jar_file],
-                    input=user_inputs,
-                    capture_output=True,
-                    text=True,
-                    timeout=10
+
+            # Alternative: Try csc compiler
+            if compile_result.returncode != 0:
+                compile_result = await execution_engine.run(
+                    ['csc', '/out:' + dll_file, cs_file],
+                    timeout=spec.compile_timeout, limits=COMPILE_LIMITS
                 )
-                
-                if run_result.returncode != 0:
-                    return run_result.stdout, run_result.stderr
-                return run_result.stdout, None
-                
-        except subprocess.TimeoutExpired:
-            return "", "Execution timeout exceeded"
-        except FileNotFoundError:
-            return "", "Kotlin compiler not found. Please install Kotlin."
-        except Exception as e:
-            return "", str(e)
+            return compile_result
+
+        artifact_dir, error = await self._compile_cached(spec, code, compile_csharp)
+        if error:
+            return None, error
+        return Program('csharp', spec.command(spec.run_cmd, build_dir=artifact_dir), spec.run_timeout), None
+
+    async def _prepare_go(self, spec, code):
+        """Build Go code with the shared build cache"""
+        async def compile_go(build_dir):
+            go_file = os.path.join(build_dir, spec.source_file)
+            with open(go_file, 'w', encoding='utf-8') as f:
+                f.write(code)
+            return await go_toolchain.build(
+                go_file, os.path.join(build_dir, EXE_NAME), spec.compile_timeout, limits=COMPILE_LIMITS
+            )
+
+        artifact_dir, error = await self._compile_cached(spec, code, compile_go)
+        if error:
+            return None, error
+        return Program('go', spec.command(spec.run_cmd, build_dir=artifact_dir), spec.run_timeout), None
+
+    async def _prepare_kotlin(self, spec, code):
+        """Compile Kotlin code"""
+        async def compile_kotlin(build_dir):
+            kt_file = os.path.join(build_dir, spec.source_file)
+            jar_file = os.path.join(build_dir, 'main.jar')
+            with open(kt_file, 'w', encoding='utf-8') as f:
+                f.write(code)
+            if kotlinc_daemon.enabled:
+                return await kotlinc_daemon.compile_kotlin(jar_file, kt_file, timeout=spec.compile_timeout)
+            return await execution_engine.run(
+                spec.command(spec.compile_cmd, source=kt_file, build_dir=build_dir) + spec.flags,
+                timeout=spec.compile_timeout, limits=COMPILE_LIMITS
+            )
+
+        artifact_dir, error = await self._compile_cached(spec, code, compile_kotlin)
+        if error:
+            return None, error
+
+        jar_file = os.path.join(artifact_dir, 'main.jar')
+
+        async def run(user_inputs):
+            return await jvm_pool.run([jar_file], '-', user_inputs, timeout=spec.run_timeout)
+
+        return Program(
+            'kotlin', spec.command(spec.run_cmd, build_dir=artifact_dir), spec.run_timeout,
+            run=run if jvm_pool.enabled else None,
+        ), None
+
 
 # Create singleton instance
 code_executor = CodeExecutor()
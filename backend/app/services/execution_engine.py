@@ -0,0 +1,548 @@
+"""
+Asyncio-based process runner with global and per-language concurrency caps
+"""
+import asyncio
+import codecs
+import contextvars
+import os
+import shutil
+import signal
+import subprocess
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Optional
+from app.services import metrics
+from app.services.admission import INTERACTIVE, FairScheduler
+from app.services.grader import OutputDigest
+from app.services.resource_limits import ResourceUsage, resource
+from app.services.shared_state import SharedSlots, shared_path
+from app.services.workspaces import watch
+
+STREAM_CHUNK_SIZE = 4096
+# Chunks buffered between the process pipes and a (possibly slow) consumer
+STREAM_QUEUE_SIZE = 16
+
+
+# Output kept per stream (half from the start, half from the end)
+MAX_OUTPUT_BYTES = int(os.getenv("MAX_OUTPUT_BYTES", str(64 * 1024)))
+MAX_OUTPUT_LINES = int(os.getenv("MAX_OUTPUT_LINES", "2000"))
+# Total output after which the process is killed
+OUTPUT_HARD_LIMIT_BYTES = int(os.getenv("OUTPUT_HARD_LIMIT_BYTES", str(16 * 1024 * 1024)))
+# How long to wait for pipes to close after the process group was killed
+DRAIN_TIMEOUT = 2
+# Processes started while this is set run at the lowest CPU priority (background work)
+low_priority = contextvars.ContextVar("low_priority", default=False)
+NICE = shutil.which('nice')
+
+
+@dataclass
+class ProcessResult:
+    returncode: int
+    stdout: str
+    stderr: str
+    truncated: bool = False
+    output_limit_exceeded: bool = False
+    usage: Optional[ResourceUsage] = None
+    # OutputDigest of the whole stdout, when stdout was truncated
+    stdout_digest: Optional[str] = None
+
+
+class OutputBuffer:
+    """Head/tail capture of one output stream in bounded memory.
+
+    Output within max_bytes and max_lines is kept whole. Beyond that the
+    head keeps up to half of each limit and the tail gets whatever budget
+    the head left unused. With digest, an OutputDigest of everything
+    written is kept as well.
+    """
+
+    def __init__(self, max_bytes=None, max_lines=None, digest=False):
+        self.max_bytes = max_bytes or MAX_OUTPUT_BYTES
+        self.max_lines = max_lines or MAX_OUTPUT_LINES
+        self.head_bytes = self.max_bytes // 2
+        self.head_lines = self.max_lines // 2
+        self.head = []
+        self.head_size = 0
+        self.head_newlines = 0
+        self.head_full = False
+        # Chunks with their (bytes, newlines)
+        self.tail = deque()
+        self.tail_size = 0
+        self.tail_newlines = 0
+        self.total_bytes = 0
+        self.total_newlines = 0
+        self.digest = OutputDigest() if digest else None
+
+    @property
+    def tail_bytes(self):
+        return self.max_bytes - self.head_size
+
+    @property
+    def tail_lines(self):
+        return self.max_lines - self.head_newlines
+
+    def write(self, text):
+        self.total_bytes += len(text.encode('utf-8'))
+        self.total_newlines += text.count('\n')
+        if self.digest is not None:
+            self.digest.write(text)
+        if not self.head_full:
+            text = self._fill_head(text)
+            if not text:
+                return
+        size, newlines = len(text.encode('utf-8')), text.count('\n')
+        self.tail.append((text, size, newlines))
+        self.tail_size += size
+        self.tail_newlines += newlines
+        # Drop whole chunks once the rest alone exceeds a tail limit
+        while len(self.tail) > 1:
+            _, size, newlines = self.tail[0]
+            if self.tail_size - size < self.tail_bytes and self.tail_newlines - newlines <= self.tail_lines:
+                break
+            self.tail.popleft()
+            self.tail_size -= size
+            self.tail_newlines -= newlines
+
+    def _fill_head(self, text):
+        """Move as much of text into the head as fits; return the rest"""
+        part = text
+        lines_left = self.head_lines - self.head_newlines
+        if text.count('\n') >= lines_left:
+            end = -1
+            for _ in range(lines_left):
+                end = text.index('\n', end + 1)
+            part = text[:end + 1]
+        encoded = part.encode('utf-8')
+        if len(encoded) > self.head_bytes - self.head_size:
+            part = encoded[:self.head_bytes - self.head_size].decode('utf-8', errors='ignore')
+
+        self.head.append(part)
+        self.head_size += len(part.encode('utf-8'))
+        self.head_newlines += part.count('\n')
+        rest = text[len(part):]
+        if rest:
+            self.head_full = True
+        return rest
+
+    def getvalue(self):
+        """Return (text, truncated)"""
+        head = "".join(self.head)
+        tail = "".join(text for text, _, _ in self.tail)
+        if self.total_bytes <= self.max_bytes and self.total_newlines <= self.max_lines:
+            return head + tail, False
+
+        if tail.count('\n') > self.tail_lines:
+            tail = '\n'.join(tail.split('\n')[-(self.tail_lines + 1):])
+        encoded = tail.encode('utf-8')
+        if len(encoded) > self.tail_bytes:
+            tail = encoded[len(encoded) - self.tail_bytes:].decode('utf-8', errors='ignore')
+
+        omitted_bytes = self.total_bytes - len(head.encode('utf-8')) - len(tail.encode('utf-8'))
+        omitted_lines = self.total_newlines - head.count('\n') - tail.count('\n')
+        marker = f"\n... [output truncated: {omitted_bytes} bytes, {omitted_lines} lines omitted] ...\n"
+        return head + marker + tail, True
+
+
+class ExecutionEngine:
+    """Execution slots are handed out fairly across clients (see
+    FairScheduler); they are also box-wide (shared by every API and job
+    worker process) when SHARED_STATE_DIR is set."""
+
+    def __init__(self, max_concurrent=None, max_per_language=None, shared_dir=None):
+        self.max_concurrent = max_concurrent or int(os.getenv("MAX_CONCURRENT_EXECUTIONS", "32"))
+        self.max_per_language = max_per_language or int(os.getenv("MAX_CONCURRENT_PER_LANGUAGE", "8"))
+        self.scheduler = FairScheduler(self.max_concurrent, self.max_per_language)
+        self.shared_dir = shared_dir
+        self._shared_slots = {}
+
+    def _shared(self, name, count):
+        if name not in self._shared_slots:
+            self._shared_slots[name] = SharedSlots(self.shared_dir, name, count)
+        return self._shared_slots[name]
+
+    @asynccontextmanager
+    async def _shared_slot(self, language):
+        """Box-wide language and global slots, always taken in this order"""
+        if not self.shared_dir:
+            yield
+            return
+        held = []
+        try:
+            for slots in (self._shared(f"lang-{language}", self.max_per_language),
+                          self._shared("global", self.max_concurrent)):
+                held.append((slots, await slots.acquire()))
+            yield
+        finally:
+            for slots, index in reversed(held):
+                slots.release(index)
+
+    @asynccontextmanager
+    async def slot(self, language, client="anonymous", priority=INTERACTIVE, admit=True):
+        """Hold one global and one per-language execution slot.
+
+        Raises Overloaded when admit is set and the request should be turned
+        away instead of queued (see FairScheduler).
+        """
+        metrics.queued_jobs.inc(language)
+        waiting = True
+        try:
+            await self.scheduler.acquire(language, client, priority, admit)
+            started = time.perf_counter()
+            try:
+                async with self._shared_slot(language):
+                    metrics.queued_jobs.dec(language)
+                    waiting = False
+                    metrics.inflight_jobs.inc(language)
+                    try:
+                        yield
+                    finally:
+                        metrics.inflight_jobs.dec(language)
+            finally:
+                self.scheduler.release(language, time.perf_counter() - started)
+        finally:
+            if waiting:
+                metrics.queued_jobs.dec(language)
+
+    def load(self):
+        """Share of this process's execution capacity in use; above 1 when executions wait"""
+        return (self.scheduler.running + self.scheduler.waiting) / self.max_concurrent
+
+    async def run(self, cmd, input=None, timeout=10, cwd=None, env=None, limits=None):
+        """Run a command without blocking the event loop.
+
+        Mirrors subprocess.run(capture_output=True, text=True): raises
+        subprocess.TimeoutExpired when the timeout is exceeded and
+        FileNotFoundError when the executable is missing.
+        """
+        return await collect(self.stream(cmd, input=input, timeout=timeout, cwd=cwd, env=env, limits=limits))
+
+    async def stream(self, cmd, input=None, timeout=10, cwd=None, env=None, limits=None, stdin=None):
+        """Yield ('stdout' | 'stderr', text) chunks as the process writes them,
+        then ('usage', ResourceUsage) and ('exit', returncode). Raises like run().
+
+        stdin, instead of input, is an async iterable of text written to the
+        process as it arrives (interactive sessions); its end closes stdin.
+
+        The command runs in its own session, so a timeout or an early close
+        kills everything it started, not just the direct child. limits
+        (ResourceLimits) are applied to the process before it starts.
+        """
+        limited = limits.command(cmd) if limits else None
+        wrapped = limited
+        if low_priority.get() and NICE:
+            wrapped = [NICE, '-n', '19', *(limited or cmd)]
+        inherited_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else 0
+        started = time.perf_counter()
+        proc = subprocess.Popen(
+            wrapped or cmd,
+            stdin=subprocess.PIPE if input is not None or stdin is not None else subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            cwd=cwd,
+            env=env,
+            start_new_session=True,
+            preexec_fn=limits.apply if limits and not limited else None,
+        )
+        # Reaped here rather than by asyncio, to get the exact CPU time and peak RSS
+        exit_status = asyncio.ensure_future(wait_process(proc))
+
+        def kill():
+            # Also after the exit: descendants may still hold the pipes
+            kill_process_group(proc.pid)
+
+        async def wait():
+            returncode, _, _ = await asyncio.shield(exit_status)
+            return returncode
+
+        transports = []
+        events = None
+        watcher = watch_workspace(cwd, limits, kill)
+        try:
+            stdout = await pipe_reader(proc.stdout, transports)
+            stderr = await pipe_reader(proc.stderr, transports)
+            feed = None
+            if input is not None:
+                feed = write_pipe(proc.stdin, input.encode('utf-8'), transports)
+            elif stdin is not None:
+                feed = feed_pipe(proc.stdin, stdin, transports)
+            events = stream_output(stdout, stderr, wait, kill, timeout, cmd, feed)
+            async for name, data in events:
+                if name == 'exit':
+                    _, rusage, sampled_rss_kb = exit_status.result()
+                    usage = ResourceUsage.from_rusage(
+                        time.perf_counter() - started, rusage, limits, sampled_rss_kb, inherited_rss_kb
+                    )
+                    if watcher is not None and watcher.done():
+                        usage.limit = 'workspace'
+                    usage.classify(data)
+                    yield 'usage', usage
+                yield name, data
+        finally:
+            if watcher is not None:
+                watcher.cancel()
+            if events is not None:
+                await events.aclose()
+            kill()
+            if events is not None:
+                try:
+                    await asyncio.wait_for(asyncio.gather(_discard(stdout), _discard(stderr)), DRAIN_TIMEOUT)
+                except asyncio.TimeoutError:
+                    # A descendant left the session and still holds the pipes
+                    pass
+            close_pipes([proc.stdin, proc.stdout, proc.stderr], transports)
+            await exit_status
+
+
+def watch_workspace(cwd, limits, kill):
+    """Task that kills the program once cwd holds more than limits.workspace_mb;
+    None when there is no such limit"""
+    if not cwd or limits is None or not limits.workspace_mb:
+        return None
+    return asyncio.ensure_future(watch(cwd, limits.workspace_mb << 20, kill))
+
+
+async def stream_output(stdout, stderr, wait, kill, timeout, cmd, feed=None):
+    """Merge two StreamReaders into ordered chunk events with an overall deadline.
+
+    At most STREAM_QUEUE_SIZE chunks are buffered; beyond that the pipes are
+    not read, so a slow consumer blocks the child instead of growing memory.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    queue = asyncio.Queue(maxsize=STREAM_QUEUE_SIZE)
+
+    async def pump(name, reader):
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        while True:
+            chunk = await reader.read(STREAM_CHUNK_SIZE)
+            text = decoder.decode(chunk, final=not chunk)
+            if text:
+                await queue.put((name, text))
+            if not chunk:
+                break
+        await queue.put((name, None))
+
+    tasks = [asyncio.ensure_future(pump('stdout', stdout)), asyncio.ensure_future(pump('stderr', stderr))]
+    if feed is not None:
+        tasks.append(asyncio.ensure_future(feed))
+    exited = asyncio.ensure_future(wait())
+    tasks.append(exited)
+    try:
+        open_streams = 2
+        getter = None
+        drain_deadline = None
+        while open_streams:
+            if getter is None:
+                getter = asyncio.ensure_future(queue.get())
+                tasks.append(getter)
+            if exited.done() and drain_deadline is None:
+                drain_deadline = loop.time() + DRAIN_TIMEOUT
+            limit = min(deadline, drain_deadline or deadline)
+            waiting = {getter} if exited.done() else {getter, exited}
+            done, _ = await asyncio.wait(
+                waiting, timeout=max(limit - loop.time(), 0), return_when=asyncio.FIRST_COMPLETED
+            )
+            if getter in done:
+                name, text = getter.result()
+                getter = None
+                if text is None:
+                    open_streams -= 1
+                else:
+                    yield name, text
+            elif loop.time() >= deadline:
+                raise asyncio.TimeoutError()
+            elif drain_deadline is not None and loop.time() >= drain_deadline:
+                # The program exited, but something it started still holds the pipes
+                kill()
+                drain_deadline = float('inf')
+        returncode = await asyncio.wait_for(exited, max(deadline - loop.time(), 0))
+        yield 'exit', returncode
+    except asyncio.TimeoutError:
+        kill()
+        raise subprocess.TimeoutExpired(cmd, timeout)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def collect(events, hard_limit=None):
+    """Gather a stream() into a ProcessResult with bounded memory.
+
+    Once stdout and stderr together exceed hard_limit bytes the stream is
+    closed, which kills the process.
+    """
+    hard_limit = hard_limit or OUTPUT_HARD_LIMIT_BYTES
+    stdout, stderr = OutputBuffer(digest=True), OutputBuffer()
+    returncode = None
+    usage = None
+    limit_exceeded = False
+    try:
+        async for name, data in events:
+            if name == 'exit':
+                returncode = data
+                continue
+            if name == 'usage':
+                usage = data
+                continue
+            (stdout if name == 'stdout' else stderr).write(data)
+            if stdout.total_bytes + stderr.total_bytes > hard_limit:
+                limit_exceeded = True
+                break
+    finally:
+        await events.aclose()
+
+    if limit_exceeded:
+        returncode = -9
+    stdout_text, stdout_truncated = stdout.getvalue()
+    stderr_text, stderr_truncated = stderr.getvalue()
+    if usage is not None and limit_exceeded:
+        usage.limit = 'output'
+    elif usage is not None:
+        # Allocation failures only show up in what the runtime printed
+        usage.classify(returncode, stderr_text)
+    return ProcessResult(
+        returncode=returncode,
+        stdout=normalize_newlines(stdout_text),
+        stderr=normalize_newlines(stderr_text),
+        truncated=limit_exceeded or stdout_truncated or stderr_truncated,
+        output_limit_exceeded=limit_exceeded,
+        usage=usage,
+        stdout_digest=stdout.digest.hexdigest() if stdout_truncated else None,
+    )
+
+
+async def wait_process(proc, sample_interval=0.05):
+    """Reap a subprocess.Popen without blocking the loop.
+
+    Returns (returncode, rusage, peak RSS in KB sampled from /proc while it
+    ran, or None for a program that exited before the first sample)."""
+    loop = asyncio.get_running_loop()
+    try:
+        pidfd = os.pidfd_open(proc.pid)
+    except (AttributeError, OSError):
+        # No pidfd (not Linux, or an old kernel): block a thread instead
+        _, status, rusage = await asyncio.to_thread(os.wait4, proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        return proc.returncode, rusage, None
+    sampled = None
+    # Short programs are sampled more often; a sample right after the spawn
+    # would still see the exec in progress
+    interval = min(0.005, sample_interval)
+    try:
+        while True:
+            exited = loop.create_future()
+            loop.add_reader(pidfd, lambda: exited.done() or exited.set_result(None))
+            try:
+                await asyncio.wait({exited}, timeout=interval)
+            finally:
+                loop.remove_reader(pidfd)
+            pid, status, rusage = os.wait4(proc.pid, os.WNOHANG)
+            if pid:
+                proc.returncode = os.waitstatus_to_exitcode(status)
+                return proc.returncode, rusage, sampled
+            sampled = max(sampled or 0, peak_rss_kb(proc.pid) or 0) or sampled
+            interval = min(interval * 2, sample_interval)
+    finally:
+        os.close(pidfd)
+
+
+def peak_rss_kb(pid):
+    """VmHWM of a running process, or None"""
+    try:
+        with open(f"/proc/{pid}/status", "rb") as f:
+            for line in f:
+                if line.startswith(b"VmHWM:"):
+                    return int(line.split()[1])
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+async def pipe_reader(pipe, transports):
+    """StreamReader over a pipe file object; its transport is added to transports"""
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    transport, _ = await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), pipe)
+    transports.append(transport)
+    return reader
+
+
+async def write_pipe(pipe, data, transports=None):
+    """Write data to a pipe file object, then close it; its transport is added to transports"""
+    loop = asyncio.get_running_loop()
+    transport, protocol = await loop.connect_write_pipe(
+        lambda: asyncio.StreamReaderProtocol(asyncio.StreamReader()), pipe
+    )
+    if transports is not None:
+        transports.append(transport)
+    writer = asyncio.StreamWriter(transport, protocol, None, loop)
+    try:
+        writer.write(data)
+        await writer.drain()
+    except (BrokenPipeError, ConnectionResetError):
+        # The program exited without reading all of its input
+        pass
+    finally:
+        transport.close()
+
+
+async def feed_pipe(pipe, chunks, transports=None):
+    """Write each text chunk of an async iterable to a pipe as it comes, then close it"""
+    loop = asyncio.get_running_loop()
+    transport, protocol = await loop.connect_write_pipe(
+        lambda: asyncio.StreamReaderProtocol(asyncio.StreamReader()), pipe
+    )
+    if transports is not None:
+        transports.append(transport)
+    writer = asyncio.StreamWriter(transport, protocol, None, loop)
+    try:
+        async for chunk in chunks:
+            writer.write(chunk.encode('utf-8'))
+            await writer.drain()
+    except (BrokenPipeError, ConnectionResetError):
+        pass
+    finally:
+        transport.close()
+
+
+def close_pipes(pipes, transports):
+    """Close the transports, and the pipes no transport took over.
+
+    A transport closes its pipe itself, asynchronously under uvloop; closing
+    the pipe again from here would pull the descriptor out from under it.
+    """
+    for transport in transports:
+        transport.close()
+    owned = {id(transport.get_extra_info('pipe')) for transport in transports}
+    for pipe in pipes:
+        if pipe is not None and id(pipe) not in owned:
+            pipe.close()
+
+
+def kill_process_group(pid):
+    """SIGKILL every process in the group led by pid"""
+    if pid is None:
+        return
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+async def _discard(reader):
+    while await reader.read(STREAM_CHUNK_SIZE):
+        pass
+
+
+def normalize_newlines(text):
+    return text.replace('\r\n', '\n')
+
+
+def decode_output(data):
+    return normalize_newlines(data.decode('utf-8', errors='replace'))
+
+
+execution_engine = ExecutionEngine(shared_dir=shared_path("slots"))
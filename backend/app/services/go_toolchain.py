@@ -0,0 +1,107 @@
+"""
+Persistent, size-bounded Go build cache shared by every Go compilation
+"""
+import asyncio
+import os
+import shutil
+import subprocess
+import tempfile
+from app.services.execution_engine import execution_engine
+
+
+class GoToolchain:
+    def __init__(self, cache_dir=None, max_bytes=None, trim_every=None):
+        self.cache_dir = cache_dir or os.getenv(
+            "GO_BUILD_CACHE_DIR", os.path.join(tempfile.gettempdir(), "regen-gocache")
+        )
+        self.max_bytes = max_bytes or int(os.getenv("GO_BUILD_CACHE_MAX_MB", "1024")) * 1024 * 1024
+        # Builds between cache size checks
+        self.trim_every = trim_every or int(os.getenv("GO_BUILD_CACHE_TRIM_EVERY", "100"))
+        self._builds = 0
+        self._warm_task = None
+        self._trim_task = None
+        # Builds share the cache; cleaning it needs it to ourselves
+        self._cache_users = 0
+        self._cleaning = False
+        self._cache_state = asyncio.Condition()
+
+    @property
+    def env(self):
+        """Environment for go commands: our GOCACHE/GOPATH instead of $HOME's"""
+        env = dict(os.environ)
+        env["GOCACHE"] = os.path.join(self.cache_dir, "build")
+        env["GOPATH"] = os.path.join(self.cache_dir, "path")
+        return env
+
+    def warm(self):
+        """Compile the standard library into the cache in the background"""
+        if shutil.which('go') is None or (self._warm_task is not None and not self._warm_task.done()):
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._warm_task = asyncio.ensure_future(self._warm())
+
+    async def _warm(self):
+        try:
+            result = await self._go(['go', 'build', 'std'], timeout=600)
+            if result.returncode != 0:
+                print(f"WARNING: Warming the Go build cache failed: {result.stderr.strip()}")
+        except (OSError, subprocess.TimeoutExpired) as e:
+            print(f"WARNING: Warming the Go build cache failed: {e}")
+
+    async def build(self, source, output, timeout, limits=None):
+        """go build one file into an executable"""
+        result = await self._go(['go', 'build', '-o', output, source], timeout=timeout, limits=limits)
+        self._builds += 1
+        if self._builds % self.trim_every == 0 and (self._trim_task is None or self._trim_task.done()):
+            self._trim_task = asyncio.ensure_future(self.trim())
+        return result
+
+    async def _go(self, cmd, timeout, limits=None):
+        """Run a go command that uses the build cache, never during a clean"""
+        async with self._cache_state:
+            await self._cache_state.wait_for(lambda: not self._cleaning)
+            self._cache_users += 1
+        try:
+            return await execution_engine.run(cmd, timeout=timeout, env=self.env, limits=limits)
+        finally:
+            async with self._cache_state:
+                self._cache_users -= 1
+                self._cache_state.notify_all()
+
+    async def trim(self):
+        """Empty the build cache once it outgrows max_bytes (Go never shrinks it below 5 days of use).
+
+        Waits for running builds, holds new ones back while cleaning, then
+        warms the standard library again.
+        """
+        size = await asyncio.to_thread(_tree_size, self.cache_dir)
+        if size <= self.max_bytes:
+            return
+        print(f"DEBUG: Go build cache is {size // (1024 * 1024)} MB, cleaning")
+        async with self._cache_state:
+            # New builds queue up behind the clean instead of starving it
+            self._cleaning = True
+            await self._cache_state.wait_for(lambda: self._cache_users == 0)
+        try:
+            await execution_engine.run(['go', 'clean', '-cache'], timeout=120, env=self.env)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            print(f"WARNING: Cleaning the Go build cache failed: {e}")
+        finally:
+            async with self._cache_state:
+                self._cleaning = False
+                self._cache_state.notify_all()
+        self.warm()
+
+
+def _tree_size(root):
+    total = 0
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            try:
+                total += os.lstat(os.path.join(dirpath, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+go_toolchain = GoToolchain()
@@ -0,0 +1,77 @@
+"""
+Comparison of program output against expected test-case output
+"""
+import difflib
+import hashlib
+
+
+def normalize_output(text):
+    """Ignore trailing whitespace on each line and trailing blank lines"""
+    lines = [line.rstrip() for line in (text or "").replace('\r\n', '\n').split('\n')]
+    while lines and not lines[-1]:
+        lines.pop()
+    return lines
+
+
+class OutputDigest:
+    """SHA-256 of normalize_output() of text written in chunks, in constant
+    memory, so output too long to keep can still be graded"""
+
+    def __init__(self):
+        self._hash = hashlib.sha256()
+        self._partial = ""
+        # Blank lines seen since the last non-blank one; dropped if nothing follows
+        self._blank = 0
+
+    def write(self, text):
+        lines = (self._partial + text).split('\n')
+        self._partial = lines.pop()
+        self._add(lines)
+
+    def hexdigest(self):
+        digest = self._hash.copy()
+        last = self._partial.rstrip()
+        if last:
+            digest.update(('\n' * self._blank + last + '\n').encode('utf-8'))
+        return digest.hexdigest()
+
+    def _add(self, lines):
+        lines = [line.rstrip() for line in lines]
+        end = len(lines)
+        while end and not lines[end - 1]:
+            end -= 1
+        if end:
+            self._hash.update(('\n' * self._blank + '\n'.join(lines[:end]) + '\n').encode('utf-8'))
+            self._blank = 0
+        self._blank += len(lines) - end
+
+
+def output_digest(text):
+    digest = OutputDigest()
+    digest.write(text or "")
+    return digest.hexdigest()
+
+
+def compare_output(expected, actual, max_diff_lines=40, actual_digest=None):
+    """Return (passed, diff); diff is a unified diff, or None when passed.
+
+    actual_digest (an OutputDigest hex digest of the whole output) grades
+    output that was truncated to actual; the diff then covers the part kept.
+    """
+    expected_lines = normalize_output(expected)
+    actual_lines = normalize_output(actual)
+    if actual_digest is None:
+        passed = expected_lines == actual_lines
+    else:
+        passed = output_digest(expected) == actual_digest
+    if passed:
+        return True, None
+
+    diff = list(difflib.unified_diff(
+        expected_lines, actual_lines, fromfile='expected', tofile='actual', lineterm=''
+    ))
+    if actual_digest is not None:
+        diff.insert(0, "(output truncated: the whole output differs from expected; diff of the part kept)")
+    if len(diff) > max_diff_lines:
+        diff = diff[:max_diff_lines] + [f"... ({len(diff) - max_diff_lines} more diff lines)"]
+    return False, "\n".join(diff)
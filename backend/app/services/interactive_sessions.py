@@ -0,0 +1,183 @@
+"""
+Interactive execution sessions over WebSocket, one subprocess per session.
+
+Protocol (JSON text messages):
+
+    client: {"type": "start", "language": ..., "code": ..., "profile": ...}
+    server: {"type": "started"}, or {"type": "exit", ...} when it could not start
+    client: {"type": "input", "data": "42\\n"} ... and {"type": "eof"} to close stdin
+    server: {"type": "stdout" | "stderr", "data": ...} as the program writes
+    server: {"type": "exit", "exit_code": ..., "error": ..., **usage}, then closes
+"""
+import asyncio
+import os
+import subprocess
+from fastapi import WebSocket, WebSocketDisconnect
+from app.services import metrics
+from app.services.admission import Overloaded
+from app.services.code_executor import code_executor, describe_error
+from app.services.execution_engine import execution_engine
+from app.services.languages import language_registry
+from app.services.shared_state import SharedSlots, shared_path
+
+# Close code asking the client to retry later
+TRY_AGAIN_LATER = 1013
+# Input messages buffered for a program that has not read them yet
+INPUT_QUEUE_SIZE = 16
+
+
+class InteractiveSessions:
+    """Runs sessions as tasks on the event loop; a waiting program costs a
+    process and two pipes, not a thread.
+
+    At most max_sessions run at once on this node (across every API worker
+    when SHARED_STATE_DIR is set); more are turned away, not queued. Each
+    session also holds an execution slot from compilation until its program
+    ends, so sessions and other executions share the engine's capacity; a
+    session that cannot get one in time is turned away too. A session ends
+    when its program exits, after idle_timeout seconds without input or
+    output, or after max_duration seconds in all. CPU and memory are bounded
+    by the run limits like any other execution.
+    """
+
+    def __init__(self, max_sessions=None, idle_timeout=None, max_duration=None, shared_dir=None):
+        self.max_sessions = max_sessions or int(os.getenv("INTERACTIVE_MAX_SESSIONS", "256"))
+        self.idle_timeout = idle_timeout or float(os.getenv("INTERACTIVE_IDLE_SECONDS", "60"))
+        self.max_duration = max_duration or int(os.getenv("INTERACTIVE_MAX_SECONDS", "600"))
+        self._slots = SharedSlots(shared_dir, "sessions", self.max_sessions) if shared_dir else None
+        self.active = 0
+        self.stats = {"started": 0, "rejected": 0, "idle": 0}
+
+    def _open(self):
+        """A ticket for one session, or None at the cap"""
+        if self._slots is not None:
+            return self._slots.try_acquire()
+        return self.active if self.active < self.max_sessions else None
+
+    def _close(self, ticket):
+        if self._slots is not None:
+            self._slots.release(ticket)
+
+    async def serve(self, websocket: WebSocket):
+        await websocket.accept()
+        ticket = self._open()
+        if ticket is None:
+            self.stats["rejected"] += 1
+            await _finish(websocket, {'exit_code': None, 'error': "Too many interactive sessions; try again later"},
+                          code=TRY_AGAIN_LATER)
+            return
+        self.active += 1
+        self.stats["started"] += 1
+        metrics.interactive_sessions.inc()
+        try:
+            await self._session(websocket)
+        except WebSocketDisconnect:
+            pass
+        finally:
+            metrics.interactive_sessions.dec()
+            self.active -= 1
+            self._close(ticket)
+
+    async def _session(self, websocket):
+        try:
+            start = await asyncio.wait_for(websocket.receive_json(), self.idle_timeout)
+        except asyncio.TimeoutError:
+            return await self._idle(websocket)
+        except ValueError:
+            start = None
+        if not isinstance(start, dict) or start.get('type') != 'start' or not start.get('code'):
+            return await _finish(websocket, {'exit_code': None, 'error': "Expected a start message with code"})
+
+        language = start.get('language') or ''
+        spec = language_registry.resolve(language)
+        client = websocket.client.host if websocket.client else "anonymous"
+        try:
+            # The program counts against the engine's capacity for as long as it runs
+            async with execution_engine.slot(spec.name if spec else language, client):
+                await self._run(websocket, language, start)
+        except Overloaded as e:
+            await _finish(websocket, {'exit_code': None, 'error': str(e), 'retry_after': e.retry_after},
+                          code=TRY_AGAIN_LATER)
+
+    async def _run(self, websocket, language, start):
+        try:
+            program, error = await code_executor.prepare(language, start['code'], start.get('profile'))
+        except subprocess.TimeoutExpired as e:
+            program, error = None, f"Compilation timeout ({e.timeout} seconds exceeded)"
+        except Exception as e:
+            program, error = None, describe_error(language, e)
+        if error:
+            return await _finish(websocket, {'exit_code': None, 'error': error})
+        await websocket.send_json({'type': 'started'})
+
+        loop = asyncio.get_running_loop()
+        last_active = [loop.time()]
+        # Full while the program does not read: the socket is then not read either
+        stdin = asyncio.Queue(maxsize=INPUT_QUEUE_SIZE)
+
+        async def chunks():
+            while (data := await stdin.get()) is not None:
+                yield data
+
+        async def read_input():
+            while True:
+                try:
+                    message = await websocket.receive_json()
+                except ValueError:
+                    continue
+                last_active[0] = loop.time()
+                if not isinstance(message, dict):
+                    continue
+                if message.get('type') == 'input' and isinstance(message.get('data'), str):
+                    await stdin.put(message['data'])
+                elif message.get('type') == 'eof':
+                    await stdin.put(None)
+
+        events = code_executor.execute_interactive(program, chunks(), self.max_duration)
+        reader = asyncio.ensure_future(read_input())
+        pending = asyncio.ensure_future(events.__anext__())
+        try:
+            while True:
+                idle_left = last_active[0] + self.idle_timeout - loop.time()
+                done, _ = await asyncio.wait(
+                    {pending, reader}, timeout=max(idle_left, 0), return_when=asyncio.FIRST_COMPLETED
+                )
+                if reader in done:
+                    # Only ends when the client goes away (WebSocketDisconnect)
+                    reader.result()
+                    return
+                if pending not in done:
+                    if loop.time() >= last_active[0] + self.idle_timeout:
+                        return await self._idle(websocket)
+                    continue
+                try:
+                    name, data = pending.result()
+                except StopAsyncIteration:
+                    return await _finish(websocket, {'exit_code': None, 'error': None})
+                last_active[0] = loop.time()
+                if name == 'exit':
+                    return await _finish(websocket, data)
+                await websocket.send_json({'type': name, 'data': data})
+                pending = asyncio.ensure_future(events.__anext__())
+        finally:
+            for task in (reader, pending):
+                task.cancel()
+            await asyncio.gather(reader, pending, return_exceptions=True)
+            # Kills the program if it is still running
+            await events.aclose()
+
+    async def _idle(self, websocket):
+        self.stats["idle"] += 1
+        await _finish(websocket, {'exit_code': None, 'error': f"Session idle for {self.idle_timeout:g} seconds; closed"})
+
+
+async def _finish(websocket, result, code=1000):
+    """Send the exit message and close; the client may already be gone"""
+    try:
+        await websocket.send_json({'type': 'exit', **result})
+        await websocket.close(code)
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+
+
+interactive_sessions = InteractiveSessions(shared_dir=shared_path("sessions"))
@@ -0,0 +1,171 @@
+"""
+Durable execution job queue in SQLite, shared by the API and worker processes
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class JobQueue:
+    """Jobs move queued -> running -> done | failed.
+
+    A worker claims a job with a lease and renews it while the job runs. A
+    job whose lease ran out (its worker died) goes back to the queue until
+    it has been attempted max_attempts times. Finished jobs are deleted
+    result_ttl seconds after they finish.
+    """
+
+    def __init__(self, db_path=None, lease_seconds=None, max_attempts=None, result_ttl=None):
+        self.db_path = db_path or os.getenv(
+            "JOB_QUEUE_DB", os.path.join(tempfile.gettempdir(), "regen-jobs.sqlite3")
+        )
+        self.lease_seconds = lease_seconds or int(os.getenv("JOB_LEASE_SECONDS", "30"))
+        self.max_attempts = max_attempts or int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+        self.result_ttl = result_ttl or int(os.getenv("JOB_RESULT_TTL_SECONDS", str(3600)))
+        self._conn = None
+        # Serializes use of the shared connection by worker threads
+        self._db_lock = threading.Lock()
+
+    def _db(self):
+        """The connection, opened (and the table created) on first use"""
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=10, check_same_thread=False, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, kind TEXT NOT NULL, payload TEXT NOT NULL, status TEXT NOT NULL,"
+                "attempts INTEGER NOT NULL DEFAULT 0, result TEXT, error TEXT, worker TEXT,"
+                "created REAL NOT NULL, started REAL, finished REAL, lease_until REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created)")
+            self._conn = conn
+        return self._conn
+
+    async def _call(self, fn, *args):
+        def locked():
+            with self._db_lock:
+                return fn(self._db(), *args)
+        return await asyncio.to_thread(locked)
+
+    async def submit(self, kind, payload):
+        """Queue a job; returns its id"""
+        job_id = uuid.uuid4().hex
+        await self._call(self._insert, job_id, kind, json.dumps(payload), time.time())
+        return job_id
+
+    async def get(self, job_id):
+        """The job as a dict (payload and result decoded), or None"""
+        row = await self._call(lambda conn: conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+        return _decode(row) if row else None
+
+    async def claim(self, worker, kinds=None):
+        """Lease the oldest runnable job to worker; returns it, or None when there is none"""
+        row = await self._call(self._claim, worker, list(kinds or []), time.time())
+        return _decode(row) if row else None
+
+    async def renew(self, job_id, worker):
+        """Extend worker's lease; False when the job is no longer leased to it"""
+        return await self._call(self._renew, job_id, worker, time.time())
+
+    async def complete(self, job_id, worker, result):
+        return await self._call(self._finish, job_id, worker, DONE, json.dumps(result), None, time.time())
+
+    async def fail(self, job_id, worker, error, retry=False):
+        """Record a failure; with retry the job is queued again while it has attempts left"""
+        return await self._call(self._fail, job_id, worker, error, retry, time.time())
+
+    async def expire(self):
+        """Delete finished jobs older than result_ttl; returns how many"""
+        return await self._call(self._expire, time.time() - self.result_ttl)
+
+    async def counts(self):
+        """{status: number of jobs}"""
+        rows = await self._call(lambda conn: conn.execute(
+            "SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        return {status: count for status, count in rows}
+
+    def _insert(self, conn, job_id, kind, payload, now):
+        conn.execute(
+            "INSERT INTO jobs (id, kind, payload, status, created) VALUES (?, ?, ?, ?, ?)",
+            (job_id, kind, payload, QUEUED, now),
+        )
+
+    def _claim(self, conn, worker, kinds, now):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Leases that ran out: the worker died or hung
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = 'Worker lost: gave up after ' || attempts || ' attempts',"
+                " finished = ?, lease_until = NULL WHERE status = ? AND lease_until < ? AND attempts >= ?",
+                (FAILED, now, RUNNING, now, self.max_attempts),
+            )
+            conn.execute(
+                "UPDATE jobs SET status = ?, worker = NULL, lease_until = NULL"
+                " WHERE status = ? AND lease_until < ?",
+                (QUEUED, RUNNING, now),
+            )
+            kind_filter = f" AND kind IN ({','.join('?' * len(kinds))})" if kinds else ""
+            row = conn.execute(
+                "UPDATE jobs SET status = ?, worker = ?, attempts = attempts + 1, started = ?, lease_until = ?"
+                " WHERE id = (SELECT id FROM jobs WHERE status = ?" + kind_filter +
+                " ORDER BY created LIMIT 1) RETURNING *",
+                (RUNNING, worker, now, now + self.lease_seconds, QUEUED, *kinds),
+            ).fetchone()
+            conn.execute("COMMIT")
+            return row
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _renew(self, conn, job_id, worker, now):
+        cursor = conn.execute(
+            "UPDATE jobs SET lease_until = ? WHERE id = ? AND worker = ? AND status = ?",
+            (now + self.lease_seconds, job_id, worker, RUNNING),
+        )
+        return cursor.rowcount == 1
+
+    def _finish(self, conn, job_id, worker, status, result, error, now):
+        cursor = conn.execute(
+            "UPDATE jobs SET status = ?, result = ?, error = ?, finished = ?, lease_until = NULL"
+            " WHERE id = ? AND worker = ? AND status = ?",
+            (status, result, error, now, job_id, worker, RUNNING),
+        )
+        return cursor.rowcount == 1
+
+    def _fail(self, conn, job_id, worker, error, retry, now):
+        if retry:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, worker = NULL, lease_until = NULL"
+                " WHERE id = ? AND worker = ? AND status = ? AND attempts < ?",
+                (QUEUED, error, job_id, worker, RUNNING, self.max_attempts),
+            )
+            if cursor.rowcount == 1:
+                return True
+        return self._finish(conn, job_id, worker, FAILED, None, error, now)
+
+    def _expire(self, conn, oldest):
+        return conn.execute(
+            "DELETE FROM jobs WHERE status IN (?, ?) AND finished < ?", (DONE, FAILED, oldest)
+        ).rowcount
+
+
+def _decode(row):
+    job = dict(row)
+    job["payload"] = json.loads(job["payload"])
+    job["result"] = json.loads(job["result"]) if job["result"] is not None else None
+    return job
+
+
+job_queue = JobQueue()
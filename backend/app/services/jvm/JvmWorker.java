@@ -0,0 +1,288 @@
+import java.io.BufferedInputStream;
+import java.io.BufferedOutputStream;
+import java.io.ByteArrayInputStream;
+import java.io.ByteArrayOutputStream;
+import java.io.DataInputStream;
+import java.io.File;
+import java.io.FileInputStream;
+import java.io.FileOutputStream;
+import java.io.IOException;
+import java.io.InputStream;
+import java.io.OutputStream;
+import java.io.PrintStream;
+import java.lang.reflect.InvocationTargetException;
+import java.lang.reflect.Method;
+import java.net.URL;
+import java.net.URLClassLoader;
+import java.nio.charset.StandardCharsets;
+import java.util.ArrayList;
+import java.util.List;
+import java.util.jar.JarFile;
+
+/**
+ * Long-lived JVM that runs submitted programs in isolated class loaders.
+ *
+ * The protocol uses its own pipes, passed as file descriptor numbers in
+ * -Dregen.requestFd and -Dregen.responseFd, so nothing a program does with
+ * System.out, System.in or FileDescriptor.out can reach it. Requests arrive
+ * as one header line
+ *     COMMAND \t arg1 \t arg2 \t payloadLength \n
+ * followed by payloadLength bytes. Commands:
+ *     RUN      classpath  mainClass (or "-" to read a jar manifest)  payload = program stdin
+ *     JAVAC    outDir     sourceFile
+ *     KOTLINC  outJar     sourceFile   (needs kotlin-compiler.jar on the classpath)
+ * Every response is one header line
+ *     exitCode \t stdoutLength \t stderrLength \t droppedBytes \t dirty \n
+ * followed by the stdout and stderr bytes. If the program calls System.exit the
+ * exit code is reported as "X" and the worker terminates with that status.
+ * dirty is 1 when the program left threads running; such a worker must not
+ * be given another job.
+ *
+ * Program output beyond -Dregen.maxOutputBytes is discarded and the next write
+ * throws OutputLimitError, which normally ends the program.
+ */
+public class JvmWorker {
+    // The worker's fd 0 and 1 are /dev/null, so stray program output goes nowhere
+    private static final PrintStream ORIGINAL_OUT = System.out;
+    private static final PrintStream ORIGINAL_ERR = System.err;
+    private static final InputStream ORIGINAL_IN = System.in;
+
+    private static final long MAX_OUTPUT_BYTES = Long.getLong("regen.maxOutputBytes", 16L * 1024 * 1024);
+
+    private static OutputStream protocolOut;
+    private static volatile ByteArrayOutputStream jobOut;
+    private static volatile ByteArrayOutputStream jobErr;
+    private static volatile long jobOutputBytes;
+    private static volatile long droppedBytes;
+    private static volatile boolean jobDirty;
+
+    /** Thrown into the program when its output exceeds MAX_OUTPUT_BYTES. */
+    static class OutputLimitError extends Error {
+        OutputLimitError() {
+            super("Output limit of " + MAX_OUTPUT_BYTES + " bytes exceeded");
+        }
+    }
+
+    /** Shares one byte budget between a job's stdout and stderr. */
+    static class CappedOutputStream extends OutputStream {
+        private final ByteArrayOutputStream target;
+
+        CappedOutputStream(ByteArrayOutputStream target) {
+            this.target = target;
+        }
+
+        @Override
+        public void write(int b) {
+            write(new byte[] {(byte) b}, 0, 1);
+        }
+
+        @Override
+        public void write(byte[] b, int off, int len) {
+            synchronized (CappedOutputStream.class) {
+                long room = MAX_OUTPUT_BYTES - jobOutputBytes;
+                int kept = (int) Math.max(0, Math.min(len, room));
+                target.write(b, off, kept);
+                jobOutputBytes += kept;
+                if (kept < len) {
+                    droppedBytes += len - kept;
+                    throw new OutputLimitError();
+                }
+            }
+        }
+    }
+
+    public static void main(String[] args) throws Exception {
+        protocolOut = new BufferedOutputStream(new FileOutputStream("/dev/fd/" + Integer.getInteger("regen.responseFd")));
+        DataInputStream protocolIn = new DataInputStream(new BufferedInputStream(
+            new FileInputStream("/dev/fd/" + Integer.getInteger("regen.requestFd"))));
+
+        Runtime.getRuntime().addShutdownHook(new Thread(JvmWorker::reportExit));
+        warmUp();
+        protocolOut.write("READY\n".getBytes(StandardCharsets.UTF_8));
+        protocolOut.flush();
+
+        String header;
+        while ((header = readLine(protocolIn)) != null) {
+            String[] fields = header.split("\t", -1);
+            byte[] payload = new byte[Integer.parseInt(fields[3])];
+            protocolIn.readFully(payload);
+
+            jobOut = new ByteArrayOutputStream();
+            jobErr = new ByteArrayOutputStream();
+            jobOutputBytes = 0;
+            droppedBytes = 0;
+            jobDirty = false;
+            int exitCode;
+            switch (fields[0]) {
+                case "RUN":
+                    exitCode = runProgram(fields[1], fields[2], payload);
+                    break;
+                case "JAVAC":
+                    exitCode = compileJava(fields[1], fields[2]);
+                    break;
+                case "KOTLINC":
+                    exitCode = compileKotlin(fields[1], fields[2]);
+                    break;
+                default:
+                    jobErr.write(("Unknown command " + fields[0]).getBytes(StandardCharsets.UTF_8));
+                    exitCode = 2;
+            }
+            respond(String.valueOf(exitCode));
+        }
+    }
+
+    private static void warmUp() {
+        String[] classes = {
+            "java.util.Scanner", "java.io.BufferedReader", "java.io.InputStreamReader",
+            "java.util.ArrayList", "java.util.HashMap", "java.util.stream.Collectors",
+            "java.math.BigInteger", "java.math.BigDecimal", "java.util.regex.Pattern",
+        };
+        for (String name : classes) {
+            try {
+                Class.forName(name);
+            } catch (ClassNotFoundException ignored) {
+            }
+        }
+        new java.util.Scanner("1 warm").nextInt();
+    }
+
+    private static int runProgram(String classpath, String mainClass, byte[] stdin) throws IOException {
+        List<URL> urls = new ArrayList<>();
+        for (String entry : classpath.split(File.pathSeparator)) {
+            urls.add(new File(entry).toURI().toURL());
+        }
+        if (mainClass.equals("-")) {
+            try (JarFile jar = new JarFile(classpath.split(File.pathSeparator)[0])) {
+                mainClass = jar.getManifest().getMainAttributes().getValue("Main-Class");
+            }
+        }
+
+        PrintStream out = new PrintStream(new CappedOutputStream(jobOut), true, "UTF-8");
+        PrintStream err = new PrintStream(new CappedOutputStream(jobErr), true, "UTF-8");
+        System.setIn(new ByteArrayInputStream(stdin));
+        System.setOut(out);
+        System.setErr(err);
+
+        final int[] exitCode = {0};
+        final String mainClassName = mainClass;
+        try (URLClassLoader loader = new URLClassLoader(urls.toArray(new URL[0]), ClassLoader.getPlatformClassLoader())) {
+            ThreadGroup group = new ThreadGroup("job");
+            Thread main = new Thread(group, () -> {
+                try {
+                    Class<?> cls = Class.forName(mainClassName, true, loader);
+                    Method entry = cls.getMethod("main", String[].class);
+                    entry.invoke(null, (Object) new String[0]);
+                } catch (InvocationTargetException e) {
+                    exitCode[0] = 1;
+                    if (droppedBytes == 0) {
+                        err.print("Exception in thread \"main\" ");
+                        e.getCause().printStackTrace(err);
+                    }
+                } catch (ReflectiveOperationException | LinkageError e) {
+                    err.println("Error: could not run main class " + mainClassName);
+                    err.println(e);
+                    exitCode[0] = 1;
+                }
+            }, "main");
+            main.setContextClassLoader(loader);
+            main.start();
+            joinQuietly(main);
+
+            // Like a normal JVM, wait for non-daemon threads the program started
+            Thread[] threads = new Thread[group.activeCount() + 16];
+            int count = group.enumerate(threads);
+            for (int i = 0; i < count; i++) {
+                if (!threads[i].isDaemon()) {
+                    joinQuietly(threads[i]);
+                }
+            }
+            // Daemon threads would keep printing into later jobs' output
+            jobDirty = group.activeCount() > 0;
+        } finally {
+            out.flush();
+            err.flush();
+            System.setIn(ORIGINAL_IN);
+            System.setOut(ORIGINAL_OUT);
+            System.setErr(ORIGINAL_ERR);
+        }
+        return exitCode[0];
+    }
+
+    private static int compileJava(String outDir, String sourceFile) {
+        javax.tools.JavaCompiler compiler = javax.tools.ToolProvider.getSystemJavaCompiler();
+        if (compiler == null) {
+            jobErr.writeBytes("javac is not available in this JVM".getBytes(StandardCharsets.UTF_8));
+            return 2;
+        }
+        return compiler.run(null, jobOut, jobErr, "-d", outDir, sourceFile);
+    }
+
+    private static int compileKotlin(String outJar, String sourceFile) throws IOException {
+        PrintStream err = new PrintStream(jobErr, true, "UTF-8");
+        try {
+            Class<?> cls = Class.forName("org.jetbrains.kotlin.cli.jvm.K2JVMCompiler");
+            Object compiler = cls.getDeclaredConstructor().newInstance();
+            Method exec = cls.getMethod("exec", PrintStream.class, String[].class);
+            List<String> args = new ArrayList<>(List.of(sourceFile, "-include-runtime", "-d", outJar));
+            String kotlinHome = System.getProperty("kotlin.home");
+            if (kotlinHome != null) {
+                args.add("-kotlin-home");
+                args.add(kotlinHome);
+            }
+            Object result = exec.invoke(compiler, err, (Object) args.toArray(new String[0]));
+            return (Integer) result.getClass().getMethod("getCode").invoke(result);
+        } catch (InvocationTargetException e) {
+            e.getCause().printStackTrace(err);
+            return 2;
+        } catch (ReflectiveOperationException e) {
+            err.println("Kotlin compiler is not available in this worker: " + e);
+            return 2;
+        } finally {
+            err.flush();
+        }
+    }
+
+    private static void reportExit() {
+        // Shutdown hook: the program called System.exit, or the worker is being stopped
+        if (jobOut != null) {
+            try {
+                respond("X");
+            } catch (IOException ignored) {
+            }
+        }
+    }
+
+    private static synchronized void respond(String status) throws IOException {
+        byte[] out = jobOut.toByteArray();
+        byte[] err = jobErr.toByteArray();
+        jobOut = null;
+        jobErr = null;
+        String header = status + "\t" + out.length + "\t" + err.length + "\t" + droppedBytes
+            + "\t" + (jobDirty ? 1 : 0) + "\n";
+        protocolOut.write(header.getBytes(StandardCharsets.UTF_8));
+        protocolOut.write(out);
+        protocolOut.write(err);
+        protocolOut.flush();
+    }
+
+    private static void joinQuietly(Thread thread) {
+        while (thread.isAlive()) {
+            try {
+                thread.join();
+            } catch (InterruptedException ignored) {
+            }
+        }
+    }
+
+    private static String readLine(DataInputStream in) throws IOException {
+        ByteArrayOutputStream line = new ByteArrayOutputStream();
+        int b;
+        while ((b = in.read()) != -1) {
+            if (b == '\n') {
+                return line.toString("UTF-8");
+            }
+            line.write(b);
+        }
+        return line.size() > 0 ? line.toString("UTF-8") : null;
+    }
+}
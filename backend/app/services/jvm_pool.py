@@ -0,0 +1,119 @@
+"""
+Pool of long-lived, pre-warmed JVM workers for Java and Kotlin
+"""
+import asyncio
+import hashlib
+import os
+import shutil
+import subprocess
+import tempfile
+from app.services.execution_engine import OUTPUT_HARD_LIMIT_BYTES, decode_output
+from app.services.resource_limits import COMPILE_LIMITS, RUN_LIMITS
+from app.services.worker_pool import WorkerPool
+
+WORKER_SOURCE = os.path.join(os.path.dirname(__file__), 'jvm', 'JvmWorker.java')
+
+
+class JvmWorkerPool(WorkerPool):
+    name = "JVM worker"
+
+    def __init__(self, size, max_jobs, classpath=(), jvm_options=(), overhead_mb=0):
+        # Compile jobs get the larger limits
+        super().__init__(size, max_jobs, limits=COMPILE_LIMITS, overhead_mb=overhead_mb)
+        self.classpath = list(classpath)
+        self.jvm_options = list(jvm_options)
+        self._classes_dir = None
+
+    @property
+    def enabled(self):
+        return self.size > 0 and shutil.which('java') is not None and shutil.which('javac') is not None
+
+    async def run(self, classpath, main_class, user_inputs, timeout=10):
+        """Run main_class ("-" for a jar's Main-Class) from classpath entries"""
+        return await self._submit(
+            'RUN', os.pathsep.join(classpath), main_class, (user_inputs or "").encode('utf-8'), timeout, RUN_LIMITS
+        )
+
+    async def compile_java(self, out_dir, source_file, timeout=15):
+        return await self._submit('JAVAC', out_dir, source_file, b"", timeout, COMPILE_LIMITS)
+
+    async def compile_kotlin(self, out_jar, source_file, timeout=20):
+        return await self._submit('KOTLINC', out_jar, source_file, b"", timeout, COMPILE_LIMITS)
+
+    async def _command(self, request_fd, response_fd):
+        classes_dir = await self._worker_classes()
+        return [
+            'java', *self.jvm_options,
+            f'-Dregen.requestFd={request_fd}', f'-Dregen.responseFd={response_fd}',
+            '-cp', os.pathsep.join([classes_dir, *self.classpath]), 'JvmWorker',
+        ]
+
+    async def _worker_classes(self):
+        """Compile JvmWorker.java once per source version"""
+        if self._classes_dir:
+            return self._classes_dir
+        with open(WORKER_SOURCE, 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()[:16]
+        classes_dir = os.path.join(tempfile.gettempdir(), f'regen-jvm-worker-{digest}')
+        if not os.path.exists(os.path.join(classes_dir, 'JvmWorker.class')):
+            os.makedirs(classes_dir, exist_ok=True)
+            proc = await asyncio.create_subprocess_exec(
+                'javac', '-d', classes_dir, WORKER_SOURCE,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE,
+            )
+            _, stderr = await proc.communicate()
+            if proc.returncode != 0:
+                raise RuntimeError(f"Failed to compile JVM worker:\n{decode_output(stderr)}")
+        self._classes_dir = classes_dir
+        return classes_dir
+
+
+def _kotlin_home():
+    home = os.getenv("KOTLIN_HOME")
+    if not home and shutil.which('kotlinc'):
+        home = os.path.dirname(os.path.dirname(os.path.realpath(shutil.which('kotlinc'))))
+    return home
+
+
+def _kotlin_compiler_daemon():
+    home = _kotlin_home()
+    compiler_jar = os.path.join(home, 'lib', 'kotlin-compiler.jar') if home else None
+    size = int(os.getenv("KOTLINC_DAEMON_SIZE", "1"))
+    if not compiler_jar or not os.path.exists(compiler_jar):
+        size = 0
+    return JvmWorkerPool(
+        size=size,
+        max_jobs=int(os.getenv("KOTLINC_DAEMON_MAX_JOBS", "200")),
+        classpath=[compiler_jar] if compiler_jar else [],
+        jvm_options=[
+            '-Xss8m', f'-Xmx{KOTLINC_HEAP_MB}m', f'-Dkotlin.home={home}', *os.getenv("JVM_WORKER_OPTS", "").split(),
+        ],
+        overhead_mb=JVM_OVERHEAD_MB,
+    )
+
+
+# Heap of a pooled JVM, and what the JVM itself needs beyond it (metaspace,
+# code cache, thread stacks), which the worker's memory limit leaves room for
+JVM_HEAP_MB = int(os.getenv("JVM_WORKER_HEAP_MB", str(RUN_LIMITS.memory_mb or 512)))
+JVM_STACK_SIZE = os.getenv("JVM_WORKER_STACK_SIZE", "8m")
+JVM_OVERHEAD_MB = int(os.getenv("JVM_WORKER_OVERHEAD_MB", "512"))
+KOTLINC_HEAP_MB = int(os.getenv("KOTLINC_DAEMON_HEAP_MB", str(COMPILE_LIMITS.memory_mb or 2048)))
+
+JVM_OPTIONS = [
+    '-XX:+UseSerialGC',
+    '-Xshare:auto',
+    # A program's heap and its threads' stacks, as a lone JVM would get from RUN_LIMITS
+    f'-Xmx{JVM_HEAP_MB}m',
+    f'-Xss{JVM_STACK_SIZE}',
+    f'-Dregen.maxOutputBytes={OUTPUT_HARD_LIMIT_BYTES}',
+    *os.getenv("JVM_WORKER_OPTS", "").split(),
+]
+
+jvm_pool = JvmWorkerPool(
+    size=int(os.getenv("JVM_POOL_SIZE", "2")),
+    max_jobs=int(os.getenv("JVM_WORKER_MAX_JOBS", "100")),
+    jvm_options=JVM_OPTIONS,
+    overhead_mb=JVM_OVERHEAD_MB,
+)
+kotlinc_daemon = _kotlin_compiler_daemon()
@@ -0,0 +1,201 @@
+"""
+Registry of supported languages: aliases, toolchain commands and probe results
+"""
+import asyncio
+import os
+import shutil
+import subprocess
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+from app.services.execution_engine import execution_engine
+
+EXE_NAME = 'main.exe' if os.name == 'nt' else 'main'
+
+
+@dataclass
+class LanguageSpec:
+    """How to build and run one language.
+
+    Commands are argument lists; "{source}" and "{build_dir}" are replaced
+    with the source file path and the (cached) build directory. flags are
+    appended to compile_cmd and are part of the artifact cache key, as are
+    the extra flags of the selected compile profile.
+    """
+    name: str
+    display_name: str
+    source_file: str
+    run_cmd: List[str]
+    version_cmd: List[str]
+    missing_message: str
+    aliases: Tuple[str, ...] = ()
+    compile_cmd: Optional[List[str]] = None
+    flags: List[str] = field(default_factory=list)
+    # Executables that must be on PATH; defaults to version_cmd[0]
+    requires: Tuple[str, ...] = ()
+    compile_timeout: int = 15
+    run_timeout: int = 10
+    profiles: Dict[str, List[str]] = field(default_factory=dict)
+    default_profile: Optional[str] = None
+    # Headers worth precompiling (see precompiled_headers)
+    pch_headers: Tuple[str, ...] = ()
+
+    @property
+    def compiled(self):
+        return self.compile_cmd is not None
+
+    def compile_flags(self, profile=None):
+        """flags plus those of the profile; raises ValueError for unknown profiles"""
+        if not self.profiles:
+            return list(self.flags)
+        profile = profile or self.default_profile
+        if profile not in self.profiles:
+            raise ValueError(f"Unknown compile profile '{profile}' for {self.display_name}")
+        return [*self.flags, *self.profiles[profile]]
+
+    def command(self, template, source=None, build_dir=None):
+        return [arg.format(source=source, build_dir=build_dir) for arg in template]
+
+
+# Quick feedback by default; "optimized" for benchmark-style runs
+C_PROFILES = {'fast': ['-O0'], 'optimized': ['-O2']}
+
+LANGUAGES = [
+    LanguageSpec(
+        'python', 'Python', 'main.py', ['python', '{source}'], ['python', '--version'],
+        "Python not found. Please install Python.", aliases=('py', 'python3'),
+    ),
+    LanguageSpec(
+        'javascript', 'JavaScript', 'main.js', ['node', '{source}'], ['node', '--version'],
+        "Node.js not found. Please install Node.js.", aliases=('js', 'node'),
+    ),
+    LanguageSpec(
+        'java', 'Java', 'Main.java', ['java', '-cp', '{build_dir}'], ['javac', '-version'],
+        "Java compiler (javac) not found. Please install JDK.",
+        compile_cmd=['javac', '{source}'], requires=('javac', 'java'),
+    ),
+    LanguageSpec(
+        'cpp', 'C++', 'main.cpp', [os.path.join('{build_dir}', EXE_NAME)], ['g++', '--version'],
+        "C++ compiler (g++) not found. Please install GCC.", aliases=('c++', 'cxx'),
+        compile_cmd=['g++', '{source}', '-o', os.path.join('{build_dir}', EXE_NAME)], flags=['-std=c++17'],
+        profiles=C_PROFILES, default_profile='fast',
+        pch_headers=('bits/stdc++.h', 'iostream', 'vector', 'algorithm', 'string'),
+    ),
+    LanguageSpec(
+        'c', 'C', 'main.c', [os.path.join('{build_dir}', EXE_NAME)], ['gcc', '--version'],
+        "C compiler (gcc) not found. Please install GCC.",
+        compile_cmd=['gcc', '{source}', '-o', os.path.join('{build_dir}', EXE_NAME)],
+        profiles=C_PROFILES, default_profile='fast',
+    ),
+    LanguageSpec(
+        'csharp', 'C#', 'Program.cs', ['dotnet', os.path.join('{build_dir}', 'Program.dll')], ['dotnet', '--version'],
+        "C# compiler not found. Please install .NET SDK or Mono.", aliases=('cs', 'c#'),
+        compile_cmd=['dotnet', 'build', '{source}', '-o', '{build_dir}'],
+    ),
+    LanguageSpec(
+        'go', 'Go', 'main.go', [os.path.join('{build_dir}', EXE_NAME)], ['go', 'version'],
+        "Go compiler not found. Please install Go.", aliases=('golang',),
+        compile_cmd=['go', 'build', '-o', os.path.join('{build_dir}', EXE_NAME), '{source}'], compile_timeout=30,
+    ),
+    LanguageSpec(
+        'rust', 'Rust', 'main.rs', [os.path.join('{build_dir}', EXE_NAME)], ['rustc', '--version'],
+        "Rust compiler not found. Please install Rust.", aliases=('rs',),
+        compile_cmd=['rustc', '{source}', '-o', os.path.join('{build_dir}', EXE_NAME)], compile_timeout=20,
+    ),
+    LanguageSpec(
+        'typescript', 'TypeScript', 'main.ts', ['node', os.path.join('{build_dir}', 'main.js')], ['tsc', '--version'],
+        "TypeScript not found. Please install TypeScript (npm install -g typescript).", aliases=('ts',),
+        compile_cmd=['tsc', '{source}', '--outDir', '{build_dir}'],
+        flags=['--target', 'es2020', '--module', 'commonjs', '--skipLibCheck'], requires=('tsc', 'node'),
+    ),
+    LanguageSpec(
+        'php', 'PHP', 'main.php', ['php', '{source}'], ['php', '--version'],
+        "PHP not found. Please install PHP.",
+    ),
+    LanguageSpec(
+        'ruby', 'Ruby', 'main.rb', ['ruby', '{source}'], ['ruby', '--version'],
+        "Ruby not found. Please install Ruby.", aliases=('rb',),
+    ),
+    LanguageSpec(
+        'swift', 'Swift', 'main.swift', ['swift', '{source}'], ['swift', '--version'],
+        "Swift not found. Please install Swift.", run_timeout=15,
+    ),
+    LanguageSpec(
+        'kotlin', 'Kotlin', 'Main.kt', ['java', '-jar', os.path.join('{build_dir}', 'main.jar')], ['kotlinc', '-version'],
+        "Kotlin compiler not found. Please install Kotlin.", aliases=('kt',),
+        compile_cmd=['kotlinc', '{source}', '-d', os.path.join('{build_dir}', 'main.jar')],
+        flags=['-include-runtime'], requires=('kotlinc', 'java'), compile_timeout=20,
+    ),
+]
+
+
+class LanguageRegistry:
+    def __init__(self, specs):
+        self._specs = {spec.name: spec for spec in specs}
+        self._aliases = {}
+        for spec in specs:
+            for alias in (spec.name, *spec.aliases):
+                self._aliases[alias] = spec
+        self._probes = {}
+        self._probe_lock = asyncio.Lock()
+
+    def resolve(self, name):
+        """Return the spec for a language name or alias, or None"""
+        return self._aliases.get((name or "").strip().lower())
+
+    def get(self, name):
+        return self._specs[name]
+
+    async def probe(self):
+        """Check every toolchain concurrently; results are kept for the process lifetime"""
+        async with self._probe_lock:
+            pending = [spec for spec in self._specs.values() if spec.name not in self._probes]
+            results = await asyncio.gather(*(self._probe(spec) for spec in pending))
+            for spec, result in zip(pending, results):
+                self._probes[spec.name] = result
+                state = result['version'].splitlines()[0] if result['version'] else 'unavailable'
+                print(f"DEBUG: Toolchain {spec.name}: {state}")
+
+    async def _probe(self, spec):
+        missing = [exe for exe in (spec.requires or spec.version_cmd[:1]) if shutil.which(exe) is None]
+        if missing:
+            return {'available': False, 'version': None}
+        try:
+            result = await execution_engine.run(spec.version_cmd, timeout=30)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            print(f"WARNING: Probing {spec.name} failed: {e}")
+            return {'available': False, 'version': None}
+        banner = (result.stdout + result.stderr).strip()
+        return {'available': True, 'version': banner}
+
+    async def status(self, name):
+        """Probe result for one language, probing now if startup has not"""
+        if name not in self._probes:
+            await self.probe()
+        return self._probes[name]
+
+    async def available(self, name):
+        return (await self.status(name))['available']
+
+    async def version(self, name):
+        """Full version banner, used in artifact cache keys"""
+        return (await self.status(name))['version'] or ""
+
+    async def describe(self):
+        """Public view of the registry for /api/languages"""
+        await self.probe()
+        languages = []
+        for spec in self._specs.values():
+            probe = self._probes[spec.name]
+            languages.append({
+                'id': spec.name,
+                'name': spec.display_name,
+                'aliases': list(spec.aliases),
+                'compiled': spec.compiled,
+                'profiles': list(spec.profiles),
+                'available': probe['available'],
+                'version': probe['version'].splitlines()[0] if probe['version'] else None,
+            })
+        return languages
+
+
+language_registry = LanguageRegistry(LANGUAGES)
@@ -0,0 +1,346 @@
+"""
+In-process metrics in the Prometheus text exposition format
+"""
+import asyncio
+import bisect
+import fcntl
+import json
+import math
+import os
+import time
+from contextlib import contextmanager
+
+# Seconds; compiles and LLM calls take far longer than most runs
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# Counters and histograms of processes that have exited, next to the <pid>.json snapshots
+RETIRED_SNAPSHOT = "retired.json"
+
+
+class Metric:
+    """One metric family; values are kept per tuple of label values.
+
+    Updates are plain dict and float operations on the event loop thread,
+    cheap enough to leave on for every request.
+    """
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+
+    def samples(self, values=None):
+        """[(suffix, {label: value}, value)] for the exposition"""
+        values = self._values if values is None else values
+        return [('', dict(zip(self.labels, key)), value) for key, value in sorted(values.items())]
+
+    def merged(self, others):
+        """Own values plus other processes' ([[labels, value]] lists, see Registry.snapshot)"""
+        values = dict(self._values)
+        for entries in others:
+            for key, value in entries:
+                key = tuple(key)
+                values[key] = self._add(values[key], value) if key in values else value
+        return values
+
+    @staticmethod
+    def _add(a, b):
+        return a + b
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def set(self, *labels, value):
+        """For counts kept by another component (see Registry.collector)"""
+        self._values[labels] = value
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def inc(self, *labels, amount=1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels, value):
+        self._values[labels] = value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, *labels, value):
+        state = self._values.get(labels)
+        if state is None:
+            # Per-bucket (not cumulative) counts, then sum and count
+            state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        state[0][bisect.bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    @contextmanager
+    def time(self, *labels):
+        """Observe the time the block took, whether or not it raised"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(*labels, value=time.perf_counter() - started)
+
+    @staticmethod
+    def _add(a, b):
+        return [[x + y for x, y in zip(a[0], b[0])], a[1] + b[1], a[2] + b[2]]
+
+    def samples(self, values=None):
+        values = self._values if values is None else values
+        samples = []
+        for key, (counts, total, count) in sorted(values.items()):
+            labels = dict(zip(self.labels, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                samples.append(('_bucket', {**labels, 'le': _format_value(bound)}, cumulative))
+            samples.append(('_sum', labels, total))
+            samples.append(('_count', labels, count))
+        return samples
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        # Called before each scrape to refresh gauges kept elsewhere
+        self._collectors = []
+        # Pid whose values were added to the retired totals; they must not be added twice
+        self._retired_pid = None
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self.register(Counter(name, help, labels))
+
+    def gauge(self, name, help, labels=()):
+        return self.register(Gauge(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def collector(self, fn):
+        """Register fn() to run before every render(); usable as a decorator"""
+        self._collectors.append(fn)
+        return fn
+
+    def _collect(self):
+        for collect in self._collectors:
+            collect()
+
+    def snapshot(self):
+        """This process's values as JSON-able {name: [[labels, value]]}"""
+        self._collect()
+        return {metric.name: [[list(key), value] for key, value in metric._values.items()]
+                for metric in self._metrics}
+
+    def render(self, snapshots=()):
+        """All metrics in the Prometheus text format (version 0.0.4), with
+        other processes' snapshots added in"""
+        self._collect()
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            values = metric.merged([s[metric.name] for s in snapshots if metric.name in s])
+            for suffix, labels, value in metric.samples(values):
+                lines.append(f"{metric.name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def publish(self, directory):
+        """Write this process's snapshot to directory/<pid>.json for the others to merge"""
+        if self._retired_pid == os.getpid():
+            return
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{os.getpid()}.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump(self.snapshot(), f)
+        os.replace(path + ".tmp", path)
+
+    def read_snapshots(self, directory):
+        """Snapshots published by the other processes, and the totals of
+        exited ones (see retire).
+
+        Counters and histograms of exited processes still count (totals must
+        not go down when a worker is replaced); their gauges are dropped.
+        """
+        if not os.path.isdir(directory):
+            return []
+        for pid in _snapshot_pids(directory):
+            if not _alive(pid):
+                # Exited without retiring (crashed); do it for it
+                try:
+                    self.retire(directory, pid)
+                except OSError as e:
+                    print(f"WARNING: Could not retire metrics of process {pid}: {e}")
+        gauges = {metric.name for metric in self._metrics if metric.kind == 'gauge'}
+        snapshots = []
+        # Shared: a process retiring meanwhile shows up in its file or in the totals, not both
+        with _locked(directory, fcntl.LOCK_SH):
+            for pid in _snapshot_pids(directory):
+                snapshot = _load(os.path.join(directory, f"{pid}.json"))
+                if snapshot is None:
+                    continue
+                if not _alive(pid):
+                    snapshot = {name: values for name, values in snapshot.items() if name not in gauges}
+                snapshots.append(snapshot)
+            retired = _load(os.path.join(directory, RETIRED_SNAPSHOT))
+            if retired is not None:
+                snapshots.append(retired)
+        return snapshots
+
+    def retire(self, directory, pid=None):
+        """Add the counters and histograms of process pid (default: this
+        one, which is about to exit) to the retired totals and remove its
+        snapshot, so they keep counting without a file per exited process,
+        and a new process that gets the same pid starts from scratch"""
+        own = pid is None or pid == os.getpid()
+        if own and self._retired_pid == os.getpid():
+            return
+        path = os.path.join(directory, f"{os.getpid() if own else pid}.json")
+        os.makedirs(directory, exist_ok=True)
+        with _locked(directory, fcntl.LOCK_EX):
+            snapshot = self.snapshot() if own else _load(path)
+            if snapshot is None:
+                # Never published, or an unreadable leftover
+                snapshot = {}
+            retired_path = os.path.join(directory, RETIRED_SNAPSHOT)
+            retired = self._merge_snapshot(_load(retired_path) or {}, snapshot)
+            with open(retired_path + ".tmp", "w") as f:
+                json.dump(retired, f)
+            os.replace(retired_path + ".tmp", retired_path)
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+        if own:
+            self._retired_pid = os.getpid()
+
+    def _merge_snapshot(self, totals, snapshot):
+        """totals with the counters and histograms of snapshot added in"""
+        for metric in self._metrics:
+            if metric.kind == 'gauge' or metric.name not in snapshot:
+                continue
+            values = {tuple(key): value for key, value in totals.get(metric.name, [])}
+            for key, value in snapshot[metric.name]:
+                key = tuple(key)
+                values[key] = metric._add(values[key], value) if key in values else value
+            totals[metric.name] = [[list(key), value] for key, value in values.items()]
+        return totals
+
+    async def publish_forever(self, directory, interval):
+        """Publish every interval seconds until cancelled, then retire"""
+        try:
+            while True:
+                try:
+                    self.publish(directory)
+                except OSError as e:
+                    print(f"WARNING: Could not publish metrics: {e}")
+                await asyncio.sleep(interval)
+        finally:
+            try:
+                self.retire(directory)
+            except OSError:
+                pass
+
+
+def _snapshot_pids(directory):
+    """Pids of the other processes with a snapshot in directory"""
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return []
+    pids = [name[:-len(".json")] for name in names if name.endswith(".json")]
+    return [int(pid) for pid in pids if pid.isdigit() and int(pid) != os.getpid()]
+
+
+@contextmanager
+def _locked(directory, operation):
+    fd = os.open(os.path.join(directory, ".lock"), os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        fcntl.flock(fd, operation)
+        yield
+    finally:
+        os.close(fd)
+
+
+def _load(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float):
+        return str(int(value)) if value.is_integer() else repr(value)
+    return str(value)
+
+
+registry = Registry()
+
+compile_seconds = registry.histogram(
+    "regen_compile_seconds", "Compile time of cache misses", ("language", "outcome"))
+run_seconds = registry.histogram(
+    "regen_run_seconds", "Run time of one program execution", ("language", "outcome"))
+request_seconds = registry.histogram(
+    "regen_request_seconds", "Total time of an execution request", ("endpoint", "language", "outcome"))
+llm_seconds = registry.histogram(
+    "regen_llm_seconds", "Upstream completion API latency (whole response)", ("language", "outcome"))
+inflight_jobs = registry.gauge(
+    "regen_inflight_jobs", "Executions holding an execution slot", ("language",))
+interactive_sessions = registry.gauge(
+    "regen_interactive_sessions", "Open interactive WebSocket sessions")
+queued_jobs = registry.gauge(
+    "regen_queue_depth", "Executions waiting for an execution slot", ("language",))
+limit_exceeded = registry.counter(
+    "regen_limit_exceeded_total",
+    "Runs ended by a limit: wall_time (timeout), cpu_time, memory (OOM), file_size or output",
+    ("language", "limit"))
+admission_rejected = registry.counter(
+    "regen_admission_rejected_total",
+    "Executions turned away by admission control: queue_full, client_limit, deadline or timeout",
+    ("reason",))
+cache_lookups = registry.counter(
+    "regen_cache_lookups_total", "Cache lookups by result (hit or miss)", ("cache", "result"))
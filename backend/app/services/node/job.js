@@ -0,0 +1,26 @@
+'use strict';
+/**
+ * Entry point of one job's worker thread (see worker.js): makes the job's
+ * stdin readable through process.stdin, fs.readFileSync(0) and '/dev/stdin',
+ * then loads the program as the main module.
+ */
+const fs = require('fs');
+const Module = require('module');
+const { Readable } = require('stream');
+const { workerData } = require('worker_threads');
+
+const stdin = Buffer.from(workerData.stdin);
+// A piped worker stdin would keep the thread alive when the program never reads it
+Object.defineProperty(process, 'stdin', { value: Readable.from([stdin]), configurable: true });
+const readFileSync = fs.readFileSync;
+fs.readFileSync = function (file, options) {
+  if (file === 0 || file === '/dev/stdin') {
+    const encoding = typeof options === 'string' ? options : options && options.encoding;
+    return encoding ? stdin.toString(encoding) : Buffer.from(stdin);
+  }
+  return readFileSync.apply(this, arguments);
+};
+
+process.argv[1] = workerData.script;
+// isMain, so `require.main === module` holds in the program
+Module._load(workerData.script, null, true);
@@ -0,0 +1,186 @@
+'use strict';
+/**
+ * Long-lived Node.js process that runs each submitted program in a fresh
+ * worker thread (its own V8 isolate, globals and module cache).
+ *
+ * Speaks the protocol of app/services/worker_pool.py over the pipes whose
+ * descriptors are the first two arguments. Commands:
+ *     RUN        script   -           payload = program stdin
+ *     CHECK      fileName -           payload = source; stdout = the syntax error as node would print it
+ *     TRANSPILE  outFile  sourceFile  TypeScript to CommonJS, without type checking
+ * The optional third argument is the path of the typescript package.
+ *
+ * Program output beyond REGEN_MAX_OUTPUT_BYTES stops the job, as does a heap
+ * beyond REGEN_MAX_JOB_HEAP_MB. A job leaves the worker dirty once the
+ * process's resident set grows past REGEN_MAX_RSS_BYTES. CPU time and file
+ * sizes are bounded by the rlimits the backend sets on this process before
+ * each job; a job that exceeds them takes the process down with it.
+ */
+const fs = require('fs');
+const path = require('path');
+const vm = require('vm');
+const { Worker } = require('worker_threads');
+
+const requestFd = Number(process.argv[2]);
+const responseFd = Number(process.argv[3]);
+const typescriptPath = process.argv[4] || null;
+const MAX_OUTPUT_BYTES = Number(process.env.REGEN_MAX_OUTPUT_BYTES || 16 * 1024 * 1024);
+const MAX_RSS_BYTES = Number(process.env.REGEN_MAX_RSS_BYTES || 512 * 1024 * 1024);
+const MAX_JOB_HEAP_MB = Number(process.env.REGEN_MAX_JOB_HEAP_MB || 256);
+const JOB_SCRIPT = path.join(__dirname, 'job.js');
+
+let typescript = null;
+
+function respond(result) {
+  const stdout = result.stdout || Buffer.alloc(0);
+  const stderr = result.stderr || Buffer.alloc(0);
+  const dirty = process.memoryUsage().rss > MAX_RSS_BYTES;
+  const header = `${result.code}\t${stdout.length}\t${stderr.length}\t${result.dropped || 0}\t${dirty ? 1 : 0}\n`;
+  const data = Buffer.concat([Buffer.from(header, 'utf8'), stdout, stderr]);
+  let offset = 0;
+  while (offset < data.length) {
+    offset += fs.writeSync(responseFd, data, offset);
+  }
+}
+
+function runProgram(script, stdin) {
+  return new Promise((resolve) => {
+    const stdout = [];
+    const stderr = [];
+    let kept = 0;
+    let dropped = 0;
+    let stopped = false;
+    const worker = new Worker(JOB_SCRIPT, {
+      workerData: { script, stdin },
+      argv: [],
+      // Output written in a busy loop piles up in the job's heap, so cap it
+      resourceLimits: { maxOldGenerationSizeMb: MAX_JOB_HEAP_MB },
+      stdout: true,
+      stderr: true,
+    });
+
+    const capture = (chunks) => (chunk) => {
+      const room = Math.max(MAX_OUTPUT_BYTES - kept, 0);
+      if (chunk.length > room) {
+        dropped += chunk.length - room;
+        chunk = chunk.subarray(0, room);
+        if (!stopped) {
+          stopped = true;
+          worker.terminate();
+        }
+      }
+      kept += chunk.length;
+      chunks.push(chunk);
+    };
+    worker.stdout.on('data', capture(stdout));
+    worker.stderr.on('data', capture(stderr));
+    worker.on('error', (error) => {
+      // Uncaught exception; node would print it and exit with status 1
+      stderr.push(Buffer.from(`${(error && error.stack) || error}\n`, 'utf8'));
+    });
+
+    worker.on('exit', (code) => {
+      // Output the job wrote last may still be in flight; a terminated job's streams never end
+      const ended = [worker.stdout, worker.stderr].map((stream) => stopped || stream.readableEnded
+        ? Promise.resolve()
+        : new Promise((done) => stream.once('end', done).once('close', done)));
+      Promise.all(ended).then(() => resolve({
+        code,
+        stdout: Buffer.concat(stdout),
+        stderr: Buffer.concat(stderr),
+        dropped,
+      }));
+    });
+  });
+}
+
+function checkSyntax(fileName, source) {
+  try {
+    // Inside the CommonJS module wrapper, as the program would be loaded
+    vm.compileFunction(source.toString('utf8'), ['exports', 'require', 'module', '__filename', '__dirname'], {
+      filename: fileName,
+    });
+  } catch (error) {
+    if (error instanceof SyntaxError) {
+      // The source line and caret, then the message; not the frames of this worker
+      const lines = String(error.stack).split('\n');
+      const frames = lines.findIndex((line) => line.startsWith('    at '));
+      return { code: 0, stdout: Buffer.from(lines.slice(0, frames < 0 ? lines.length : frames).join('\n'), 'utf8') };
+    }
+  }
+  return { code: 0 };
+}
+
+function transpile(outFile, sourceFile) {
+  if (typescript === null) {
+    return { code: 2, stderr: Buffer.from('The typescript package is not available to the Node worker\n') };
+  }
+  const ts = typescript;
+  const output = ts.transpileModule(fs.readFileSync(sourceFile, 'utf8'), {
+    fileName: sourceFile,
+    reportDiagnostics: true,
+    compilerOptions: { module: ts.ModuleKind.CommonJS, target: ts.ScriptTarget.ES2020 },
+  });
+  const errors = (output.diagnostics || []).filter((d) => d.category === ts.DiagnosticCategory.Error);
+  if (errors.length) {
+    const host = { getCanonicalFileName: (f) => f, getCurrentDirectory: () => '', getNewLine: () => '\n' };
+    return { code: 1, stderr: Buffer.from(ts.formatDiagnostics(errors, host), 'utf8') };
+  }
+  fs.writeFileSync(outFile, output.outputText);
+  return { code: 0 };
+}
+
+async function handle(fields, payload) {
+  switch (fields[0]) {
+    case 'RUN':
+      return runProgram(fields[1], payload);
+    case 'CHECK':
+      return checkSyntax(fields[1], payload);
+    case 'TRANSPILE':
+      try {
+        return transpile(fields[1], fields[2]);
+      } catch (error) {
+        return { code: 1, stderr: Buffer.from(`${error.stack || error}\n`, 'utf8') };
+      }
+    default:
+      return { code: 2, stderr: Buffer.from(`Unknown command ${fields[0]}\n`, 'utf8') };
+  }
+}
+
+function main() {
+  if (typescriptPath) {
+    try {
+      // Loading the compiler is the slow part of every ts-node run
+      typescript = require(typescriptPath);
+    } catch (error) {
+      process.stderr.write(`WARNING: Could not load typescript from ${typescriptPath}: ${error}\n`);
+    }
+  }
+
+  let buffered = Buffer.alloc(0);
+  let busy = Promise.resolve();
+  const requests = fs.createReadStream('', { fd: requestFd });
+  requests.on('data', (chunk) => {
+    buffered = Buffer.concat([buffered, chunk]);
+    for (;;) {
+      const newline = buffered.indexOf(10);
+      if (newline < 0) {
+        return;
+      }
+      const fields = buffered.subarray(0, newline).toString('utf8').split('\t');
+      const end = newline + 1 + Number(fields[3]);
+      if (buffered.length < end) {
+        return;
+      }
+      const payload = buffered.subarray(newline + 1, end);
+      buffered = buffered.subarray(end);
+      busy = busy.then(() => handle(fields, payload)).then(respond);
+    }
+  });
+  // The backend closed the pipe: finish the current job's response and exit
+  requests.on('end', () => busy.then(() => process.exit(0)));
+
+  fs.writeSync(responseFd, 'READY\n');
+}
+
+main();
@@ -0,0 +1,68 @@
+"""
+Pool of long-lived Node.js workers for JavaScript and transpiled TypeScript
+"""
+import os
+import shutil
+from app.services.execution_engine import OUTPUT_HARD_LIMIT_BYTES
+from app.services.resource_limits import COMPILE_LIMITS, RUN_LIMITS
+from app.services.worker_pool import WorkerPool
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(__file__), 'node', 'worker.js')
+
+
+class NodeWorkerPool(WorkerPool):
+    name = "Node worker"
+
+    def __init__(self, size, max_jobs, node_options=(), typescript=None):
+        env = dict(os.environ)
+        env["REGEN_MAX_OUTPUT_BYTES"] = str(OUTPUT_HARD_LIMIT_BYTES)
+        env["REGEN_MAX_JOB_HEAP_MB"] = os.getenv("NODE_JOB_MAX_HEAP_MB", "256")
+        env["REGEN_MAX_RSS_BYTES"] = str(int(os.getenv("NODE_WORKER_MAX_RSS_MB", "512")) * 1024 * 1024)
+        # Transpiling gets the larger compile limits; the process itself needs
+        # room for its main isolate besides a job's heap
+        overhead_mb = int(os.getenv("NODE_WORKER_OVERHEAD_MB", "256"))
+        super().__init__(size, max_jobs, env=env, limits=COMPILE_LIMITS, overhead_mb=overhead_mb)
+        self.node_options = list(node_options)
+        # Path of the typescript package, for TRANSPILE
+        self.typescript = typescript
+
+    @property
+    def enabled(self):
+        return self.size > 0 and shutil.which('node') is not None
+
+    async def run(self, script, user_inputs, timeout=10):
+        """Run a CommonJS script in a fresh worker thread"""
+        return await self._submit('RUN', script, '-', (user_inputs or "").encode('utf-8'), timeout, RUN_LIMITS)
+
+    async def check(self, file_name, source, timeout=5):
+        """Compile source without running it; stdout holds the syntax error, if any"""
+        return await self._submit('CHECK', file_name, '-', source.encode('utf-8'), timeout, COMPILE_LIMITS)
+
+    async def transpile(self, out_file, source_file, timeout=15):
+        """Strip TypeScript types (no type checking) into out_file"""
+        return await self._submit('TRANSPILE', out_file, source_file, b"", timeout, COMPILE_LIMITS)
+
+    async def _command(self, request_fd, response_fd):
+        return [
+            'node', *self.node_options, WORKER_SCRIPT, str(request_fd), str(response_fd),
+            *([self.typescript] if self.typescript else []),
+        ]
+
+
+def _typescript_package():
+    """The typescript package next to `tsc`, or TYPESCRIPT_PATH"""
+    path = os.getenv("TYPESCRIPT_PATH")
+    if not path and shutil.which('tsc'):
+        # <package>/bin/tsc
+        path = os.path.dirname(os.path.dirname(os.path.realpath(shutil.which('tsc'))))
+    if path and os.path.exists(os.path.join(path, 'package.json')):
+        return path
+    return None
+
+
+node_pool = NodeWorkerPool(
+    size=int(os.getenv("NODE_POOL_SIZE", "2")),
+    max_jobs=int(os.getenv("NODE_WORKER_MAX_JOBS", "200")),
+    node_options=os.getenv("NODE_WORKER_OPTS", "").split(),
+    typescript=_typescript_package(),
+)
@@ -1,42 +1,142 @@
+import json
 import os
-import requests
+import time
+import httpx
 from dotenv import load_dotenv
+from app.services import metrics
+from app.services.languages import language_registry
+from app.services.prompts import EditError, build_messages, code_from_reply, prompt_budget
+from app.services.response_cache import generate_cache
+from app.services.single_flight import generate_flights
 
 load_dotenv()
 
+GROQ_MODEL = "llama-3.1-8b-instant"
+GROQ_API_URL = os.getenv("GROQ_API_URL", "https://api.groq.com/openai/v1/chat/completions")
+# Part of the cache key: bump when prompts or reply handling change what is cached
+PROMPT_VERSION = 2
+
+
+class GenerationError(Exception):
+    """The completion API failed; str(e) is the user-facing message"""
+
+
 class GroqService:
-    def __init__(self):
+    def __init__(self, cache=generate_cache, api_url=None):
         self.api_key = os.getenv("GROQ_API_KEY")
+        self.api_url = api_url or GROQ_API_URL
+        self.cache = cache
+        self._client = None
         if self.api_key:
             print("API key loaded")
 
-    def generate_code(self, prompt, existing_code=None, language="python"):
+    @property
+    def client(self):
+        """Shared client so requests reuse pooled keep-alive connections"""
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(15.0, read=30.0),
+                limits=httpx.Limits(
+                    max_connections=int(os.getenv("GROQ_MAX_CONNECTIONS", "20")),
+                    max_keepalive_connections=int(os.getenv("GROQ_MAX_KEEPALIVE", "10")),
+                ),
+            )
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def generate_code(self, prompt, existing_code=None, language="python"):
+        """Return the whole completion; errors are returned as text like before"""
+        code, error = await self.generate(prompt, existing_code, language)
+        return code if error is None else error
+
+    async def generate(self, prompt, existing_code=None, language="python"):
+        """Return (code, None), or (None, error message).
+
+        Identical concurrent requests share one upstream call.
+        """
+        key = self.cache.key(GROQ_MODEL, PROMPT_VERSION, language, prompt, existing_code)
+        return await generate_flights.do(key, lambda: self._generate(prompt, existing_code, language))
+
+    async def _generate(self, prompt, existing_code, language):
+        chunks = []
+        try:
+            async for chunk in self.stream_code(prompt, existing_code, language):
+                chunks.append(chunk)
+            return clean_code("".join(chunks), existing_code, language), None
+        except GenerationError as e:
+            return None, str(e)
+
+    async def stream_code(self, prompt, existing_code=None, language="python"):
+        """Yield completion text as it arrives; raises GenerationError.
+
+        With existing_code the text is edit blocks; clean_code() turns it
+        into the final code. A cached response is that final code, yielded
+        as a single chunk.
+        """
+        key = self.cache.key(GROQ_MODEL, PROMPT_VERSION, language, prompt, existing_code)
+        cached = await self.cache.get(key)
+        if cached is not None:
+            print(f"DEBUG: Generate cache hit ({self.cache.stats})")
+            yield cached
+            return
+        print(f"DEBUG: Generate cache miss ({self.cache.stats})")
+
+        chunks = []
+        async for chunk in self._stream_completion(prompt, language, existing_code):
+            chunks.append(chunk)
+            yield chunk
+        await self.cache.put(key, clean_code("".join(chunks), existing_code, language))
+
+    async def _stream_completion(self, prompt, language, existing_code=None):
+        data = {
+            "model": GROQ_MODEL,
+            "messages": build_messages(prompt, language, existing_code, prompt_budget(GROQ_MODEL)),
+            "stream": True,
+        }
+
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = "Bearer " + self.api_key
+
+        started = time.perf_counter()
+        # Until the response is read to the end; a client that goes away leaves it 'cancelled'
+        outcome = 'cancelled'
         try:
-            url = "https://api.groq.com/openai/v1/chat/completions"
-            
-            msg = language + " code: " + prompt
-            
-            data = {
-                "model": "llama-3.1-8b-instant",
-                "messages": [{"role": "user", "content": msg}]
-            }
-            
-            headers = {
-                "Authorization": "Bearer " + self.api_key,
-                "Content-Type": "application/json"
-            }
-            
-            r = requests.post(url, json=data, headers=headers, timeout=15)
-            
-            if r.status_code == 200:
-                result = r.json()
-                code = result["choices"][0]["message"]["content"]
-                code = code.replace("``````javascript", "").replace("``````", "")
-                return code.strip()
-            else:
-                return "API Error " + str(r.status_code)
-                
-        except Exception as e:
-            return "Error: " + str(e)
+            async with self.client.stream("POST", self.api_url, json=data, headers=headers) as r:
+                if r.status_code != 200:
+                    outcome = 'error'
+                    raise GenerationError("API Error " + str(r.status_code))
+                async for line in r.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    payload = line[len("data:"):].strip()
+                    if payload == "[DONE]":
+                        break
+                    choices = json.loads(payload).get("choices") or [{}]
+                    content = choices[0].get("delta", {}).get("content")
+                    if content:
+                        yield content
+            outcome = 'ok'
+        except (httpx.HTTPError, ValueError) as e:
+            outcome = 'error'
+            raise GenerationError("Error: " + str(e))
+        finally:
+            spec = language_registry.resolve(language)
+            # Free-form language names would make a label value each
+            label = spec.name if spec else 'other'
+            metrics.llm_seconds.observe(label, outcome, value=time.perf_counter() - started)
+
+
+def clean_code(reply, existing_code=None, language=None):
+    """Final code for a completion (see prompts.code_from_reply); raises GenerationError"""
+    try:
+        return code_from_reply(reply, existing_code, language)
+    except EditError as e:
+        raise GenerationError(str(e))
+
 
 huggingface_service = GroqService()
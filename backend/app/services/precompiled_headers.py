@@ -0,0 +1,81 @@
+"""
+Precompiled headers for C/C++, one set per compiler version and flag set
+"""
+import asyncio
+import hashlib
+import os
+import shutil
+import subprocess
+import tempfile
+from app.services.execution_engine import execution_engine
+
+# Language passed to the compiler's -x option when building a header
+HEADER_LANGUAGE = {'cpp': 'c++-header', 'c': 'c-header'}
+
+
+class PrecompiledHeaders:
+    """Directories of `<header>.gch` files to put first on the include path.
+
+    GCC uses a .gch only for the first #include of a translation unit and
+    only when it was built with the same flags, so each common header gets
+    its own file and each (compiler, version, flags) its own directory.
+    """
+
+    def __init__(self, root=None):
+        self.root = root or os.getenv("PCH_CACHE_DIR", os.path.join(tempfile.gettempdir(), "regen-pch"))
+        self.enabled = os.getenv("PCH", "1") != "0"
+        self._building = {}
+        os.makedirs(self.root, exist_ok=True)
+
+    def _dir(self, spec, version, flags):
+        digest = hashlib.sha256()
+        for part in (spec.name, spec.compile_cmd[0], version, "\0".join(flags)):
+            digest.update(part.encode('utf-8'))
+            digest.update(b"\0")
+        return os.path.join(self.root, digest.hexdigest())
+
+    def include_dir(self, spec, version, flags):
+        """Return the PCH directory for these flags, or None while it is not built yet.
+
+        A missing directory is built in the background; until then programs
+        compile without precompiled headers.
+        """
+        if not self.enabled or not spec.pch_headers:
+            return None
+        path = self._dir(spec, version, flags)
+        if os.path.isdir(path):
+            return path
+        if path not in self._building:
+            self._building[path] = asyncio.ensure_future(self._build(spec, flags, path))
+        return None
+
+    async def _build(self, spec, flags, path):
+        staging = tempfile.mkdtemp(prefix=".build-", dir=self.root)
+        try:
+            for header in spec.pch_headers:
+                stub = os.path.join(staging, 'stub.h')
+                with open(stub, 'w', encoding='utf-8') as f:
+                    f.write(f"#include <{header}>\n")
+                target = os.path.join(staging, f"{header}.gch")
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                result = await execution_engine.run(
+                    [spec.compile_cmd[0], *flags, '-x', HEADER_LANGUAGE[spec.name], stub, '-o', target],
+                    timeout=120,
+                )
+                os.remove(stub)
+                if result.returncode != 0:
+                    print(f"WARNING: Precompiling <{header}> failed: {result.stderr.strip()}")
+            try:
+                os.rename(staging, path)
+            except OSError:
+                # Another worker process finished the same set first
+                pass
+            print(f"DEBUG: Precompiled headers ready for {spec.name} {' '.join(flags)}")
+        except (OSError, subprocess.TimeoutExpired) as e:
+            print(f"WARNING: Precompiling headers for {spec.name} failed: {e}")
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+            self._building.pop(path, None)
+
+
+precompiled_headers = PrecompiledHeaders()
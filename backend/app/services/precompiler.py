@@ -0,0 +1,72 @@
+"""
+Speculative background compilation of freshly generated code
+"""
+import asyncio
+import hashlib
+import os
+from app.services.code_executor import code_executor
+from app.services.execution_engine import execution_engine, low_priority
+from app.services.languages import language_registry
+
+
+class SpeculativeCompiler:
+    """Compiles generated code for compiled languages before anyone asks.
+
+    The user usually runs generated code within seconds, so its compile is
+    started right away: at the lowest CPU priority, a few at a time, into
+    the artifact cache. An execute of the same code then finds the artifact;
+    one that comes while the compile still runs cancels it and compiles at
+    normal priority rather than wait on a niced compiler (see
+    CodeExecutor._compile_cached). Speculative work is shed while executions
+    use more than max_load of the engine's slots, and a running one is
+    cancelled when load rises above it.
+    """
+
+    def __init__(self, enabled=None, concurrency=None, max_load=None):
+        self.enabled = enabled if enabled is not None else os.getenv("SPECULATIVE_COMPILE", "1") == "1"
+        self.concurrency = concurrency or int(os.getenv("SPECULATIVE_COMPILE_CONCURRENCY", "2"))
+        self.max_load = max_load or float(os.getenv("SPECULATIVE_COMPILE_MAX_LOAD", "0.5"))
+        # (language, source hash) -> task
+        self._pending = {}
+        self.stats = {"scheduled": 0, "compiled": 0, "failed": 0, "shed": 0, "cancelled": 0}
+
+    def schedule(self, language, code):
+        """Start compiling code in the background; never raises or waits"""
+        spec = language_registry.resolve(language)
+        if not self.enabled or not code or spec is None or not spec.compiled:
+            return
+        key = (spec.name, hashlib.sha256(code.encode('utf-8')).hexdigest())
+        if key in self._pending:
+            return
+        if len(self._pending) >= self.concurrency or self._overloaded():
+            self.stats["shed"] += 1
+            return
+        self.stats["scheduled"] += 1
+        task = asyncio.ensure_future(self._compile(spec.name, code))
+        self._pending[key] = task
+        task.add_done_callback(lambda _: self._pending.pop(key, None))
+
+    def _overloaded(self):
+        return execution_engine.load() > self.max_load
+
+    async def _compile(self, language, code):
+        low_priority.set(True)
+        compile_task = asyncio.ensure_future(code_executor.precompile(language, code))
+        try:
+            while not compile_task.done():
+                await asyncio.wait({compile_task}, timeout=0.1)
+                if not compile_task.done() and self._overloaded():
+                    compile_task.cancel()
+                    self.stats["cancelled"] += 1
+                    break
+            error = await compile_task
+            self.stats["failed" if error else "compiled"] += 1
+        except asyncio.CancelledError:
+            # Shed under load, or taken over by an execute of the same code
+            compile_task.cancel()
+        except Exception as e:
+            self.stats["failed"] += 1
+            print(f"WARNING: Speculative {language} compile failed: {e}")
+
+
+speculative_compiler = SpeculativeCompiler()
@@ -0,0 +1,206 @@
+"""
+Prompt construction within a token budget, and code extraction from replies.
+
+Edits of existing code are asked for as search/replace blocks, which are
+applied here, so the model only writes the lines that change:
+
+    <<<<<<< SEARCH
+    lines copied exactly from the current code
+    =======
+    the lines to put in their place
+    >>>>>>> REPLACE
+"""
+import math
+import os
+import re
+from app.services.languages import language_registry
+
+# Prompt tokens sent per model; the rest of the context is left for the reply
+PROMPT_TOKEN_BUDGETS = {"llama-3.1-8b-instant": 6000}
+DEFAULT_PROMPT_TOKENS = 4000
+# Code averages about three characters per token with Llama-style tokenizers
+CHARS_PER_TOKEN = 3
+# Longest run of lines scored as one region of existing code
+MAX_REGION_LINES = 60
+
+FENCE = re.compile(
+    r"^[ \t]*(?P<fence>`{3,}|~{3,})[ \t]*(?P<tag>[\w+#.-]*)[^\n]*\n(?P<body>.*?)(?:^[ \t]*(?P=fence)[ \t]*$|\Z)",
+    re.M | re.S,
+)
+EDIT_BLOCK = re.compile(
+    r"^<{5,9}[ \t]*SEARCH[^\n]*\n(?P<search>.*?)^={5,9}[ \t]*\n(?P<replace>.*?)^>{5,9}[ \t]*REPLACE[^\n]*$",
+    re.M | re.S,
+)
+WORD = re.compile(r"[A-Za-z_][A-Za-z0-9_]{2,}")
+STOPWORDS = {
+    "the", "and", "for", "that", "this", "with", "from", "into", "make", "add", "use", "code",
+    "function", "please", "change", "should", "would", "can", "not", "all", "instead", "when",
+}
+
+
+class EditError(ValueError):
+    """A reply's edit blocks do not apply to the code"""
+
+
+def prompt_budget(model):
+    """Prompt tokens allowed for model (GENERATE_PROMPT_TOKENS overrides)"""
+    override = int(os.getenv("GENERATE_PROMPT_TOKENS", "0"))
+    return override or PROMPT_TOKEN_BUDGETS.get(model, DEFAULT_PROMPT_TOKENS)
+
+
+def estimate_tokens(text):
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def build_messages(prompt, language, existing_code=None, budget=DEFAULT_PROMPT_TOKENS):
+    """Chat messages for a request, at most about budget tokens long.
+
+    Without existing_code the model writes a whole program; with it, the
+    parts of the code the request is most likely about (whole, if it fits)
+    are sent and edit blocks are asked for.
+    """
+    if not (existing_code or "").strip():
+        system = (f"You write {language} code. Reply with the complete program in a single fenced "
+                  f"code block and nothing else.")
+        return [{"role": "system", "content": system},
+                {"role": "user", "content": _truncate(prompt, budget - estimate_tokens(system))}]
+
+    system = (
+        f"You edit {language} code. Reply only with edit blocks, one per change:\n"
+        "<<<<<<< SEARCH\n(lines copied exactly from the current code)\n=======\n"
+        "(the lines to put in their place)\n>>>>>>> REPLACE\n"
+        "SEARCH must match the current code exactly, including indentation, and be unique in it; "
+        "keep blocks small. Lines marked '...' are not shown and stay unchanged. "
+        "An empty SEARCH appends to the end of the file."
+    )
+    request = _truncate(prompt, budget // 4)
+    frame = f"Current code:\n```{language}\n\n```\n\nRequest: {request}"
+    code_budget = budget - estimate_tokens(system) - estimate_tokens(frame)
+    code = relevant_code(existing_code, request, code_budget)
+    return [{"role": "system", "content": system},
+            {"role": "user", "content": f"Current code:\n```{language}\n{code}\n```\n\nRequest: {request}"}]
+
+
+def relevant_code(code, request, budget):
+    """code if it fits in budget tokens, else its regions sharing the most
+    identifiers with request, in file order, with the gaps marked"""
+    if estimate_tokens(code) <= budget:
+        return code
+    lines = code.split('\n')
+    regions = _regions(lines)
+    wanted = _words(request)
+    # Most relevant first; the head of the file (imports, globals) breaks ties
+    ranked = sorted(
+        range(len(regions)),
+        key=lambda i: (-len(wanted & _words('\n'.join(lines[slice(*regions[i])]))), i),
+    )
+    chosen, used = set(), 0
+    for i in ranked:
+        cost = estimate_tokens('\n'.join(lines[slice(*regions[i])])) + 1
+        if used + cost <= budget:
+            chosen.add(i)
+            used += cost
+
+    shown, hidden = [], 0
+    for i, (start, end) in enumerate(regions):
+        if i not in chosen:
+            hidden += end - start
+            continue
+        if hidden:
+            shown.append(f"... ({hidden} lines not shown)")
+            hidden = 0
+        shown.extend(lines[start:end])
+    if hidden:
+        shown.append(f"... ({hidden} lines not shown)")
+    return '\n'.join(shown)
+
+
+def _regions(lines):
+    """[(start, end)] line ranges: top-level blocks, split to at most MAX_REGION_LINES"""
+    starts = [0]
+    for i in range(1, len(lines)):
+        top_level = lines[i][:1] not in ('', ' ', '\t', '}', ')', ']')
+        if (top_level and not lines[i - 1].strip()) or i - starts[-1] >= MAX_REGION_LINES:
+            starts.append(i)
+    return list(zip(starts, starts[1:] + [len(lines)]))
+
+
+def _words(text):
+    """Lowercased identifiers and their snake/camel-case parts"""
+    words = set()
+    for word in WORD.findall(text):
+        words.add(word.lower())
+        for part in re.split(r"_|(?<=[a-z0-9])(?=[A-Z])", word):
+            if len(part) > 2:
+                words.add(part.lower())
+    return words - STOPWORDS
+
+
+def _truncate(text, tokens):
+    limit = max(tokens, 0) * CHARS_PER_TOKEN
+    return text if len(text) <= limit else text[:limit]
+
+
+def extract_code(reply, language=None):
+    """The code in a model reply: the fenced block tagged with language, else
+    the longest fenced block (an unclosed fence runs to the end), else the
+    whole reply"""
+    blocks = [(match.group('tag'), match.group('body')) for match in FENCE.finditer(reply)]
+    if not blocks:
+        return reply.strip()
+    spec = language_registry.resolve(language)
+    tagged = [body for tag, body in blocks if spec and tag and language_registry.resolve(tag) is spec]
+    return max(tagged or [body for _, body in blocks], key=len).strip('\n').rstrip()
+
+
+def parse_edits(reply):
+    """[(search, replace)] edit blocks in reply"""
+    return [(match.group('search'), match.group('replace')) for match in EDIT_BLOCK.finditer(reply)]
+
+
+def apply_edits(code, edits):
+    """code with every (search, replace) applied in order; raises EditError.
+
+    Search text is matched exactly first, then line by line ignoring
+    surrounding whitespace, with replace re-indented to match.
+    """
+    for search, replace in edits:
+        if not search.strip():
+            code = code.rstrip('\n') + '\n' + replace
+            continue
+        if search in code:
+            code = code.replace(search, replace, 1)
+            continue
+        code = _apply_loosely(code, search, replace)
+    return code
+
+
+def _apply_loosely(code, search, replace):
+    lines = code.split('\n')
+    wanted = [line.strip() for line in search.rstrip('\n').split('\n')]
+    for start in range(len(lines) - len(wanted) + 1):
+        if [line.strip() for line in lines[start:start + len(wanted)]] != wanted:
+            continue
+        found = _indent(lines[start])
+        given = _indent(search.split('\n')[0])
+        replacement = []
+        for line in replace.rstrip('\n').split('\n') if replace.strip() else []:
+            if line.strip() and line.startswith(given):
+                line = found + line[len(given):]
+            replacement.append(line)
+        return '\n'.join(lines[:start] + replacement + lines[start + len(wanted):])
+    first = search.strip().split('\n')[0]
+    raise EditError(f"Could not apply the suggested edit: no code matches '{first}'")
+
+
+def _indent(line):
+    return line[:len(line) - len(line.lstrip())]
+
+
+def code_from_reply(reply, existing_code=None, language=None):
+    """Final code for a reply: its edit blocks applied to existing_code when
+    it has any, else the code it contains"""
+    edits = parse_edits(reply) if existing_code else []
+    if edits:
+        return apply_edits(existing_code, edits)
+    return extract_code(reply, language)
@@ -0,0 +1,175 @@
+"""
+Client for the pre-forked Python interpreter (zygote) used by execute_python
+"""
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import tempfile
+import time
+from app.services.execution_engine import (
+    close_pipes, collect, kill_process_group, pipe_reader, stream_output, watch_workspace, write_pipe,
+)
+from app.services.resource_limits import ResourceUsage
+
+ZYGOTE_SCRIPT = os.path.join(os.path.dirname(__file__), 'zygote_server.py')
+
+DEFAULT_PRELOAD = (
+    "collections,itertools,functools,math,heapq,bisect,re,json,string,random,"
+    "datetime,decimal,fractions,statistics,typing,dataclasses,copy,operator"
+)
+
+
+class PythonZygote:
+    def __init__(self, preload=None):
+        self.preload = preload if preload is not None else os.getenv("PYTHON_ZYGOTE_PRELOAD", DEFAULT_PRELOAD)
+        self._proc = None
+        self._socket_path = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def enabled(self):
+        return (
+            os.getenv("PYTHON_ZYGOTE", "1") != "0"
+            and hasattr(os, 'fork')
+            and hasattr(socket, 'send_fds')
+        )
+
+    async def run(self, script_path, user_inputs, timeout=10, limits=None, cwd=None):
+        """Run script_path in a child forked from the zygote.
+
+        Behaves like execution_engine.run(['python', script_path]): raises
+        subprocess.TimeoutExpired after `timeout` seconds.
+        """
+        return await collect(self.stream(script_path, user_inputs, timeout, limits, cwd))
+
+    async def stream(self, script_path, user_inputs, timeout=10, limits=None, cwd=None):
+        """Like execution_engine.stream(['python', script_path])"""
+        await self._ensure_started()
+
+        stdin_r, stdin_w = os.pipe()
+        stdout_r, stdout_w = os.pipe()
+        stderr_r, stderr_w = os.pipe()
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.setblocking(False)
+        try:
+            await asyncio.get_running_loop().sock_connect(sock, self._socket_path)
+            job = {"path": script_path, "cwd": cwd, "limits": limits.rlimits() if limits else []}
+            await _send_fds(sock, json.dumps(job).encode(), [stdin_r, stdout_w, stderr_w])
+        except BaseException as e:
+            sock.close()
+            for fd in (stdin_w, stdout_r, stderr_r):
+                os.close(fd)
+            if isinstance(e, OSError):
+                # The zygote is unusable; make sure the next job starts a fresh one
+                self._stop()
+            raise
+        finally:
+            # The job holds its own copies now; closing ours lets EOF through
+            for fd in (stdin_r, stdout_w, stderr_w):
+                os.close(fd)
+
+        cmd = ['python', script_path]
+        pipes = [os.fdopen(stdout_r, 'rb', 0), os.fdopen(stderr_r, 'rb', 0), os.fdopen(stdin_w, 'wb', 0)]
+        transports = []
+        reader, writer = await asyncio.open_unix_connection(sock=sock)
+        pid = None
+        events = None
+        watcher = None
+        finished = False
+        started = time.perf_counter()
+        # Filled by _read_exit_status: [cpu seconds, peak RSS in KB]
+        exit_status = []
+        try:
+            stdout = await pipe_reader(pipes[0], transports)
+            stderr = await pipe_reader(pipes[1], transports)
+            try:
+                pid = int(await asyncio.wait_for(reader.readline(), timeout=timeout))
+            except asyncio.TimeoutError:
+                raise subprocess.TimeoutExpired(cmd, timeout)
+
+            events = stream_output(
+                stdout, stderr,
+                wait=lambda: _read_exit_status(reader, exit_status),
+                kill=lambda: kill_process_group(pid),
+                timeout=timeout,
+                cmd=cmd,
+                feed=write_pipe(pipes[2], (user_inputs or "").encode('utf-8'), transports),
+            )
+            watcher = watch_workspace(cwd, limits, lambda: kill_process_group(pid))
+            async for name, data in events:
+                if name == 'exit':
+                    finished = True
+                    usage = ResourceUsage(time.perf_counter() - started, *exit_status, limits=limits)
+                    if watcher is not None and watcher.done():
+                        usage.limit = 'workspace'
+                    usage.classify(data)
+                    yield 'usage', usage
+                yield name, data
+        finally:
+            if watcher is not None:
+                watcher.cancel()
+            if events is not None:
+                await events.aclose()
+            if not finished:
+                kill_process_group(pid)
+            writer.close()
+            close_pipes(pipes, transports)
+
+    async def _ensure_started(self):
+        async with self._lock:
+            if self._proc is None or self._proc.returncode is not None:
+                await self._start()
+
+    def _stop(self):
+        if self._proc is not None and self._proc.returncode is None:
+            try:
+                self._proc.kill()
+            except ProcessLookupError:
+                pass
+        self._proc = None
+
+    async def _start(self):
+        socket_dir = tempfile.mkdtemp(prefix='regen-zygote-')
+        self._socket_path = os.path.join(socket_dir, 'zygote.sock')
+        proc = await asyncio.create_subprocess_exec(
+            'python', ZYGOTE_SCRIPT, self._socket_path, self.preload,
+            # Never written to: the zygote exits when this pipe closes
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+        )
+        ready = await asyncio.wait_for(proc.stdout.readline(), timeout=30)
+        if ready.strip() != b"READY":
+            proc.kill()
+            raise RuntimeError("Python zygote failed to start")
+        self._proc = proc
+
+
+async def _send_fds(sock, data, fds):
+    """socket.send_fds for a non-blocking socket, waiting for room in its buffer"""
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            socket.send_fds(sock, [data], fds)
+            return
+        except BlockingIOError:
+            writable = loop.create_future()
+            loop.add_writer(sock, writable.set_result, None)
+            try:
+                await writable
+            finally:
+                loop.remove_writer(sock)
+
+
+async def _read_exit_status(reader, usage):
+    """Read the job's "exit code \t cpu seconds \t peak RSS KB" line; returns the exit code"""
+    line = await reader.readline()
+    if not line:
+        raise RuntimeError("Python zygote lost track of the job")
+    returncode, cpu_time, peak_rss_kb = line.decode().split('\t')
+    usage[:] = [float(cpu_time), int(peak_rss_kb)]
+    return int(returncode)
+
+
+python_zygote = PythonZygote()
@@ -0,0 +1,168 @@
+"""
+Per-process resource limits (rlimits) and measured resource usage
+"""
+import errno
+import os
+import re
+import shutil
+import signal
+from dataclasses import dataclass, field
+from typing import Optional
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows; limits are then not applied
+    resource = None
+
+# What runtimes print when an allocation fails under RLIMIT_DATA
+OUT_OF_MEMORY = re.compile(
+    r"MemoryError|std::bad_alloc|[Oo]ut of memory|OutOfMemoryError|NoMemoryError"
+    r"|memory allocation of \d+ bytes failed|Cannot allocate memory|failed to reserve"
+)
+FILE_TOO_LARGE = re.compile(r"File too large|EFBIG")
+
+# Sets the limits and execs the command: much cheaper than a preexec_fn,
+# which makes subprocess fork the whole backend instead of using vfork
+PRLIMIT = shutil.which('prlimit')
+PRLIMIT_OPTIONS = {
+    'RLIMIT_CORE': '--core',
+    'RLIMIT_CPU': '--cpu',
+    'RLIMIT_DATA': '--data',
+    'RLIMIT_NPROC': '--nproc',
+    'RLIMIT_FSIZE': '--fsize',
+}
+
+
+@dataclass
+class ResourceLimits:
+    """rlimits for one compile or run phase; 0 disables a limit.
+
+    Every process of the phase gets its own copy of the limits.
+    RLIMIT_NPROC counts all processes of the user and is not enforced for
+    root, so max_processes only stops fork bombs under an unprivileged user.
+    workspace_mb is not an rlimit: it bounds everything the program keeps in
+    its working directory, measured while it runs (see workspaces.watch).
+    """
+    cpu_seconds: int = 0
+    memory_mb: int = 0
+    max_processes: int = 0
+    file_size_mb: int = 0
+    workspace_mb: int = 0
+
+    def rlimits(self):
+        """[(RLIMIT_* name, soft, hard)] for the enabled limits, within the
+        hard limits of this process (only root may raise those)"""
+        limits = [('RLIMIT_CORE', 0, 0)]
+        if self.cpu_seconds:
+            # SIGXCPU at the soft limit, SIGKILL a second later
+            limits.append(('RLIMIT_CPU', self.cpu_seconds, self.cpu_seconds + 1))
+        if self.memory_mb:
+            # Not RLIMIT_AS: node, go and dotnet reserve far more address space than they use
+            limits.append(('RLIMIT_DATA', self.memory_mb << 20, self.memory_mb << 20))
+        if self.max_processes:
+            limits.append(('RLIMIT_NPROC', self.max_processes, self.max_processes))
+        if self.file_size_mb:
+            limits.append(('RLIMIT_FSIZE', self.file_size_mb << 20, self.file_size_mb << 20))
+        return [clamp for clamp in map(_clamp, limits) if clamp]
+
+    def apply(self):
+        """Set the limits on the current process; used as a preexec_fn"""
+        apply_rlimits(self.rlimits())
+
+    def command(self, cmd):
+        """cmd wrapped in prlimit, or None when prlimit is not installed.
+
+        Raises FileNotFoundError for a missing executable, like Popen would
+        without the wrapper."""
+        if not PRLIMIT:
+            return None
+        if shutil.which(cmd[0]) is None:
+            raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), cmd[0])
+        options = [f"{PRLIMIT_OPTIONS[name]}={soft}:{hard}" for name, soft, hard in self.rlimits()]
+        return [PRLIMIT, *options, '--', *cmd]
+
+
+def _clamp(limit):
+    """limit lowered to the current hard limit; None when it cannot be set here"""
+    name, soft, hard = limit
+    kind = getattr(resource, name, None) if resource is not None else None
+    if kind is None:
+        return None
+    _, current = resource.getrlimit(kind)
+    if current != resource.RLIM_INFINITY:
+        soft, hard = min(soft, current), min(hard, current)
+    return name, soft, hard
+
+
+def apply_rlimits(limits):
+    if resource is None:
+        return
+    for name, soft, hard in limits:
+        try:
+            resource.setrlimit(getattr(resource, name), (soft, hard))
+        except (AttributeError, ValueError, OSError):
+            pass
+
+
+@dataclass
+class ResourceUsage:
+    """What one run used. cpu_time and peak_rss_kb cover the process and the
+    children it waited for; they are None where they cannot be measured."""
+    wall_time: float
+    cpu_time: Optional[float] = None
+    peak_rss_kb: Optional[int] = None
+    # Limit that ended the program: wall_time, cpu_time, memory, file_size, workspace or output
+    limit: Optional[str] = None
+    # The ResourceLimits the program ran under
+    limits: Optional[ResourceLimits] = field(default=None, repr=False)
+
+    @classmethod
+    def from_rusage(cls, wall_time, rusage, limits=None, sampled_rss_kb=None, inherited_rss_kb=0):
+        """Usage from os.wait4's rusage.
+
+        A child's ru_maxrss starts at the peak RSS of the process it was
+        forked from, so it only measures the child when it is above
+        inherited_rss_kb; otherwise the peak sampled from /proc is used."""
+        # ru_maxrss is in kilobytes on Linux
+        peak = rusage.ru_maxrss if rusage.ru_maxrss > inherited_rss_kb else sampled_rss_kb
+        return cls(wall_time, rusage.ru_utime + rusage.ru_stime, peak, limits=limits)
+
+    def classify(self, returncode, stderr=""):
+        """Set limit when returncode (and stderr) show the program hit one of its limits"""
+        limits = self.limits
+        if self.limit or limits is None or not returncode:
+            return
+        if returncode == -signal.SIGXCPU or (
+            limits.cpu_seconds and self.cpu_time is not None and self.cpu_time >= limits.cpu_seconds
+        ):
+            self.limit = 'cpu_time'
+        elif returncode == -signal.SIGXFSZ or (limits.file_size_mb and FILE_TOO_LARGE.search(stderr)):
+            self.limit = 'file_size'
+        elif limits.memory_mb and (
+            (self.peak_rss_kb or 0) >= limits.memory_mb * 1024 * 0.9 or OUT_OF_MEMORY.search(stderr)
+        ):
+            self.limit = 'memory'
+
+    def fields(self):
+        """Response fields (see ExecutionResponse)"""
+        return {
+            'wall_time': round(self.wall_time, 4),
+            'cpu_time': round(self.cpu_time, 4) if self.cpu_time is not None else None,
+            'peak_rss_kb': self.peak_rss_kb,
+            'limit_exceeded': self.limit,
+        }
+
+
+def _limits(prefix, cpu_seconds, memory_mb, max_processes, file_size_mb, workspace_mb):
+    return ResourceLimits(
+        cpu_seconds=int(os.getenv(f"{prefix}_CPU_LIMIT_SECONDS", cpu_seconds)),
+        memory_mb=int(os.getenv(f"{prefix}_MEMORY_LIMIT_MB", memory_mb)),
+        max_processes=int(os.getenv(f"{prefix}_MAX_PROCESSES", max_processes)),
+        file_size_mb=int(os.getenv(f"{prefix}_FILE_SIZE_LIMIT_MB", file_size_mb)),
+        workspace_mb=int(os.getenv(f"{prefix}_WORKSPACE_LIMIT_MB", workspace_mb)),
+    )
+
+
+RUN_LIMITS = _limits("RUN", "10", "512", "1024", "64", "128")
+COMPILE_LIMITS = _limits("COMPILE", "60", "2048", "1024", "512", "1024")
@@ -0,0 +1,113 @@
+"""
+Two-tier (in-memory LRU + SQLite) cache for generated code responses
+"""
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResponseCache:
+    """LRU with a TTL in front of a SQLite table shared by every worker process"""
+
+    def __init__(self, db_path=None, max_entries=None, ttl=None, prune_every=None):
+        self.db_path = db_path or os.getenv(
+            "GENERATE_CACHE_DB", os.path.join(tempfile.gettempdir(), "regen-generate-cache.sqlite3")
+        )
+        self.max_entries = max_entries or int(os.getenv("GENERATE_CACHE_SIZE", "256"))
+        self.ttl = ttl or int(os.getenv("GENERATE_CACHE_TTL_SECONDS", str(24 * 3600)))
+        # Writes between deletions of expired rows
+        self.prune_every = prune_every or int(os.getenv("GENERATE_CACHE_PRUNE_EVERY", "100"))
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        # Serializes use of the shared connection by worker threads
+        self._db_lock = threading.Lock()
+        self._puts = 0
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+    def _db(self):
+        """The connection, opened (and the table created) on first use"""
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=5, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS responses ("
+                    "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS responses_created ON responses (created)")
+            self._conn = conn
+        return self._conn
+
+    def key(self, *parts):
+        """Hash the request fields that determine the response"""
+        return hashlib.sha256(json.dumps(parts).encode('utf-8')).hexdigest()
+
+    async def get(self, key):
+        """Return the cached value for key, or None on a miss"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry and now - entry[1] <= self.ttl:
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return entry[0]
+            self._memory.pop(key, None)
+
+        try:
+            row = await asyncio.to_thread(self._read, key, now - self.ttl)
+        except sqlite3.Error as e:
+            print(f"WARNING: Response cache read failed: {e}")
+            row = None
+
+        with self._lock:
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+            self.stats["disk_hits"] += 1
+            self._remember(key, row[0], row[1])
+        return row[0]
+
+    async def put(self, key, value):
+        now = time.time()
+        with self._lock:
+            self._remember(key, value, now)
+            self._puts += 1
+            prune = self._puts % self.prune_every == 0
+        try:
+            await asyncio.to_thread(self._write, key, value, now, prune)
+        except sqlite3.Error as e:
+            print(f"WARNING: Response cache write failed: {e}")
+
+    def _read(self, key, oldest):
+        with self._db_lock:
+            return self._db().execute(
+                "SELECT value, created FROM responses WHERE key = ? AND created >= ?", (key, oldest)
+            ).fetchone()
+
+    def _write(self, key, value, created, prune):
+        with self._db_lock:
+            conn = self._db()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, created) VALUES (?, ?, ?)",
+                    (key, value, created),
+                )
+                if prune:
+                    conn.execute("DELETE FROM responses WHERE created < ?", (created - self.ttl,))
+
+    def _remember(self, key, value, created):
+        self._memory[key] = (value, created)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+
+generate_cache = ResponseCache()
@@ -0,0 +1,78 @@
+"""
+State shared by every process on the box (API workers, job workers) through
+files in SHARED_STATE_DIR: execution slots and metrics snapshots
+"""
+import asyncio
+import fcntl
+import os
+
+# Unset: every process keeps its own limits and metrics
+SHARED_STATE_DIR = os.getenv("SHARED_STATE_DIR")
+
+
+class SharedSlots:
+    """Counting semaphore across processes: count lock files, one flock each.
+
+    The kernel drops a dead process's locks, so a crashed worker never
+    leaks a slot. Waiters poll with backoff; they only wait at all when
+    every process together holds count slots.
+    """
+
+    def __init__(self, directory, name, count):
+        self.directory = directory
+        self.name = name
+        self.count = count
+        self._fds = None
+        self._pid = None
+        # Slot indexes this process holds
+        self._held = set()
+        self._next = 0
+
+    def _open(self):
+        if self._pid != os.getpid():
+            # Locks are per open file description, so a forked child needs its own
+            os.makedirs(self.directory, exist_ok=True)
+            self._fds = [
+                os.open(os.path.join(self.directory, f"{self.name}.{i}.lock"), os.O_RDWR | os.O_CREAT, 0o600)
+                for i in range(self.count)
+            ]
+            self._held = set()
+            self._pid = os.getpid()
+        return self._fds
+
+    def try_acquire(self):
+        """A slot index, or None when all are taken"""
+        fds = self._open()
+        for offset in range(self.count):
+            # Start where the last search ended, to spread contention over the files
+            index = (self._next + offset) % self.count
+            if index in self._held:
+                continue
+            try:
+                fcntl.flock(fds[index], fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                continue
+            self._held.add(index)
+            self._next = index + 1
+            return index
+        return None
+
+    async def acquire(self):
+        delay = 0.001
+        while True:
+            index = self.try_acquire()
+            if index is not None:
+                return index
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.05)
+
+    def release(self, index):
+        self._held.discard(index)
+        fcntl.flock(self._fds[index], fcntl.LOCK_UN)
+
+
+def shared_path(*parts):
+    """Path under SHARED_STATE_DIR, or None when state is not shared"""
+    if not SHARED_STATE_DIR:
+        return None
+    return os.path.join(SHARED_STATE_DIR, *parts)
@@ -0,0 +1,54 @@
+"""
+Single-flight: concurrent calls with the same key share one computation
+"""
+import asyncio
+
+
+class SingleFlight:
+    def __init__(self, name):
+        self.name = name
+        self._flights = {}
+        self.stats = {"started": 0, "collapsed": 0, "cancelled": 0}
+
+    async def do(self, key, fn):
+        """Return await fn(), or join the identical call already in flight.
+
+        The computation runs as its own task, so one caller giving up does
+        not fail the others; it is cancelled only when every caller has.
+        """
+        flight = self._flights.get(key)
+        if flight is None:
+            task = asyncio.ensure_future(fn())
+            flight = self._flights[key] = [task, 0]
+            task.add_done_callback(lambda _: self._flights.get(key) is flight and self._flights.pop(key))
+            self.stats["started"] += 1
+        else:
+            self.stats["collapsed"] += 1
+
+        task = flight[0]
+        flight[1] += 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if not task.done() and flight[1] == 1:
+                task.cancel()
+            raise
+        finally:
+            flight[1] -= 1
+
+    def running(self, key):
+        return key in self._flights
+
+    def cancel(self, key):
+        """Cancel the call in flight for key; its callers get CancelledError"""
+        flight = self._flights.pop(key, None)
+        if flight is not None and not flight[0].done():
+            flight[0].cancel()
+            self.stats["cancelled"] += 1
+
+
+execute_flights = SingleFlight("execute")
+generate_flights = SingleFlight("generate")
+compile_flights = SingleFlight("compile")
+# Background compiles at low priority, kept apart from compile_flights
+speculative_flights = SingleFlight("speculative_compile")
@@ -0,0 +1,78 @@
+"""
+Syntax pre-check: reject code that cannot run before writing files or spawning processes
+"""
+import os
+import subprocess
+import sys
+import traceback
+import warnings
+from app.services.languages import language_registry
+from app.services.node_pool import node_pool
+
+
+class SyntaxChecker:
+    """Python is compiled in-process with compile(), which catches what the
+    interpreter would reject before running (syntax, indentation, misplaced
+    return/break, ...), and reported exactly as the interpreter would print
+    it. That is only done when the server runs the same Python minor
+    version as the python toolchain, so the verdict matches. JavaScript is
+    compiled, not run, by a warm Node pool worker (like `node --check`).
+
+    Compiled languages are not pre-checked: their compilers stop at the
+    first errors already, so a syntax-only pass would only add a front-end
+    run to every valid program. Their compile errors are remembered by the
+    artifact cache instead, so resubmitted broken code fails without one.
+    TypeScript's syntax errors come from its (cached) transpile the same way.
+    """
+
+    def __init__(self, enabled=None):
+        self.enabled = enabled if enabled is not None else os.getenv("SYNTAX_PRECHECK", "1") == "1"
+        self._python_matches = None
+        self.stats = {"checked": 0, "rejected": 0}
+
+    async def check(self, spec, code):
+        """The error the toolchain would report for code, or None when it may be valid"""
+        checker = getattr(self, f"_check_{spec.name}", None)
+        if not self.enabled or checker is None or not await self._toolchain_matches(spec):
+            return None
+        self.stats["checked"] += 1
+        error = await checker(spec, code)
+        if error:
+            self.stats["rejected"] += 1
+        return error
+
+    async def _toolchain_matches(self, spec):
+        if spec.name == 'javascript':
+            return node_pool.enabled
+        if spec.name != 'python':
+            return True
+        if self._python_matches is None:
+            banner = await language_registry.version('python')
+            ours = f"Python {sys.version_info.major}.{sys.version_info.minor}."
+            self._python_matches = banner.startswith(ours)
+        return self._python_matches
+
+    async def _check_python(self, spec, code):
+        try:
+            with warnings.catch_warnings():
+                # e.g. invalid escape sequences; the program still runs
+                warnings.simplefilter('ignore')
+                compile(code, spec.source_file, 'exec', dont_inherit=True)
+        except SyntaxError as e:
+            return "".join(traceback.format_exception_only(type(e), e)).rstrip('\n')
+        except (ValueError, RecursionError, MemoryError):
+            # Null bytes, absurd nesting: leave the verdict to the interpreter
+            pass
+        return None
+
+    async def _check_javascript(self, spec, code):
+        try:
+            result = await node_pool.check(spec.source_file, code)
+        except (subprocess.TimeoutExpired, OSError, RuntimeError):
+            # No verdict; the run will tell
+            return None
+        # Anything but a clean answer (a crashed worker) leaves the verdict to the run
+        return result.stdout if result.returncode == 0 and result.stdout else None
+
+
+syntax_checker = SyntaxChecker()
@@ -0,0 +1,263 @@
+"""
+Pools of long-lived language runtimes that take jobs over a pipe protocol
+"""
+import asyncio
+import math
+import os
+import subprocess
+import time
+from app.services.execution_engine import OutputBuffer, ProcessResult, decode_output
+from app.services.resource_limits import ResourceLimits, ResourceUsage, resource
+
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+
+
+class PoolWorker:
+    """One runtime process speaking the worker protocol.
+
+    Requests are one header line `COMMAND \\t arg1 \\t arg2 \\t payloadLength`
+    followed by the payload; responses are one header line
+    `exitCode \\t stdoutLength \\t stderrLength \\t droppedBytes \\t dirty`
+    followed by stdout and stderr. Exit code "X" means the runtime itself
+    exited with the program's status. Both directions use dedicated pipes, so
+    the runtime's own stdin/stdout are /dev/null.
+    """
+
+    def __init__(self, name, proc, reader, writer):
+        self.name = name
+        self.proc = proc
+        self.reader = reader
+        self.writer = writer
+        self.jobs = 0
+        self.killed = False
+        # Set when a job left something behind (threads, memory) that could affect later jobs
+        self.dirty = False
+
+    @property
+    def alive(self):
+        return not self.killed and self.proc.returncode is None
+
+    def cpu_time(self):
+        """CPU seconds the worker process has used, or None where unknown"""
+        try:
+            with open(f'/proc/{self.proc.pid}/stat') as f:
+                # Fields after the parenthesised command name; utime and stime are the 14th and 15th
+                fields = f.read().rsplit(')', 1)[1].split()
+            return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+        except (OSError, IndexError, ValueError):
+            return None
+
+    def limit(self, limits, used):
+        """Let the next job use limits.cpu_seconds more CPU and write files
+        of up to limits.file_size_mb, within the worker's hard limits"""
+        if resource is None or not hasattr(resource, 'prlimit'):
+            return
+        soft = {
+            resource.RLIMIT_CPU: math.ceil(used) + limits.cpu_seconds if used is not None else 0,
+            resource.RLIMIT_FSIZE: limits.file_size_mb << 20,
+        }
+        for kind, value in soft.items():
+            if not value:
+                continue
+            try:
+                _, hard = resource.prlimit(self.proc.pid, kind)
+                if hard != resource.RLIM_INFINITY:
+                    value = min(value, hard)
+                resource.prlimit(self.proc.pid, kind, (value, hard))
+            except (OSError, ValueError):
+                pass
+
+    async def request(self, command, arg1, arg2, payload=b"", timeout=10):
+        """Send one job and wait for its response"""
+        self.jobs += 1
+        header = f"{command}\t{arg1}\t{arg2}\t{len(payload)}\n".encode('utf-8')
+        try:
+            self.writer.write(header + payload)
+            await self.writer.drain()
+            return await asyncio.wait_for(self._read_response(), timeout=timeout)
+        except asyncio.TimeoutError:
+            self.kill()
+            raise subprocess.TimeoutExpired(command, timeout)
+        except (ConnectionError, asyncio.CancelledError):
+            self.kill()
+            raise
+
+    async def _read_response(self):
+        try:
+            header = await self.reader.readline()
+            if not header:
+                raise ConnectionError(f"{self.name} exited unexpectedly")
+            status, out_len, err_len, dropped, dirty = header.decode('utf-8').strip().split('\t')
+            out_len, err_len, dropped = int(out_len), int(err_len), int(dropped)
+            if status != "X":
+                int(status)
+            stdout = await self.reader.readexactly(out_len)
+            stderr = await self.reader.readexactly(err_len)
+        except asyncio.IncompleteReadError:
+            raise ConnectionError(f"{self.name} exited mid-response")
+        except ValueError:
+            # Includes over-long lines; the stream position can no longer be trusted
+            raise ConnectionError(f"{self.name} sent a malformed response")
+        self.dirty = dirty == "1"
+        if status == "X":
+            # The program exited the runtime; its status is the worker's exit code
+            returncode = await self.proc.wait()
+        else:
+            returncode = int(status)
+        stdout_buffer, stderr_buffer = OutputBuffer(digest=True), OutputBuffer()
+        stdout_buffer.write(decode_output(stdout))
+        stderr_buffer.write(decode_output(stderr))
+        stdout, stdout_truncated = stdout_buffer.getvalue()
+        stderr, stderr_truncated = stderr_buffer.getvalue()
+        limit_exceeded = dropped > 0
+        return ProcessResult(
+            returncode=-9 if limit_exceeded else returncode,
+            stdout=stdout,
+            stderr=stderr,
+            truncated=limit_exceeded or stdout_truncated or stderr_truncated,
+            output_limit_exceeded=limit_exceeded,
+            stdout_digest=stdout_buffer.digest.hexdigest() if stdout_truncated else None,
+        )
+
+    def kill(self):
+        if self.alive:
+            self.killed = True
+            self.proc.kill()
+        self.writer.close()
+
+
+class WorkerPool:
+    """Up to `size` PoolWorkers, each recycled after max_jobs jobs, a dirty
+    job, a crash, a timeout or a job that hit one of its limits. Subclasses
+    provide the worker command.
+
+    A worker process starts under limits sized for its whole life: CPU for
+    max_jobs jobs, memory for a job plus the runtime's own overhead_mb, and
+    processes for every worker of the pool (RLIMIT_NPROC counts them all).
+    Before each job the soft CPU and file size limits are lowered to what
+    that job may use, so a job that spins is stopped by SIGXCPU like a
+    program run on its own.
+    """
+
+    name = "Worker"
+
+    def __init__(self, size, max_jobs, env=None, limits=None, overhead_mb=0):
+        self.size = size
+        self.max_jobs = max_jobs
+        self.env = env
+        # Largest limits of a single job
+        self.limits = limits
+        self.overhead_mb = overhead_mb
+        self._idle = []
+        self._count = 0
+        self._available = asyncio.Condition()
+
+    async def _command(self, request_fd, response_fd):
+        """Argument list starting a worker that uses the given pipe descriptors"""
+        raise NotImplementedError
+
+    def worker_limits(self):
+        """Limits of one worker process, for all of its jobs"""
+        limits = self.limits
+        return ResourceLimits(
+            cpu_seconds=limits.cpu_seconds * self.max_jobs,
+            memory_mb=limits.memory_mb + self.overhead_mb if limits.memory_mb else 0,
+            max_processes=limits.max_processes * self.size,
+            file_size_mb=limits.file_size_mb,
+        )
+
+    async def _submit(self, command, arg1, arg2, payload, timeout, limits=None):
+        limits = limits or self.limits
+        worker = await self._acquire()
+        started = time.perf_counter()
+        cpu_before = worker.cpu_time()
+        try:
+            if limits is not None:
+                worker.limit(limits, cpu_before)
+            try:
+                result = await worker.request(command, arg1, arg2, payload, timeout)
+                cpu_after = worker.cpu_time()
+            except ConnectionError:
+                # Crashed worker (out of memory, abort, CPU limit, ...): report like a dead process
+                returncode = await worker.proc.wait()
+                result = ProcessResult(returncode=returncode, stdout="", stderr=f"{self.name} crashed")
+                cpu_after = None
+            cpu_time = cpu_after - cpu_before if cpu_before is not None and cpu_after is not None else None
+            result.usage = ResourceUsage(time.perf_counter() - started, cpu_time, limits=limits)
+            result.usage.classify(result.returncode, result.stderr)
+            if result.usage.limit or result.output_limit_exceeded:
+                # Whatever the job left (a full heap, a spent CPU budget) should not meet the next one
+                worker.dirty = True
+            return result
+        finally:
+            await self._release(worker)
+
+    async def _acquire(self):
+        async with self._available:
+            while not self._idle and self._count >= self.size:
+                await self._available.wait()
+            if self._idle:
+                return self._idle.pop()
+            self._count += 1
+        try:
+            return await self._spawn()
+        except BaseException:
+            async with self._available:
+                self._count -= 1
+                self._available.notify()
+            raise
+
+    async def _release(self, worker):
+        async with self._available:
+            if worker.alive and not worker.dirty and worker.jobs < self.max_jobs:
+                self._idle.append(worker)
+            else:
+                # Recycle after max_jobs, leftovers of a job or a crash/timeout
+                worker.kill()
+                self._count -= 1
+            self._available.notify()
+
+    async def _spawn(self):
+        request_read, request_write = os.pipe()
+        response_read, response_write = os.pipe()
+        try:
+            cmd = await self._command(request_read, response_write)
+            limits = self.worker_limits() if self.limits is not None else None
+            limited = limits.command(cmd) if limits else None
+            proc = await asyncio.create_subprocess_exec(
+                *(limited or cmd),
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+                env=self.env,
+                pass_fds=(request_read, response_write),
+                preexec_fn=limits.apply if limits and not limited else None,
+            )
+        except BaseException:
+            os.close(request_write)
+            os.close(response_read)
+            raise
+        finally:
+            os.close(request_read)
+            os.close(response_write)
+        reader, writer = await open_pipe_streams(response_read, request_write)
+        worker = PoolWorker(self.name, proc, reader, writer)
+        try:
+            ready = await asyncio.wait_for(reader.readline(), timeout=30)
+        except BaseException:
+            worker.kill()
+            raise
+        if ready.strip() != b"READY":
+            worker.kill()
+            raise RuntimeError(f"{self.name} failed to start")
+        return worker
+
+
+async def open_pipe_streams(read_fd, write_fd):
+    """Wrap the parent's ends of two os.pipe()s in a StreamReader and StreamWriter"""
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), os.fdopen(read_fd, 'rb', 0))
+    transport, protocol = await loop.connect_write_pipe(
+        lambda: asyncio.StreamReaderProtocol(asyncio.StreamReader()), os.fdopen(write_fd, 'wb', 0)
+    )
+    return reader, asyncio.StreamWriter(transport, protocol, None, loop)
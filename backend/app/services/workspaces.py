@@ -0,0 +1,202 @@
+"""
+Pool of reusable scratch directories on a RAM-backed filesystem
+"""
+import asyncio
+import atexit
+import os
+import shutil
+import tempfile
+import threading
+
+ROOT_PREFIX = "regen-workspaces-"
+# How often the workspace of a running program is measured
+WATCH_INTERVAL = float(os.getenv("WORKSPACE_CHECK_SECONDS", "0.05"))
+MIN_WATCH_INTERVAL = 0.002
+# What a file or directory costs at least, even when empty (inode, page)
+ENTRY_BYTES = 4096
+
+
+def _default_base():
+    # /dev/shm is a tmpfs on Linux: no disk I/O or journal for short-lived files
+    if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK):
+        return '/dev/shm'
+    return tempfile.gettempdir()
+
+
+class WorkspacePool:
+    """Hands out empty directories for one job each.
+
+    Released directories are emptied and kept for the next job, so the hot
+    path does no mkdir/rmdir. Each process has its own root under base,
+    removed when it exits (or by the next pool, if it was killed). Once a
+    RAM-backed base filesystem holds max_bytes, new workspaces go to the
+    disk-backed temp directory instead, so scratch space cannot eat the
+    machine's memory. While a program runs, its workspace is bounded by its
+    limits' workspace_mb (see watch), and each file by RLIMIT_FSIZE.
+    """
+
+    def __init__(self, base=None, size=None, max_bytes=None):
+        self.base = base or os.getenv("WORKSPACE_DIR") or _default_base()
+        # Idle directories kept for reuse
+        self.size = size or int(os.getenv("WORKSPACE_POOL_SIZE", "32"))
+        self.max_bytes = max_bytes or int(os.getenv("WORKSPACE_MAX_MB", "512")) * 1024 * 1024
+        self.ram_backed = _filesystem_type(self.base) in ('tmpfs', 'ramfs')
+        self.root = None
+        self._pid = None
+        self._idle = []
+        self._created = 0
+        self._lock = threading.Lock()
+        self.stats = {"reused": 0, "created": 0, "overflow": 0}
+
+    def _prepare_root(self):
+        """(Re)create this process's root; a forked child must not share its parent's"""
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._idle = []
+        self.root = os.path.join(self.base, f"{ROOT_PREFIX}{self._pid}")
+        _remove_stale_roots(self.base)
+        shutil.rmtree(self.root, ignore_errors=True)
+        os.makedirs(self.root)
+        atexit.register(shutil.rmtree, self.root, True)
+
+    def acquire(self):
+        """An empty directory; give it back with release()"""
+        with self._lock:
+            self._prepare_root()
+            if self._idle:
+                self.stats["reused"] += 1
+                return self._idle.pop()
+            if self._full():
+                self.stats["overflow"] += 1
+                return tempfile.mkdtemp(prefix='regen-')
+            self._created += 1
+            self.stats["created"] += 1
+            path = os.path.join(self.root, str(self._created))
+        os.mkdir(path, 0o700)
+        return path
+
+    def release(self, path):
+        """Empty path and keep it for reuse, or remove it; never raises"""
+        if os.path.dirname(path) != self.root or not _empty(path):
+            shutil.rmtree(path, ignore_errors=True)
+            return
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append(path)
+                return
+        shutil.rmtree(path, ignore_errors=True)
+
+    def _full(self):
+        if not self.ram_backed:
+            return False
+        try:
+            usage = shutil.disk_usage(self.base)
+        except OSError:
+            return False
+        return usage.used >= self.max_bytes
+
+
+def disk_usage(path):
+    """Bytes the files and directories under path take up"""
+    total = 0
+    pending = [path]
+    while pending:
+        try:
+            with os.scandir(pending.pop()) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            pending.append(entry.path)
+                        # Allocated blocks: sparse files only count what they use
+                        total += max(entry.stat(follow_symlinks=False).st_blocks * 512, ENTRY_BYTES)
+                    except OSError:
+                        pass
+        except OSError:
+            # Removed or made unreadable while we looked
+            pass
+    return total
+
+
+async def watch(path, max_bytes, kill, interval=None):
+    """Call kill() once the files under path take up more than max_bytes,
+    then return True; runs until cancelled otherwise.
+
+    The workspace is measured at most every interval seconds, and more often
+    the faster it grows, so that at its current rate a program cannot get
+    past max_bytes between two checks.
+    """
+    interval = interval or WATCH_INTERVAL
+    loop = asyncio.get_running_loop()
+    used, then = 0, loop.time()
+    wait = MIN_WATCH_INTERVAL
+    while True:
+        await asyncio.sleep(wait)
+        # In a thread: a program may have created a great many files
+        now_used = await asyncio.to_thread(disk_usage, path)
+        if now_used > max_bytes:
+            kill()
+            return True
+        now = loop.time()
+        rate = max(now_used - used, 0) / max(now - then, 1e-6)
+        used, then = now_used, now
+        if rate:
+            wait = min(max((max_bytes - used) / 2 / rate, MIN_WATCH_INTERVAL), interval)
+        else:
+            # Idle so far (a program is still starting, or reading input): back off gradually
+            wait = min(wait * 2, interval)
+
+
+def _empty(path):
+    """Remove everything inside path; False when that failed"""
+    try:
+        # Programs may have made it read-only
+        os.chmod(path, 0o700)
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    shutil.rmtree(entry.path)
+                else:
+                    os.unlink(entry.path)
+        return True
+    except OSError:
+        return False
+
+
+def _filesystem_type(path):
+    """Type of the filesystem path is on, from /proc/mounts; None when unknown"""
+    path = os.path.realpath(path)
+    best, fs_type = "", None
+    try:
+        with open('/proc/mounts') as f:
+            for line in f:
+                fields = line.split()
+                mount_point = fields[1].replace('\\040', ' ')
+                inside = path == mount_point or path.startswith(mount_point.rstrip('/') + '/')
+                if inside and len(mount_point) > len(best):
+                    best, fs_type = mount_point, fields[2]
+    except (OSError, IndexError):
+        pass
+    return fs_type
+
+
+def _remove_stale_roots(base):
+    """Roots of pools whose process no longer exists"""
+    try:
+        names = os.listdir(base)
+    except OSError:
+        return
+    for name in names:
+        pid = name[len(ROOT_PREFIX):]
+        if not name.startswith(ROOT_PREFIX) or not pid.isdigit():
+            continue
+        try:
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            shutil.rmtree(os.path.join(base, name), ignore_errors=True)
+        except PermissionError:
+            # Another user's live process
+            pass
+
+
+workspace_pool = WorkspacePool()
@@ -0,0 +1,187 @@
+"""
+Python zygote: pre-imports common modules once, then forks a child per job.
+
+Started by app.services.python_zygote as a plain script (stdlib only):
+
+    python zygote_server.py SOCKET_PATH MODULE[,MODULE...]
+
+Each job is one connection on the Unix socket carrying a JSON header
+{"path": script, "cwd": dir | null, "limits": [[RLIMIT_NAME, soft, hard], ...]} and three file
+descriptors (stdin, stdout, stderr) via SCM_RIGHTS. The zygote forks a
+supervisor, which forks the job process and reports back two lines: the job
+pid, then "exit code \t CPU seconds \t peak RSS in KB".
+"""
+import atexit
+import builtins
+import importlib
+import json
+import os
+import resource
+import selectors
+import signal
+import socket
+import sys
+import traceback
+import types
+
+
+def preload(modules):
+    for name in modules:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            pass
+
+
+def serve(socket_path):
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(socket_path)
+    listener.listen(128)
+    # Supervisors are reaped automatically
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+
+    watch = selectors.DefaultSelector()
+    watch.register(listener, selectors.EVENT_READ)
+    # The backend keeps our stdin open; EOF means it has gone away
+    watch.register(sys.stdin, selectors.EVENT_READ)
+
+    sys.stdout.write("READY\n")
+    sys.stdout.flush()
+
+    while True:
+        ready = [key.fileobj for key, _ in watch.select()]
+        if sys.stdin in ready:
+            return None
+        conn, _ = listener.accept()
+        try:
+            header, fds, _, _ = socket.recv_fds(conn, 65536, 3)
+        except OSError:
+            conn.close()
+            continue
+        if len(fds) != 3:
+            conn.close()
+            for fd in fds:
+                os.close(fd)
+            continue
+
+        if os.fork() == 0:
+            watch.close()
+            listener.close()
+            return supervise(conn, json.loads(header), fds)
+
+        conn.close()
+        for fd in fds:
+            os.close(fd)
+
+
+def supervise(conn, job, fds):
+    """Runs in the supervisor; returns only in the job process"""
+    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+    pid = os.fork()
+    if pid == 0:
+        conn.close()
+        # Own process group so a timeout can kill anything the job spawns
+        os.setsid()
+        apply_rlimits(job.get("limits", []))
+        if job.get("cwd"):
+            try:
+                os.chdir(job["cwd"])
+            except OSError:
+                pass
+        for target, fd in enumerate(fds):
+            os.dup2(fd, target)
+            os.close(fd)
+        return job
+
+    for fd in fds:
+        os.close(fd)
+    try:
+        conn.sendall(f"{pid}\n".encode())
+        _, status, usage = os.wait4(pid, 0)
+        cpu_time = usage.ru_utime + usage.ru_stime
+        conn.sendall(f"{os.waitstatus_to_exitcode(status)}\t{cpu_time}\t{usage.ru_maxrss}\n".encode())
+    finally:
+        os._exit(0)
+
+
+def apply_rlimits(limits):
+    """Same as app.services.resource_limits.apply_rlimits (this script is stdlib only)"""
+    for name, soft, hard in limits:
+        kind = getattr(resource, name, None)
+        if kind is None:
+            continue
+        _, current = resource.getrlimit(kind)
+        if current != resource.RLIM_INFINITY:
+            soft, hard = min(soft, current), min(hard, current)
+        try:
+            resource.setrlimit(kind, (soft, hard))
+        except (ValueError, OSError):
+            pass
+
+
+def run_job(job):
+    """Execute the script the way `python path` would"""
+    path = job["path"]
+    sys.stdin = sys.__stdin__ = open(0, 'r', closefd=False)
+    sys.stdout = sys.__stdout__ = open(1, 'w', closefd=False)
+    sys.stderr = sys.__stderr__ = open(2, 'w', buffering=1, closefd=False)
+    sys.argv = [path]
+    sys.path.insert(0, os.path.dirname(path))
+
+    main = types.ModuleType('__main__')
+    main.__file__ = path
+    main.__builtins__ = builtins
+    sys.modules['__main__'] = main
+
+    try:
+        with open(path, 'rb') as f:
+            code = compile(f.read(), path, 'exec')
+    except SyntaxError as e:
+        traceback.print_exception(type(e), e, None)
+        return 1
+
+    try:
+        exec(code, main.__dict__)
+    except SystemExit as e:
+        return exit_code(e)
+    except BaseException as e:
+        # Drop this frame so the traceback starts in the user's script
+        traceback.print_exception(type(e), e, e.__traceback__.tb_next)
+        return 1
+    return 0
+
+
+def exit_code(e):
+    if e.code is None:
+        return 0
+    if isinstance(e.code, int):
+        return e.code
+    print(e.code, file=sys.stderr)
+    return 1
+
+
+def finish(code):
+    """Interpreter shutdown without tearing down every preloaded module"""
+    threading = sys.modules.get('threading')
+    if threading is not None:
+        for thread in threading.enumerate():
+            if thread is not threading.main_thread() and not thread.daemon:
+                thread.join()
+    try:
+        atexit._run_exitfuncs()
+    except SystemExit as e:
+        code = exit_code(e)
+    for stream in (sys.stdout, sys.stderr):
+        try:
+            stream.flush()
+        except Exception:
+            pass
+    os._exit(code & 0xFF)
+
+
+if __name__ == "__main__":
+    sys.path.pop(0)
+    preload([name for name in sys.argv[2].split(",") if name] if len(sys.argv) > 2 else [])
+    job = serve(sys.argv[1])
+    if job is not None:
+        finish(run_job(job))
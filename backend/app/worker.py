@@ -0,0 +1,134 @@
+"""
+Standalone worker that runs execution jobs from the job queue:
+
+    python -m app.worker
+
+Start as many as the machine has room for, next to or apart from the API;
+each runs up to JOB_WORKER_CONCURRENCY jobs at a time. SIGTERM stops it
+taking new jobs and lets the running ones finish.
+"""
+import asyncio
+import os
+import random
+import signal
+import socket
+from dotenv import load_dotenv
+from app.models import ExecutionResponse
+from app.services.admission import BATCH
+from app.services import metrics
+from app.services.code_executor import code_executor
+from app.services.execution_engine import execution_engine
+from app.services.job_queue import job_queue
+from app.services.shared_state import shared_path
+
+load_dotenv()
+
+# Wall-clock cap for a whole job (compile and run), beyond the per-phase timeouts
+JOB_TIMEOUT = int(os.getenv("JOB_TIMEOUT_SECONDS", "120"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "0.2"))
+JOB_WORKER_CONCURRENCY = int(os.getenv("JOB_WORKER_CONCURRENCY", str(os.cpu_count() or 1)))
+# Seconds between deletions of expired job results
+JOB_EXPIRE_EVERY = 60
+
+
+async def execute_job(payload):
+    """Run one 'execute' job (an ExecutionRequest) into an ExecutionResponse dict"""
+    language = payload["language"]
+    # Already accepted into the queue, so it waits for a slot rather than being turned away
+    async with execution_engine.slot(language, "jobs", BATCH, admit=False):
+        output, error, truncated, usage = await code_executor.execute(
+            language, payload["code"], payload.get("user_inputs") or "", payload.get("profile")
+        )
+    return ExecutionResponse(
+        output=output, error=error, truncated=truncated, **(usage.fields() if usage else {})
+    ).model_dump()
+
+
+JOB_HANDLERS = {"execute": execute_job}
+
+
+class JobWorker:
+    def __init__(self, queue=job_queue, concurrency=None, name=None):
+        self.queue = queue
+        self.concurrency = concurrency or JOB_WORKER_CONCURRENCY
+        self.name = name or f"{socket.gethostname()}:{os.getpid()}"
+        self._stopping = asyncio.Event()
+
+    def stop(self):
+        """Take no new jobs; run() returns once the running ones are finished"""
+        self._stopping.set()
+
+    async def run(self):
+        print(f"DEBUG: Job worker {self.name} taking up to {self.concurrency} jobs")
+        await asyncio.gather(self._expire_loop(), *(self._consume() for _ in range(self.concurrency)))
+
+    async def _consume(self):
+        while not self._stopping.is_set():
+            try:
+                job = await self.queue.claim(self.name, JOB_HANDLERS)
+            except Exception as e:
+                print(f"WARNING: Could not claim a job: {e}")
+                job = None
+            if job is None:
+                # Jittered, so idle workers do not poll in lockstep
+                await self._sleep(JOB_POLL_INTERVAL * random.uniform(0.5, 1.5))
+                continue
+            await self._run_job(job)
+
+    async def _run_job(self, job):
+        renew = asyncio.ensure_future(self._renew_lease(job["id"]))
+        try:
+            result = await asyncio.wait_for(JOB_HANDLERS[job["kind"]](job["payload"]), JOB_TIMEOUT)
+            await self.queue.complete(job["id"], self.name, result)
+        except asyncio.TimeoutError:
+            await self.queue.fail(job["id"], self.name, f"Job timeout ({JOB_TIMEOUT} seconds exceeded)")
+        except Exception as e:
+            # Program errors come back in the result; anything raised is the worker's own failure
+            print(f"WARNING: Job {job['id']} failed on attempt {job['attempts']}: {e}")
+            await self.queue.fail(job["id"], self.name, f"Worker error: {e}", retry=True)
+        finally:
+            renew.cancel()
+
+    async def _renew_lease(self, job_id):
+        while True:
+            await asyncio.sleep(self.queue.lease_seconds / 3)
+            try:
+                await self.queue.renew(job_id, self.name)
+            except Exception as e:
+                print(f"WARNING: Could not renew the lease of job {job_id}: {e}")
+
+    async def _expire_loop(self):
+        while not self._stopping.is_set():
+            try:
+                await self.queue.expire()
+            except Exception as e:
+                print(f"WARNING: Could not expire old jobs: {e}")
+            await self._sleep(JOB_EXPIRE_EVERY)
+
+    async def _sleep(self, seconds):
+        try:
+            await asyncio.wait_for(self._stopping.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def main():
+    await code_executor.warm_up()
+    worker = JobWorker()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, worker.stop)
+    # Shows up in the API's /metrics when both use the same SHARED_STATE_DIR
+    metrics_dir = shared_path("metrics")
+    publisher = metrics_dir and asyncio.ensure_future(
+        metrics.registry.publish_forever(metrics_dir, float(os.getenv("METRICS_PUBLISH_SECONDS", "5"))))
+    try:
+        await worker.run()
+    finally:
+        if publisher:
+            publisher.cancel()
+            await asyncio.gather(publisher, return_exceptions=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
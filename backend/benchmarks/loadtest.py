@@ -0,0 +1,418 @@
+"""
+Load test for /api/execute and /api/generate.
+
+Starts the API and a local Groq stand-in (benchmarks.mock_groq), drives both
+endpoints at a fixed concurrency and writes throughput and p50/p95/p99
+latencies as JSON, so results can be compared across commits on one box:
+
+    cd backend
+    python -m benchmarks.loadtest --requests 200 --concurrency 8 \
+        --mix python=4,javascript=2,c=2,cpp=1,go=1 --output results.json
+
+Execute latencies are split into phases: run time comes from each response's
+wall_time, compile time from the server's regen_compile_seconds histogram
+(estimated within its buckets, like Prometheus' histogram_quantile).
+Requests the server sheds with 429 (admission control) are counted as
+"rejected", apart from errors. Every request comes from one client address,
+so the started API lets that client queue up to --concurrency executions.
+Nothing leaves the machine; --url targets an already running API instead.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Sum the integers on stdin; (comment prefix, source)
+PROGRAMS = {
+    'python': ('#', 'import sys\nprint(sum(int(x) for x in sys.stdin.read().split()))\n'),
+    'javascript': ('//', (
+        "const data = require('fs').readFileSync(0, 'utf8').split(/\\s+/).filter(Boolean);\n"
+        "console.log(data.reduce((a, b) => a + Number(b), 0));\n"
+    )),
+    'typescript': ('//', (
+        "const data: string[] = require('fs').readFileSync(0, 'utf8').split(/\\s+/).filter(Boolean);\n"
+        "console.log(data.reduce((a: number, b: string) => a + Number(b), 0));\n"
+    )),
+    'c': ('//', (
+        '#include <stdio.h>\n'
+        'int main(void) { long s = 0, x; while (scanf("%ld", &x) == 1) s += x; printf("%ld\\n", s); return 0; }\n'
+    )),
+    'cpp': ('//', (
+        '#include <iostream>\n'
+        'int main() { long s = 0, x; while (std::cin >> x) s += x; std::cout << s << std::endl; }\n'
+    )),
+    'go': ('//', (
+        'package main\n\nimport "fmt"\n\n'
+        'func main() {\n\tvar s, x int64\n\tfor {\n\t\tif _, err := fmt.Scan(&x); err != nil {\n\t\t\tbreak\n\t\t}\n'
+        '\t\ts += x\n\t}\n\tfmt.Println(s)\n}\n'
+    )),
+    'ruby': ('#', 'puts STDIN.read.split.map(&:to_i).sum\n'),
+    'java': ('//', (
+        'import java.util.Scanner;\n\npublic class Main {\n    public static void main(String[] args) {\n'
+        '        Scanner in = new Scanner(System.in);\n        long s = 0;\n'
+        '        while (in.hasNextLong()) s += in.nextLong();\n        System.out.println(s);\n    }\n}\n'
+    )),
+    'csharp': ('//', (
+        'using System;\nusing System.Linq;\n\nclass Program {\n    static void Main() {\n'
+        '        Console.WriteLine(Console.In.ReadToEnd().Split((char[])null, StringSplitOptions.RemoveEmptyEntries)'
+        '.Sum(long.Parse));\n    }\n}\n'
+    )),
+}
+
+
+def parse_mix(text):
+    """'python=3,c=1' -> {'python': 3.0, 'c': 1.0}"""
+    mix = {}
+    for part in filter(None, text.split(',')):
+        name, _, weight = part.partition('=')
+        if name not in PROGRAMS:
+            raise SystemExit(f"No benchmark program for {name}; choose from {', '.join(PROGRAMS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def percentiles(values):
+    """count, mean and p50/p95/p99 (linear interpolation) of a list of seconds"""
+    if not values:
+        return {'count': 0}
+    ordered = sorted(values)
+
+    def at(q):
+        rank = q * (len(ordered) - 1)
+        low = int(rank)
+        high = min(low + 1, len(ordered) - 1)
+        return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+    return {
+        'count': len(ordered),
+        'mean': round(sum(ordered) / len(ordered), 6),
+        'p50': round(at(0.50), 6),
+        'p95': round(at(0.95), 6),
+        'p99': round(at(0.99), 6),
+        'max': round(ordered[-1], 6),
+    }
+
+
+def parse_histograms(text, name):
+    """{labels tuple: {le: cumulative count}} of one histogram in a /metrics page"""
+    histograms = {}
+    prefix = name + "_bucket{"
+    for line in text.splitlines():
+        if not line.startswith(prefix):
+            continue
+        labels_text, _, value = line[len(prefix):].rpartition('} ')
+        labels = dict(part.split('=', 1) for part in labels_text.split(','))
+        labels = {key: raw.strip('"') for key, raw in labels.items()}
+        le = labels.pop('le')
+        bound = float('inf') if le == '+Inf' else float(le)
+        histograms.setdefault(tuple(sorted(labels.items())), {})[bound] = float(value)
+    return histograms
+
+
+def histogram_quantiles(buckets):
+    """count and p50/p95/p99 estimated from cumulative {le: count}, like histogram_quantile()"""
+    bounds = sorted(buckets)
+    total = buckets[bounds[-1]] if bounds else 0
+    if not total:
+        return {'count': 0}
+
+    def at(q):
+        rank = q * total
+        lower_bound, lower_count = 0.0, 0.0
+        for bound in bounds:
+            count = buckets[bound]
+            if count >= rank:
+                if bound == float('inf'):
+                    return lower_bound
+                if count == lower_count:
+                    return bound
+                return lower_bound + (bound - lower_bound) * (rank - lower_count) / (count - lower_count)
+            lower_bound, lower_count = bound, count
+        return lower_bound
+
+    return {'count': int(total), 'p50': round(at(0.50), 6), 'p95': round(at(0.95), 6), 'p99': round(at(0.99), 6)}
+
+
+def histogram_delta(before, after):
+    """Per-label bucket counts observed between two scrapes"""
+    delta = {}
+    for labels, buckets in after.items():
+        previous = before.get(labels, {})
+        delta[labels] = {le: count - previous.get(le, 0) for le, count in buckets.items()}
+    return delta
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+async def wait_until_up(client, url, timeout=60):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            await client.get(url)
+            return
+        except httpx.TransportError:
+            if time.monotonic() > deadline:
+                raise SystemExit(f"{url} did not come up within {timeout} seconds")
+            await asyncio.sleep(0.2)
+
+
+class Servers:
+    """The API (app.server, with its state shared across workers) and the
+    mock completion endpoint as subprocesses"""
+
+    def __init__(self, args):
+        self.args = args
+        self.processes = []
+        self.scratch = tempfile.mkdtemp(prefix='regen-bench-')
+        self.api_url = f"http://127.0.0.1:{free_port()}"
+        self.mock_url = f"http://127.0.0.1:{free_port()}"
+
+    def start(self):
+        mock_port = self.mock_url.rsplit(':', 1)[1]
+        self._spawn([
+            sys.executable, '-m', 'benchmarks.mock_groq', '--port', mock_port,
+            '--latency', str(self.args.llm_latency), '--jitter', str(self.args.llm_jitter),
+            '--token-delay', str(self.args.llm_token_delay),
+        ], os.environ)
+        env = dict(os.environ)
+        env.update({
+            'GROQ_API_URL': f"{self.mock_url}/openai/v1/chat/completions",
+            'GROQ_API_KEY': 'benchmark',
+            # Cold, private caches so runs are comparable
+            'ARTIFACT_CACHE_DIR': os.path.join(self.scratch, 'artifacts'),
+            'GENERATE_CACHE_DB': os.path.join(self.scratch, 'generate-cache.sqlite3'),
+            # Slots, metrics and sessions shared by the workers, as in production
+            'SHARED_STATE_DIR': os.path.join(self.scratch, 'shared'),
+            # All requests come from this one client; only the shared limits should shed them
+            'EXECUTION_QUEUE_PER_CLIENT': str(max(self.args.concurrency, 16)),
+        })
+        os.makedirs(env['SHARED_STATE_DIR'])
+        self._spawn([
+            sys.executable, '-m', 'app.server', '--host', '127.0.0.1',
+            '--port', self.api_url.rsplit(':', 1)[1], '--workers', str(self.args.workers),
+        ], env)
+
+    def _spawn(self, cmd, env):
+        log = open(os.path.join(self.scratch, f"server-{len(self.processes)}.log"), 'wb')
+        self.processes.append(subprocess.Popen(cmd, cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT))
+
+    def stop(self):
+        for proc in self.processes:
+            proc.terminate()
+        for proc in self.processes:
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+
+def execute_workload(args, languages, rng):
+    """[(language, code, stdin, expected)] in a fixed order for the seed"""
+    names = list(languages)
+    weights = [languages[name] for name in names]
+    workload = []
+    for i in range(args.requests):
+        language = rng.choices(names, weights)[0]
+        comment, code = PROGRAMS[language]
+        if rng.random() < args.unique:
+            # A new source misses the artifact cache and compiles
+            code = f"{comment} benchmark {args.seed}-{i}\n{code}"
+        numbers = [rng.randint(-1000, 1000) for _ in range(rng.randint(1, 50))]
+        workload.append((language, code, " ".join(map(str, numbers)) + "\n", str(sum(numbers))))
+    return workload
+
+
+async def drive(concurrency, jobs, send):
+    """Run send(job) for every job with at most concurrency in flight; returns (samples, seconds)"""
+    queue = asyncio.Queue()
+    for job in jobs:
+        queue.put_nowait(job)
+    samples = []
+
+    async def worker():
+        while not queue.empty():
+            job = queue.get_nowait()
+            started = time.perf_counter()
+            sample = await send(job)
+            sample['latency'] = time.perf_counter() - started
+            samples.append(sample)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return samples, time.perf_counter() - started
+
+
+async def run_execute(client, args, languages, rng):
+    async def send(job):
+        language, code, stdin, expected = job
+        sample = {'language': language}
+        try:
+            response = await client.post('/api/execute', json={
+                'code': code, 'language': language, 'user_inputs': stdin,
+            })
+            sample['status'] = response.status_code
+            if response.status_code == 429:
+                sample['rejected'] = True
+            if response.status_code == 200:
+                body = response.json()
+                sample['run'] = body.get('wall_time')
+                sample['ok'] = not body.get('error') and body.get('output', '').strip() == expected
+            else:
+                sample['ok'] = False
+        except httpx.HTTPError as e:
+            sample.update(status=None, ok=False, exception=type(e).__name__)
+        return sample
+
+    # Warm-up requests (toolchain probes, worker pools, page cache) are not measured
+    warmup = execute_workload(argparse.Namespace(**{**vars(args), 'requests': args.warmup, 'unique': 0}),
+                              languages, random.Random(args.seed))
+    await drive(args.concurrency, warmup, send)
+
+    before = parse_histograms((await client.get('/metrics')).text, 'regen_compile_seconds')
+    samples, elapsed = await drive(args.concurrency, execute_workload(args, languages, rng), send)
+    after = parse_histograms((await client.get('/metrics')).text, 'regen_compile_seconds')
+    compiles = histogram_delta(before, after)
+
+    report = summarize(samples, elapsed)
+    report['by_language'] = {}
+    for language in languages:
+        mine = [s for s in samples if s['language'] == language]
+        compile_buckets = {}
+        for labels, buckets in compiles.items():
+            if dict(labels).get('language') == language:
+                for le, count in buckets.items():
+                    compile_buckets[le] = compile_buckets.get(le, 0) + count
+        report['by_language'][language] = {
+            **summarize(mine, elapsed),
+            'run': percentiles([s['run'] for s in mine if s.get('run') is not None]),
+            'compile': histogram_quantiles(compile_buckets),
+        }
+    return report
+
+
+async def run_generate(client, args, rng):
+    languages = list(parse_mix(args.mix))
+
+    async def send(i):
+        sample = {}
+        try:
+            response = await client.post('/api/generate', json={
+                # Distinct prompts, so the response cache and single-flight do not hide the upstream call
+                'prompt': f"sum the integers on stdin (benchmark {args.seed}-{i})",
+                'language': rng.choice(languages),
+            })
+            sample['status'] = response.status_code
+            sample['rejected'] = response.status_code == 429
+            sample['ok'] = response.status_code == 200 and bool(response.json().get('content'))
+        except httpx.HTTPError as e:
+            sample.update(status=None, ok=False, exception=type(e).__name__)
+        return sample
+
+    samples, elapsed = await drive(args.generate_concurrency, range(args.generate_requests), send)
+    return summarize(samples, elapsed)
+
+
+def summarize(samples, elapsed):
+    """Counts and latencies; rejected (429) requests are neither errors nor in the latencies"""
+    served = [s for s in samples if not s.get('rejected')]
+    return {
+        'requests': len(samples),
+        'rejected': len(samples) - len(served),
+        'errors': sum(1 for s in served if not s.get('ok')),
+        'throughput_rps': round(len(served) / elapsed, 3) if elapsed else None,
+        'latency': percentiles([s['latency'] for s in served]),
+    }
+
+
+def environment():
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=BACKEND_DIR, capture_output=True, text=True, timeout=5
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        'commit': commit,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+
+
+async def main(args):
+    rng = random.Random(args.seed)
+    languages = parse_mix(args.mix)
+    servers = None
+    url = args.url
+    if not url:
+        servers = Servers(args)
+        servers.start()
+        url = servers.api_url
+    try:
+        limits = httpx.Limits(max_connections=max(args.concurrency, args.generate_concurrency) + 2)
+        async with httpx.AsyncClient(base_url=url, timeout=args.timeout, limits=limits) as client:
+            await wait_until_up(client, '/')
+            available = {
+                language['id'] for language in (await client.get('/api/languages')).json()
+                if language.get('available')
+            }
+            skipped = sorted(set(languages) - available)
+            for language in skipped:
+                print(f"WARNING: {language} is not available on this machine; left out of the mix")
+                del languages[language]
+
+            results = {'environment': environment(), 'config': vars(args), 'skipped_languages': skipped}
+            if languages and args.requests:
+                results['execute'] = await run_execute(client, args, languages, rng)
+            if args.generate_requests:
+                results['generate'] = await run_generate(client, args, rng)
+    finally:
+        if servers is not None:
+            servers.stop()
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + "\n")
+    print(text)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument('--url', help="benchmark a running API instead of starting one")
+    parser.add_argument('--requests', type=int, default=200, help="measured /api/execute requests")
+    parser.add_argument('--warmup', type=int, default=20, help="unmeasured /api/execute requests first")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--mix', default='python=4,javascript=2,c=2,cpp=1,go=1',
+                        help="language=weight list for /api/execute")
+    parser.add_argument('--unique', type=float, default=0.1,
+                        help="fraction of submissions with a new source (artifact cache misses)")
+    parser.add_argument('--generate-requests', type=int, default=50)
+    parser.add_argument('--generate-concurrency', type=int, default=8)
+    parser.add_argument('--llm-latency', type=float, default=0.3, help="mock time to first token, seconds")
+    parser.add_argument('--llm-jitter', type=float, default=0.05)
+    parser.add_argument('--llm-token-delay', type=float, default=0.005)
+    parser.add_argument('--workers', type=int, default=1, help="API worker processes (app.server --workers)")
+    parser.add_argument('--timeout', type=float, default=120, help="per-request client timeout, seconds")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help="write the JSON results here too")
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    asyncio.run(main(parse_args()))
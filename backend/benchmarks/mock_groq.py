@@ -0,0 +1,84 @@
+"""
+Local stand-in for the Groq chat-completions endpoint that GroqService calls.
+
+Streams a canned completion as Server-Sent Events after a configurable delay,
+so /api/generate can be load-tested without network access or an API key:
+
+    python -m benchmarks.mock_groq --port 8100 --latency 0.3 --token-delay 0.01
+    GROQ_API_URL=http://127.0.0.1:8100/openai/v1/chat/completions uvicorn app.main:app
+"""
+import argparse
+import asyncio
+import json
+import random
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+COMPLETION = '''Here is the program:
+
+```python
+import sys
+
+def main():
+    data = sys.stdin.read().split()
+    print(sum(int(x) for x in data))
+
+if __name__ == "__main__":
+    main()
+```
+'''
+
+app = FastAPI(title="Mock Groq")
+# Set from the command line
+app.state.latency = 0.3
+app.state.jitter = 0.0
+app.state.token_delay = 0.0
+app.state.tokens = 40
+
+
+def _chunks(text, count):
+    size = max(1, len(text) // count)
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+@app.post("/openai/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    state = request.app.state
+    # Time to first token
+    await asyncio.sleep(max(0.0, state.latency + random.uniform(-state.jitter, state.jitter)))
+    chunks = _chunks(COMPLETION, state.tokens)
+
+    if not body.get("stream"):
+        return JSONResponse({"choices": [{"message": {"role": "assistant", "content": COMPLETION}}]})
+
+    async def events():
+        for chunk in chunks:
+            yield f"data: {json.dumps({'choices': [{'delta': {'content': chunk}}]})}\n\n"
+            if state.token_delay:
+                await asyncio.sleep(state.token_delay)
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency", type=float, default=0.3, help="seconds before the first token")
+    parser.add_argument("--jitter", type=float, default=0.0, help="+/- seconds added to --latency")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="seconds between streamed chunks")
+    parser.add_argument("--tokens", type=int, default=40, help="chunks the completion is split into")
+    args = parser.parse_args()
+    app.state.latency = args.latency
+    app.state.jitter = args.jitter
+    app.state.token_delay = args.token_delay
+    app.state.tokens = args.tokens
+
+    import uvicorn
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+import asyncio
+import pytest
+from app.services.admission import BATCH, FairScheduler, Overloaded
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def fill(scheduler, language="python"):
+    await scheduler.acquire(language, "holder")
+
+
+def test_a_flooding_client_does_not_delay_others():
+    async def scenario():
+        scheduler = FairScheduler(1, 1, max_queue=100, max_per_client=100, queue_timeout=60)
+        await fill(scheduler)
+        order = []
+
+        async def request(client):
+            await scheduler.acquire("python", client)
+            order.append(client)
+            scheduler.release("python")
+
+        flood = [asyncio.ensure_future(request("flooder")) for _ in range(5)]
+        await asyncio.sleep(0)
+        polite = asyncio.ensure_future(request("polite"))
+        await asyncio.sleep(0)
+        scheduler.release("python")
+        await asyncio.gather(*flood, polite)
+        return order
+
+    order = run(scenario())
+    assert order.index("polite") <= 1
+
+
+def test_interactive_work_overtakes_batch_work():
+    async def scenario():
+        scheduler = FairScheduler(1, 1, max_queue=100, max_per_client=100, queue_timeout=60)
+        await fill(scheduler)
+        order = []
+
+        async def request(client, priority):
+            await scheduler.acquire("python", client, priority, admit=False)
+            order.append(client)
+            scheduler.release("python")
+
+        batch = [asyncio.ensure_future(request("batch", BATCH)) for _ in range(4)]
+        await asyncio.sleep(0)
+        interactive = [asyncio.ensure_future(request("user", "interactive")) for _ in range(4)]
+        await asyncio.sleep(0)
+        scheduler.release("python")
+        await asyncio.gather(*batch, *interactive)
+        return order
+
+    order = run(scenario())
+    assert order[:5].count("user") >= 3
+
+
+def test_full_queues_and_long_waits_are_rejected_with_a_retry_hint():
+    async def scenario():
+        # Room for two executions, one of them Python
+        scheduler = FairScheduler(2, 1, max_queue=2, max_per_client=1, queue_timeout=60)
+        await fill(scheduler)
+        waiting = [asyncio.ensure_future(scheduler.acquire("python", client)) for client in ("a", "b")]
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded) as full:
+            await scheduler.acquire("python", "c")
+        with pytest.raises(Overloaded):
+            scheduler.check("a")
+        # The free slot still goes to another language
+        await asyncio.wait_for(scheduler.acquire("go", "c"), 1)
+
+        slow = FairScheduler(1, 1, queue_timeout=1)
+        slow.service_seconds = 5
+        await fill(slow)
+        with pytest.raises(Overloaded) as deadline:
+            await slow.acquire("python", "d")
+        for task in waiting:
+            task.cancel()
+        return full.value, deadline.value, scheduler.stats, slow.stats
+
+    full, deadline, stats, slow_stats = run(scenario())
+    assert full.retry_after >= 1 and deadline.retry_after >= 5
+    assert stats["queue_full"] == 2 and slow_stats["deadline"] == 1
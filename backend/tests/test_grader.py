@@ -0,0 +1,34 @@
+import hashlib
+import random
+from app.services.execution_engine import OutputBuffer
+from app.services.grader import OutputDigest, compare_output
+
+
+def test_digest_matches_normalized_output_however_it_is_split():
+    rng = random.Random(11)
+    for _ in range(500):
+        text = "".join(rng.choice("ab \t\r\n") for _ in range(rng.randint(0, 60)))
+        cuts = sorted(rng.sample(range(len(text) + 1), min(len(text) + 1, rng.randint(0, 6))))
+        digest = OutputDigest()
+        for i, j in zip([0, *cuts], [*cuts, len(text)]):
+            digest.write(text[i:j])
+        lines = [line.rstrip() for line in text.replace('\r\n', '\n').split('\n')]
+        while lines and not lines[-1]:
+            lines.pop()
+        whole = "".join(line + '\n' for line in lines)
+        assert digest.hexdigest() == hashlib.sha256(whole.encode('utf-8')).hexdigest()
+
+
+def test_truncated_output_is_graded_whole():
+    expected = "".join(f"{i}\n" for i in range(1000))
+    buffer = OutputBuffer(max_bytes=200, max_lines=20, digest=True)
+    for i in range(0, len(expected), 37):
+        buffer.write(expected[i:i + 37])
+    kept, truncated = buffer.getvalue()
+    assert truncated
+    assert not compare_output(expected, kept)[0]
+    assert compare_output(expected + "\n\n", kept, actual_digest=buffer.digest.hexdigest()) == (True, None)
+
+    passed, diff = compare_output(expected.replace("500\n", "501\n"), kept, actual_digest=buffer.digest.hexdigest())
+    assert not passed
+    assert diff.startswith("(output truncated")
@@ -0,0 +1,70 @@
+import time
+from fastapi import FastAPI, WebSocket
+from fastapi.testclient import TestClient
+from app.services.execution_engine import execution_engine
+from app.services.interactive_sessions import TRY_AGAIN_LATER, InteractiveSessions
+
+PROGRAM = 'name = input("Name? ")\nprint(f"Hello, {name}!")\n'
+
+
+def client_for(sessions):
+    app = FastAPI()
+
+    @app.websocket("/ws")
+    async def endpoint(websocket: WebSocket):
+        await sessions.serve(websocket)
+
+    return TestClient(app)
+
+
+def test_program_reads_input_as_it_is_sent():
+    with client_for(InteractiveSessions()).websocket_connect("/ws") as ws:
+        ws.send_json({"type": "start", "language": "python", "code": PROGRAM})
+        assert ws.receive_json() == {"type": "started"}
+        assert ws.receive_json() == {"type": "stdout", "data": "Name? "}
+        ws.send_json({"type": "input", "data": "Ada\n"})
+        output = ""
+        while (message := ws.receive_json())["type"] == "stdout":
+            output += message["data"]
+        assert output == "Hello, Ada!\n"
+        assert message["type"] == "exit" and message["exit_code"] == 0
+
+
+def test_idle_sessions_are_closed():
+    with client_for(InteractiveSessions(idle_timeout=0.3)).websocket_connect("/ws") as ws:
+        ws.send_json({"type": "start", "language": "python", "code": PROGRAM})
+        assert ws.receive_json()["type"] == "started"
+        assert ws.receive_json()["type"] == "stdout"
+        message = ws.receive_json()
+        assert message["type"] == "exit" and "idle" in message["error"]
+
+
+def test_sessions_beyond_the_cap_are_turned_away():
+    sessions = InteractiveSessions(max_sessions=1)
+    client = client_for(sessions)
+    with client.websocket_connect("/ws") as first:
+        first.send_json({"type": "start", "language": "python", "code": PROGRAM})
+        assert first.receive_json()["type"] == "started"
+        with client.websocket_connect("/ws") as second:
+            message = second.receive_json()
+            assert message["type"] == "exit" and "Too many" in message["error"]
+            assert second.receive()["code"] == TRY_AGAIN_LATER
+    assert sessions.stats["rejected"] == 1
+
+
+def test_running_sessions_hold_an_execution_slot():
+    running = execution_engine.scheduler.running
+    with client_for(InteractiveSessions()).websocket_connect("/ws") as ws:
+        ws.send_json({"type": "start", "language": "python", "code": PROGRAM})
+        assert ws.receive_json()["type"] == "started"
+        assert ws.receive_json()["type"] == "stdout"
+        # Waiting for input still counts against the engine's capacity
+        assert execution_engine.scheduler.running == running + 1
+        ws.send_json({"type": "input", "data": "Ada\n"})
+        while ws.receive_json()["type"] != "exit":
+            pass
+    # Released once the session ends, which may be just after the exit message
+    deadline = time.monotonic() + 2
+    while execution_engine.scheduler.running != running and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert execution_engine.scheduler.running == running
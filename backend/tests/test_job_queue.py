@@ -0,0 +1,63 @@
+import asyncio
+from app.services.job_queue import DONE, FAILED, QUEUED, RUNNING, JobQueue
+
+
+def make_queue(tmp_path, **kwargs):
+    return JobQueue(db_path=str(tmp_path / "jobs.sqlite3"), **kwargs)
+
+
+def test_jobs_are_claimed_once_in_submission_order(tmp_path):
+    async def main():
+        queue = make_queue(tmp_path)
+        first = await queue.submit("execute", {"n": 1})
+        second = await queue.submit("execute", {"n": 2})
+        claimed = await asyncio.gather(*(queue.claim(f"w{i}") for i in range(3)))
+        assert [job and job["id"] for job in claimed].count(None) == 1
+        assert sorted(job["payload"]["n"] for job in claimed if job) == [1, 2]
+
+        assert await queue.complete(first, next(j["worker"] for j in claimed if j and j["id"] == first), {"ok": 1})
+        job = await queue.get(first)
+        assert job["status"] == DONE and job["result"] == {"ok": 1}
+        assert (await queue.get(second))["status"] == RUNNING
+        assert await queue.claim("w9", kinds=["other"]) is None
+    asyncio.run(main())
+
+
+def test_failures_are_retried_until_attempts_run_out(tmp_path):
+    async def main():
+        queue = make_queue(tmp_path, max_attempts=2)
+        job_id = await queue.submit("execute", {})
+        for attempt in (1, 2):
+            job = await queue.claim("w")
+            assert job["attempts"] == attempt
+            await queue.fail(job_id, "w", "infrastructure", retry=True)
+        job = await queue.get(job_id)
+        assert job["status"] == FAILED and job["error"] == "infrastructure"
+    asyncio.run(main())
+
+
+def test_expired_leases_are_requeued_and_finished_jobs_expire(tmp_path):
+    async def main():
+        queue = make_queue(tmp_path, lease_seconds=1, max_attempts=1, result_ttl=1)
+        lost = await queue.submit("execute", {})
+        await queue.claim("dead worker")
+        # Only the live worker may finish a job it holds
+        assert not await queue.complete(lost, "someone else", {})
+        await asyncio.sleep(1.1)
+        assert await queue.claim("w") is None
+        job = await queue.get(lost)
+        assert job["status"] == FAILED and "Worker lost" in job["error"]
+
+        queue.max_attempts = 2
+        retried = await queue.submit("execute", {})
+        await queue.claim("dead worker")
+        await asyncio.sleep(1.1)
+        job = await queue.claim("w")
+        assert job["id"] == retried and job["attempts"] == 2
+
+        await asyncio.sleep(1.1)
+        assert await queue.expire() == 1
+        assert await queue.get(lost) is None
+        assert (await queue.counts()) == {RUNNING: 1}
+        assert QUEUED not in await queue.counts()
+    asyncio.run(main())
@@ -0,0 +1,87 @@
+from app.services.metrics import Registry
+
+
+def test_histogram_buckets_are_cumulative_and_inclusive():
+    registry = Registry()
+    latency = registry.histogram("latency_seconds", "Latency", ("language",), buckets=(0.1, 1))
+    for value in (0.05, 0.1, 0.5, 2):
+        latency.observe("python", value=value)
+    lines = registry.render().splitlines()
+    assert 'latency_seconds_bucket{language="python",le="0.1"} 2' in lines
+    assert 'latency_seconds_bucket{language="python",le="1"} 3' in lines
+    assert 'latency_seconds_bucket{language="python",le="+Inf"} 4' in lines
+    assert 'latency_seconds_sum{language="python"} 2.65' in lines
+    assert 'latency_seconds_count{language="python"} 4' in lines
+
+
+def test_counters_gauges_and_collectors():
+    registry = Registry()
+    runs = registry.counter("runs_total", "Runs", ("outcome",))
+    queued = registry.gauge("queued", "Queued")
+    stats = {"hits": 0}
+    registry.collector(lambda: runs.set("hit", value=stats["hits"]))
+    runs.inc("ok")
+    runs.inc("ok")
+    queued.inc()
+    queued.dec()
+    stats["hits"] = 3
+    text = registry.render()
+    assert "# TYPE runs_total counter\n" in text
+    assert 'runs_total{outcome="ok"} 2\n' in text
+    assert 'runs_total{outcome="hit"} 3\n' in text
+    assert "queued 0\n" in text
+
+
+def test_label_values_are_escaped():
+    registry = Registry()
+    registry.counter("errors_total", "Errors", ("message",)).inc('say "hi"\\\n')
+    assert 'errors_total{message="say \\"hi\\"\\\\\\n"} 1' in registry.render()
+
+
+def test_snapshots_merge_across_processes(tmp_path):
+    import json
+    import subprocess
+    import sys
+
+    def make():
+        registry = Registry()
+        runs = registry.counter("runs_total", "Runs")
+        queued = registry.gauge("queued", "Queued")
+        latency = registry.histogram("latency_seconds", "Latency", buckets=(1,))
+        return registry, runs, queued, latency
+
+    other, runs, queued, latency = make()
+    runs.inc(amount=2)
+    queued.inc(amount=5)
+    latency.observe(value=0.5)
+    exited = subprocess.run([sys.executable, "-c", "import os; print(os.getpid())"],
+                            capture_output=True, text=True).stdout.strip()
+    (tmp_path / f"{exited}.json").write_text(json.dumps(other.snapshot()))
+
+    registry, runs, queued, latency = make()
+    runs.inc()
+    queued.inc()
+    latency.observe(value=2)
+    lines = registry.render(registry.read_snapshots(str(tmp_path))).splitlines()
+    assert "runs_total 3" in lines
+    # Gauges of processes that have exited are dropped
+    assert "queued 1" in lines
+    assert 'latency_seconds_bucket{le="1"} 1' in lines
+    assert "latency_seconds_count 2" in lines
+    # The exited process's file is folded into the retired totals, so its pid can be reused
+    assert not (tmp_path / f"{exited}.json").exists()
+    assert registry.render(registry.read_snapshots(str(tmp_path))).splitlines() == lines
+
+
+def test_retired_processes_keep_counting(tmp_path):
+    registry = Registry()
+    runs = registry.counter("runs_total", "Runs")
+    runs.inc(amount=2)
+    registry.publish(str(tmp_path))
+    registry.retire(str(tmp_path))
+    registry.retire(str(tmp_path))
+    assert sorted(p.name for p in tmp_path.glob("*.json")) == ["retired.json"]
+
+    other = Registry()
+    other.counter("runs_total", "Runs").inc()
+    assert "runs_total 3" in other.render(other.read_snapshots(str(tmp_path))).splitlines()
@@ -0,0 +1,77 @@
+import random
+from app.services.execution_engine import OutputBuffer
+
+
+def capture(chunks, max_bytes=100, max_lines=10):
+    buffer = OutputBuffer(max_bytes=max_bytes, max_lines=max_lines)
+    for chunk in chunks:
+        buffer.write(chunk)
+    return buffer.getvalue()
+
+
+def test_output_within_limits_is_kept_whole():
+    text = "x" * 100
+    assert capture([text]) == (text, False)
+    assert capture([text[:30], text[30:]]) == (text, False)
+
+
+def test_lines_within_limits_are_kept_whole():
+    text = "line\n" * 10
+    assert capture([text], max_bytes=1000) == (text, False)
+    assert capture(list(text), max_bytes=1000) == (text, False)
+
+
+def test_short_head_lends_its_budget_to_the_tail():
+    # Five short lines fill the head's line budget with only 10 of its 50 bytes
+    output, truncated = capture(["a\n" * 5, "b" * 200])
+    assert truncated
+    head, tail = output.split("\n... [output truncated: 110 bytes, 0 lines omitted] ...\n")
+    assert head == "a\n" * 5
+    assert tail == "b" * 90
+
+
+def test_too_many_bytes_keeps_head_and_tail():
+    text = "".join(chr(ord('a') + i % 26) for i in range(300))
+    output, truncated = capture([text[i:i + 7] for i in range(0, 300, 7)])
+    assert truncated
+    head, tail = output.split("\n... [output truncated: 200 bytes, 0 lines omitted] ...\n")
+    assert head == text[:50]
+    assert tail == text[-50:]
+
+
+def test_too_many_lines_keeps_first_and_last_lines():
+    lines = [f"{i}\n" for i in range(100)]
+    output, truncated = capture(lines, max_bytes=10000)
+    assert truncated
+    head, tail = output.split(" lines omitted] ...\n")
+    assert head.startswith("".join(lines[:5]))
+    assert tail == "".join(lines[-5:])
+
+
+def test_multibyte_characters_are_not_split():
+    output, truncated = capture(["é" * 200])
+    assert truncated
+    assert "�" not in output
+    head, tail = output.split("\n... [")[0], output.split("] ...\n")[1]
+    assert len(head.encode('utf-8')) <= 50
+    assert len(tail.encode('utf-8')) <= 50
+
+
+def test_random_writes_match_whole_output_rules():
+    rng = random.Random(7)
+    for _ in range(500):
+        text = "".join(rng.choice("ab\né") for _ in range(rng.randint(0, 200)))
+        cuts = sorted(rng.sample(range(len(text) + 1), min(len(text) + 1, rng.randint(0, 8))))
+        chunks = [text[i:j] for i, j in zip([0, *cuts], [*cuts, len(text)])]
+        output, truncated = capture(chunks)
+        fits = len(text.encode('utf-8')) <= 100 and text.count('\n') <= 10
+        assert truncated == (not fits)
+        if fits:
+            assert output == text
+        else:
+            head, rest = output.split("\n... [output truncated: ", 1)
+            tail = rest.split("] ...\n", 1)[1]
+            assert text.startswith(head)
+            assert text.endswith(tail)
+            assert len(head.encode('utf-8')) + len(tail.encode('utf-8')) <= 100
+            assert head.count('\n') + tail.count('\n') <= 10
@@ -0,0 +1,66 @@
+import asyncio
+import random
+import shutil
+import pytest
+from app.services.artifact_cache import artifact_cache
+from app.services.code_executor import code_executor
+from app.services.execution_engine import execution_engine
+from app.services.precompiler import SpeculativeCompiler
+from app.services.single_flight import compile_flights, speculative_flights
+
+pytestmark = pytest.mark.skipif(shutil.which("gcc") is None, reason="needs gcc")
+
+
+def program():
+    # Unique, so the artifact cache cannot already hold it
+    return f'#include <stdio.h>\nint main(void) {{ printf("%d\\n", {random.getrandbits(30)}); return 0; }}\n'
+
+
+def test_execute_takes_over_a_running_speculative_compile(monkeypatch, tmp_path):
+    monkeypatch.setattr(artifact_cache, "root", str(tmp_path))
+    compiler = SpeculativeCompiler(enabled=True)
+    code = program()
+
+    async def scenario():
+        started = compile_flights.stats["started"]
+        cancelled = speculative_flights.stats["cancelled"]
+        compiler.schedule("c", code)
+        # Until the niced compiler is running
+        while not speculative_flights._flights:
+            await asyncio.sleep(0.001)
+        output, error, _, _ = await code_executor.execute("c", code, "")
+        await asyncio.gather(*compiler._pending.values())
+        preempted = speculative_flights.stats["cancelled"] - cancelled
+        return output, error, compile_flights.stats["started"] - started, preempted
+
+    output, error, compiles, preempted = asyncio.run(scenario())
+    assert error is None and output.strip().isdigit()
+    # Compiled again at normal priority rather than waiting on the niced compile
+    assert compiles == 1 and preempted == 1
+    assert compiler.stats["compiled"] == 0
+
+
+def test_execute_reuses_a_finished_speculative_compile(monkeypatch, tmp_path):
+    monkeypatch.setattr(artifact_cache, "root", str(tmp_path))
+    compiler = SpeculativeCompiler(enabled=True)
+    code = program()
+
+    async def scenario():
+        compiler.schedule("c", code)
+        await asyncio.gather(*compiler._pending.values())
+        started = compile_flights.stats["started"]
+        output, error, _, _ = await code_executor.execute("c", code, "")
+        return output, error, compile_flights.stats["started"] - started
+
+    output, error, compiles = asyncio.run(scenario())
+    assert error is None and output.strip().isdigit()
+    assert compiles == 0
+    assert compiler.stats["compiled"] == 1
+
+
+def test_speculative_compiles_are_shed_under_load(monkeypatch):
+    compiler = SpeculativeCompiler(enabled=True, max_load=0.5)
+    monkeypatch.setattr(execution_engine, "load", lambda: 2)
+    compiler.schedule("c", program())
+    compiler.schedule("python", "print(1)")
+    assert compiler.stats["shed"] == 1 and compiler.stats["scheduled"] == 0
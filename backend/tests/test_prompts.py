@@ -0,0 +1,40 @@
+import pytest
+from app.services.prompts import (
+    EditError, apply_edits, build_messages, code_from_reply, estimate_tokens, extract_code, parse_edits,
+)
+
+
+def test_extract_code_prefers_the_block_in_the_requested_language():
+    assert extract_code("```python\nprint(1)\n```") == "print(1)"
+    reply = "Install it:\n```bash\npip install x\n```\nThen:\n```py\nimport x\nx.run()\n```\nDone."
+    assert extract_code(reply, "python") == "import x\nx.run()"
+    # Unclosed fences (a cut-off reply) run to the end; no fence at all is plain code
+    assert extract_code("~~~js\nconsole.log(1)\n", "javascript") == "console.log(1)"
+    assert extract_code("  print(2)\n") == "print(2)"
+
+
+def test_edits_apply_exactly_or_by_indentation():
+    code = "def area(r):\n    return 3.14 * r * r\n\nprint(area(2))\n"
+    reply = (
+        "<<<<<<< SEARCH\n    return 3.14 * r * r\n=======\n    return math.pi * r * r\n>>>>>>> REPLACE\n"
+        "<<<<<<< SEARCH\ndef area(r):\n=======\nimport math\n\ndef area(r):\n>>>>>>> REPLACE\n"
+        # Indented differently from the file
+        "```\n<<<<<<< SEARCH\nreturn math.pi * r * r\n=======\nreturn math.pi * r ** 2\n>>>>>>> REPLACE\n```\n"
+    )
+    assert len(parse_edits(reply)) == 3
+    assert code_from_reply(reply, code) == "import math\n\ndef area(r):\n    return math.pi * r ** 2\n\nprint(area(2))\n"
+    with pytest.raises(EditError):
+        apply_edits(code, [("return r\n", "return 0\n")])
+
+
+def test_large_files_are_cut_to_the_relevant_regions_within_budget():
+    helpers = "\n\n".join(f"def helper_{i}(x):\n    return x + {i}\n" for i in range(400))
+    code = f"import sys\n\n{helpers}\n\ndef parse_config(path):\n    return open(path).read()\n"
+    messages = build_messages("make parse_config strip whitespace", "python", code, budget=600)
+    prompt = "".join(message["content"] for message in messages)
+    assert estimate_tokens(prompt) <= 600
+    assert "def parse_config(path):" in prompt
+    assert "lines not shown" in prompt
+    # Small files are sent whole
+    small = build_messages("rename x", "python", "x = 1\n", budget=600)[1]["content"]
+    assert "x = 1" in small and "not shown" not in small
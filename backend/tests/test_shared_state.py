@@ -0,0 +1,40 @@
+import asyncio
+import subprocess
+import sys
+from app.services.shared_state import SharedSlots
+
+
+def test_slots_are_counted_within_a_process(tmp_path):
+    slots = SharedSlots(str(tmp_path), "global", 2)
+    first, second = slots.try_acquire(), slots.try_acquire()
+    assert {first, second} == {0, 1}
+    assert slots.try_acquire() is None
+    slots.release(first)
+    assert slots.try_acquire() == first
+
+
+def test_slots_are_shared_between_processes(tmp_path):
+    slots = SharedSlots(str(tmp_path), "global", 1)
+    index = slots.try_acquire()
+    probe = (
+        "import sys; from app.services.shared_state import SharedSlots; "
+        f"print(SharedSlots({str(tmp_path)!r}, 'global', 1).try_acquire())"
+    )
+    run = lambda: subprocess.run([sys.executable, "-c", probe], capture_output=True, text=True).stdout.strip()
+    assert run() == "None"
+    slots.release(index)
+    assert run() == "0"
+
+
+def test_acquire_waits_for_a_release(tmp_path):
+    slots = SharedSlots(str(tmp_path), "lang-python", 1)
+
+    async def scenario():
+        index = await slots.acquire()
+        waiter = asyncio.ensure_future(slots.acquire())
+        await asyncio.sleep(0.02)
+        assert not waiter.done()
+        slots.release(index)
+        return await asyncio.wait_for(waiter, 1)
+
+    assert asyncio.run(scenario()) == 0
@@ -0,0 +1,84 @@
+import asyncio
+import shutil
+import time
+import pytest
+from app.services.artifact_cache import ArtifactCache, artifact_cache
+from app.services.code_executor import code_executor
+from app.services.execution_engine import execution_engine
+from app.services import syntax_check
+from app.services.languages import language_registry
+from app.services.node_pool import NodeWorkerPool
+from app.services.syntax_check import SyntaxChecker
+
+
+def test_python_errors_read_like_the_interpreter_and_valid_code_passes():
+    checker = SyntaxChecker(enabled=True)
+    spec = language_registry.get('python')
+
+    async def scenario():
+        if not await checker._toolchain_matches(spec):
+            pytest.skip("python toolchain is another Python version")
+        return (await checker.check(spec, "print(\n"), await checker.check(spec, "return 1\n"),
+                await checker.check(spec, 'print("\\d")\n'))
+
+    unclosed, misplaced, valid = asyncio.run(scenario())
+    assert unclosed.startswith('  File "main.py", line 1\n    print(\n')
+    assert unclosed.endswith("SyntaxError: '(' was never closed")
+    assert misplaced.endswith("SyntaxError: 'return' outside function")
+    assert valid is None
+    assert checker.stats == {"checked": 3, "rejected": 2}
+
+
+def test_compile_errors_are_remembered_in_order_of_use():
+    cache = ArtifactCache(max_bytes=1)
+    cache.max_errors = 2
+    for key in ("a", "b"):
+        cache.put_error(key, f"error {key}")
+    assert cache.get_error("a") == "error a"
+    cache.put_error("c", "error c")
+    assert cache.get_error("b") is None
+    assert cache.get_error("a") == "error a" and cache.get_error("c") == "error c"
+
+
+@pytest.mark.skipif(shutil.which("gcc") is None, reason="needs gcc")
+def test_resubmitted_broken_code_skips_the_compiler(monkeypatch, tmp_path):
+    monkeypatch.setattr(artifact_cache, "root", str(tmp_path))
+    code = f"int main(void) {{ return {time.time_ns()} }}\n"
+    spawned = []
+    stream = execution_engine.stream
+
+    def spy(cmd, *args, **kwargs):
+        spawned.append(cmd)
+        return stream(cmd, *args, **kwargs)
+
+    monkeypatch.setattr(execution_engine, "stream", spy)
+
+    async def scenario():
+        first = await code_executor.execute("c", code, "")
+        compiles = len(spawned)
+        second = await code_executor.execute("c", code, "")
+        return first, second, compiles
+
+    first, second, compiles = asyncio.run(scenario())
+    assert first[1].startswith("Compilation Error:") and second[1] == first[1]
+    assert compiles == 1 and len(spawned) == 1
+
+
+@pytest.mark.skipif(shutil.which("node") is None, reason="needs node")
+def test_javascript_errors_read_like_node_and_valid_code_passes(monkeypatch):
+    pool = NodeWorkerPool(size=1, max_jobs=10)
+    monkeypatch.setattr(syntax_check, "node_pool", pool)
+    checker = SyntaxChecker(enabled=True)
+    spec = language_registry.get('javascript')
+
+    async def scenario():
+        try:
+            return (await checker.check(spec, "let x = 1;\nlet x = 2;\n"),
+                    await checker.check(spec, "#!/usr/bin/env node\nreturn;\n"))
+        finally:
+            for worker in pool._idle:
+                worker.kill()
+
+    redeclared, valid = asyncio.run(scenario())
+    assert redeclared == "main.js:2\nlet x = 2;\n    ^\n\nSyntaxError: Identifier 'x' has already been declared"
+    assert valid is None
@@ -0,0 +1,59 @@
+import asyncio
+import shutil
+import pytest
+from app.services import node_pool as node_pool_module
+from app.services.node_pool import NodeWorkerPool
+from app.services.resource_limits import PRLIMIT, ResourceLimits
+
+pytestmark = pytest.mark.skipif(shutil.which("node") is None, reason="needs node")
+
+
+async def stop(pool):
+    for worker in pool._idle:
+        worker.kill()
+        await worker.proc.wait()
+
+
+def test_a_job_over_its_cpu_limit_is_stopped_and_its_worker_replaced(monkeypatch, tmp_path):
+    monkeypatch.setattr(node_pool_module, "RUN_LIMITS", ResourceLimits(cpu_seconds=1, file_size_mb=1))
+    pool = NodeWorkerPool(size=1, max_jobs=10)
+    spin = tmp_path / "spin.js"
+    spin.write_text("for (;;) {}\n")
+    hello = tmp_path / "hello.js"
+    hello.write_text("console.log('hi')\n")
+
+    async def scenario():
+        first = await pool.run(str(hello), "")
+        worker = pool._idle[0]
+        spun = await pool.run(str(spin), "", timeout=20)
+        after = await pool.run(str(hello), "")
+        await stop(pool)
+        return first, worker, spun, after
+
+    first, worker, spun, after = asyncio.run(scenario())
+    assert first.returncode == 0 and first.usage.cpu_time is not None
+    assert spun.usage.limit == "cpu_time"
+    assert spun.usage.wall_time < 10
+    assert not worker.alive
+    assert after.returncode == 0 and after.stdout.strip() == "hi"
+    assert pool._idle[0] is not worker
+
+
+@pytest.mark.skipif(PRLIMIT is None, reason="needs prlimit")
+def test_workers_start_under_limits_for_their_whole_life(tmp_path):
+    pool = NodeWorkerPool(size=2, max_jobs=10)
+    hello = tmp_path / "hello.js"
+    hello.write_text("console.log('hi')\n")
+
+    async def scenario():
+        await pool.run(str(hello), "")
+        with open(f"/proc/{pool._idle[0].proc.pid}/limits") as f:
+            limits = f.read()
+        await stop(pool)
+        return limits
+
+    limits = {line[:26].strip(): line[26:].split() for line in asyncio.run(scenario()).splitlines()[1:]}
+    expected = pool.worker_limits()
+    assert limits["Max cpu time"][1] == str(expected.cpu_seconds + 1)
+    assert limits["Max processes"][1] == str(expected.max_processes)
+    assert limits["Max file size"][1] == str(expected.file_size_mb << 20)
@@ -0,0 +1,63 @@
+import asyncio
+import os
+import sys
+from app.services.execution_engine import execution_engine
+from app.services.resource_limits import ResourceLimits
+from app.services.workspaces import WorkspacePool, disk_usage
+
+
+def test_released_workspaces_are_emptied_and_reused(tmp_path):
+    pool = WorkspacePool(base=str(tmp_path), size=1)
+    first = pool.acquire()
+    os.makedirs(os.path.join(first, "sub", "dir"))
+    with open(os.path.join(first, "main.py"), "w") as f:
+        f.write("print(1)")
+    os.chmod(first, 0o500)
+    second = pool.acquire()
+    pool.release(first)
+    assert pool.acquire() == first
+    assert os.listdir(first) == []
+    # Beyond the pool size, released workspaces are removed
+    pool.release(first)
+    pool.release(second)
+    assert not os.path.exists(second)
+    assert pool.stats == {"reused": 1, "created": 2, "overflow": 0}
+
+
+def test_full_filesystem_overflows_to_disk(tmp_path):
+    pool = WorkspacePool(base=str(tmp_path), max_bytes=1)
+    # As if tmp_path were a tmpfs holding more than max_bytes
+    pool.ram_backed = True
+    path = pool.acquire()
+    assert not path.startswith(str(tmp_path))
+    pool.release(path)
+    assert not os.path.exists(path)
+    assert pool.stats["overflow"] == 1
+
+
+def test_roots_of_dead_processes_are_removed(tmp_path):
+    stale = tmp_path / "regen-workspaces-999999999"
+    (stale / "1").mkdir(parents=True)
+    pool = WorkspacePool(base=str(tmp_path))
+    pool.release(pool.acquire())
+    assert not stale.exists()
+    assert os.path.basename(pool.root) == f"regen-workspaces-{os.getpid()}"
+
+
+def test_program_writing_past_its_workspace_cap_is_killed(tmp_path):
+    # Many small files: each stays far below RLIMIT_FSIZE
+    program = (
+        "import itertools\n"
+        "for i in itertools.count():\n"
+        "    with open(f'f{i}', 'wb') as f:\n"
+        "        f.write(b'x' * 65536)\n"
+    )
+    result = asyncio.run(execution_engine.run(
+        [sys.executable, "-c", program], timeout=10, cwd=str(tmp_path),
+        limits=ResourceLimits(file_size_mb=1, workspace_mb=2),
+    ))
+    assert result.returncode != 0
+    assert result.usage.limit == "workspace"
+    assert result.usage.wall_time < 5
+    # Overshoot is bounded by what the program writes in one check interval
+    assert disk_usage(str(tmp_path)) < 64 * 1024 * 1024